@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import numpy as np
+from classes.audio_engine import AudioEngine
+from classes.audio_sink import NullSink
+from classes.batch_renderer import BatchRenderer
+from classes.filter import Filter
+from classes.noise import NOISE_MODES, NoiseGenerator
+from classes.offline_renderer import OfflineRenderer
+from classes.sequencer import Sequencer
+from classes.sound_generator import SoundGenerator
+from classes.wave import Wave
+from classes.wave_generator import WaveGenerator, WaveTypes
+from config import BITRATE, BUFFER_SIZE
+from file_processing import load_wave_preset, load_envelope_preset, load_filter_preset, load_song, \
+    write_compiled_song, WAVE_TYPE_MAP, COMPILED_SONG_SUFFIX
+from util import frequency_from_note, notes
+
+# The directory holding the example presets and songs
+EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+
+# The presets compared by the wavetable benchmark, a single wave of each type and the example presets
+WAVETABLE_PRESETS = {
+    "sine": [Wave(WaveTypes.SINE, 1, 1, 0)],
+    "square": [Wave(WaveTypes.SQUARE, 1, 1, 0)],
+    "sawtooth": [Wave(WaveTypes.SAWTOOTH, 1, 1, 0)],
+    "triangle": [Wave(WaveTypes.TRIANGLE, 1, 1, 0)],
+    "bass": load_wave_preset(os.path.join(EXAMPLES_PATH, "bass.wave.pysynth")),
+    "lead": load_wave_preset(os.path.join(EXAMPLES_PATH, "lead.wave.pysynth")),
+}
+# The numbers of waves in the synthetic presets the wave generation is benchmarked with
+PRESET_SIZES = (1, 2, 4, 8)
+# The numbers of beats in the synthetic songs the song loading is benchmarked with
+SONG_SIZES = (1000, 10000, 100000, 1000000)
+# The number of beats in the synthetic song which is rendered in its entirety
+RENDER_BEATS = 1000
+# The frequencies of the notes the aliasing of the band-limited waves is measured at, whole numbers of Hz which do not
+# divide the sampling rate, so that every harmonic falls on a bin of a one second spectrum and no alias does
+ALIASING_FREQUENCIES = (440.0, 1499.0, 3001.0, 6007.0)
+# The number of beats in the synthetic song rendered by the startup benchmark, short enough that starting up dominates
+STARTUP_BEATS = 16
+# The wall time targets of starting main.py in seconds, from launching the interpreter until it exits,
+# for printing the help message and for rendering a short song to a WAV file
+STARTUP_TARGETS = {"help": 0.3, "render": 1.0}
+# A benchmark is reported as a regression when it became slower than this factor compared to a previous run
+REGRESSION_FACTOR = 1.1
+# Most bytes a renderer may retain per block in its steady state, beyond which the allocation check fails
+# (a little is allowed for the bookkeeping of the interpreter, a single block of samples is far larger)
+ALLOCATION_THRESHOLD = 64
+# Most bytes a renderer may allocate at once while rendering a single block, even if it frees them again, beyond which
+# the allocation check fails (the views and scalars of a block take a few hundred bytes, any temporary array
+# of samples takes kilobytes)
+ALLOCATION_PEAK_THRESHOLD = 4096
+
+
+def time_per_call(function, repeat: int = 5, number: int = 200) -> float:
+    """
+    Measures the time a single call of the given function takes
+    :param function: The function to measure
+    :param repeat: How many times the measurement is repeated, the fastest one is kept
+    :param number: How many calls each measurement consists of
+    :return: The time of a single call in seconds
+    """
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+
+def record(results: dict, name: str, seconds: float, samples: int | None = None) -> dict:
+    """
+    Records the result of a benchmark
+    :param results: The dict the results of the run are collected in
+    :param name: The name of the benchmark
+    :param seconds: The time a single run of the benchmark took
+    :param samples: The number of samples a single run of the benchmark rendered, if it renders audio
+    :return: The recorded result
+    """
+    result = {"seconds": seconds}
+    if samples is not None:
+        # Throughput, and how many times faster than real time the samples were rendered
+        result["samples_per_second"] = samples / seconds
+        result["realtime_factor"] = samples / BITRATE / seconds
+    results[name] = result
+    return result
+
+
+def synthetic_preset(wave_type: WaveTypes, size: int) -> [Wave]:
+    """
+    Creates a synthetic wave preset
+    :param wave_type: The type of every wave of the preset
+    :param size: The number of waves of the preset
+    :return: A wave preset of the given number of harmonics of the given type
+    """
+    return [Wave(wave_type, i + 1, 1 / (i + 1), 0) for i in range(size)]
+
+
+def write_synthetic_preset(path: str, size: int, seed: int = 0):
+    """
+    Writes a synthetic .wave.pysynth file of randomly chosen harmonics
+    :param path: The path to write the preset to
+    :param size: The number of waves of the preset
+    :param seed: The seed of the random choices, so that the same preset is written every run
+    :return: None
+    """
+    generator = random.Random(seed)
+    with open(path, "w") as file:
+        file.write("$ Synthetic preset written by benchmark.py\n")
+        for i in range(size):
+            file.write(f"{generator.choice(list(WAVE_TYPE_MAP))} {i + 1} {1 / (i + 1)} {generator.random():.3f}\n")
+
+
+def write_synthetic_song(path: str, beats: int, wave_path: str, envelope_path: str, bpm: int = 120, seed: int = 0):
+    """
+    Writes a synthetic .song.pysynth file of randomly chosen notes, chords and pauses
+    :param path: The path to write the song to
+    :param beats: The number of beats of the song
+    :param wave_path: The absolute path of the wave preset of the song
+    :param envelope_path: The absolute path of the envelope preset of the song
+    :param bpm: The beats per minute measure of the song
+    :param seed: The seed of the random choices, so that the same song is written every run
+    :return: None
+    """
+    generator = random.Random(seed)
+    note_names = list(notes)
+    durations = [0.25, 0.5, 1.0, 2.0]
+    with open(path, "w") as file:
+        file.write(f"Synthetic Song ({beats} beats)\n")
+        file.write(f"1 {bpm}\n2 {wave_path}\n3 {envelope_path}\n---\n")
+        lines = []
+        for _ in range(beats):
+            if generator.random() < 0.1:
+                # Roughly every tenth beat is a pause
+                lines.append(f"0 {generator.choice(durations)}")
+            else:
+                # Every other beat is a chord of one to three notes
+                chord = [f"{generator.choice(note_names)}{generator.randint(2, 6)}:{generator.choice(durations)}"
+                         for _ in range(generator.randint(1, 3))]
+                lines.append(f"{len(chord)} {' '.join(chord)}")
+        file.write("\n".join(lines))
+
+
+def benchmark_generate_wave(results: dict):
+    """
+    Compares generating a block directly against generating it from the wavetable,
+    for every wave type at every preset size
+    :param results: The dict the results of the run are collected in
+    :return: None
+    """
+    # A block of the same size the engine renders, some time into a note
+    time_values = 1.5 + np.arange(BUFFER_SIZE) / BITRATE
+    print(f"{'preset':<20} {'direct':>12} {'wavetable':>12} {'speedup':>8}")
+    for wave_type in WaveTypes:
+        for size in PRESET_SIZES:
+            preset = synthetic_preset(wave_type, size)
+            direct = WaveGenerator(preset, 440.0, use_wavetable=False)
+            table = WaveGenerator(preset, 440.0, use_wavetable=True)
+            direct_time = time_per_call(lambda: direct.generate_wave(time_values))
+            table_time = time_per_call(lambda: table.generate_wave(time_values))
+            name = f"{wave_type.name.lower()}x{size}"
+            record(results, f"generate_wave/{name}/direct", direct_time, BUFFER_SIZE)
+            record(results, f"generate_wave/{name}/wavetable", table_time, BUFFER_SIZE)
+            print(f"{name:<20} {direct_time * 1e6:>10.1f}us {table_time * 1e6:>10.1f}us "
+                  f"{direct_time / table_time:>7.1f}x")
+
+
+def benchmark_wavetable(results: dict):
+    """
+    Compares rendering a block directly against rendering it from the wavetable, for every preset
+    :param results: The dict the results of the run are collected in
+    :return: None
+    """
+    # A block of the same size the engine renders, some time into a note
+    time_values = 1.5 + np.arange(BUFFER_SIZE) / BITRATE
+    print(f"{'preset':<10} {'direct':>12} {'wavetable':>12} {'speedup':>8} {'max error':>10}")
+    for name, preset in WAVETABLE_PRESETS.items():
+        direct = WaveGenerator(preset, 440.0, use_wavetable=False)
+        table = WaveGenerator(preset, 440.0, use_wavetable=True)
+        direct_time = time_per_call(lambda: direct.generate_wave(time_values))
+        table_time = time_per_call(lambda: table.generate_wave(time_values))
+        error = np.max(np.abs(direct.generate_wave(time_values) - table.generate_wave(time_values)))
+        record(results, f"wavetable/{name}/direct", direct_time, BUFFER_SIZE)
+        record(results, f"wavetable/{name}/wavetable", table_time, BUFFER_SIZE)["max_error"] = float(error)
+        print(f"{name:<10} {direct_time * 1e6:>10.1f}us {table_time * 1e6:>10.1f}us "
+              f"{direct_time / table_time:>7.1f}x {error:>10.4f}")
+
+
+def aliasing(samples: np.ndarray, frequency: float) -> float:
+    """
+    Measures the aliasing of one second of a wave, as the power outside its harmonics relative to the power within them
+    :param samples: One second of samples of the wave
+    :param frequency: The frequency of the wave, a whole number of Hz
+    :return: The power of the aliases relative to the harmonics in dB
+    """
+    power = np.abs(np.fft.rfft(samples)) ** 2
+    harmonics = np.arange(len(power)) % int(frequency) == 0
+    return float(10 * np.log10(np.sum(power[~harmonics]) / np.sum(power[harmonics])))
+
+
+def benchmark_band_limited(results: dict):
+    """
+    Compares generating the square, sawtooth and triangle waves naively against generating them band-limited,
+    both in the time it takes to generate a block and in the aliasing of the generated waves
+    :param results: The dict the results of the run are collected in
+    :return: None
+    """
+    # A block of the same size the engine renders, some time into a note
+    x = 2 * np.pi * 440.0 * (1.5 + np.arange(BUFFER_SIZE) / BITRATE)
+    dx = 2 * np.pi * 440.0 / BITRATE
+    print(f"{'wave':<10} {'naive':>12} {'band-limited':>13} {'cost':>6}")
+    for wave_type in (WaveTypes.SQUARE, WaveTypes.SAWTOOTH, WaveTypes.TRIANGLE):
+        wave = Wave(wave_type, 1, 1, 0)
+        naive_time = time_per_call(lambda: wave.evaluate(x))
+        limited_time = time_per_call(lambda: wave.evaluate(x, dx))
+        name = wave_type.name.lower()
+        record(results, f"band_limited/{name}/naive", naive_time, BUFFER_SIZE)
+        record(results, f"band_limited/{name}/band_limited", limited_time, BUFFER_SIZE)
+        print(f"{name:<10} {naive_time * 1e6:>10.1f}us {limited_time * 1e6:>11.1f}us {limited_time / naive_time:>5.1f}x")
+    # One second of every wave, so that every harmonic falls on a bin of the spectrum
+    print(f"{'wave':<20} {'naive':>8} {'direct':>8} {'wavetable':>10}")
+    for wave_type in (WaveTypes.SQUARE, WaveTypes.SAWTOOTH, WaveTypes.TRIANGLE):
+        wave = Wave(wave_type, 1, 1, 0)
+        for frequency in ALIASING_FREQUENCIES:
+            naive = aliasing(wave.evaluate(2 * np.pi * frequency * np.arange(BITRATE) / BITRATE), frequency)
+            direct = aliasing(WaveGenerator([wave], frequency, use_wavetable=False).generate_block(BITRATE), frequency)
+            table = aliasing(WaveGenerator([wave], frequency, use_wavetable=True).generate_block(BITRATE), frequency)
+            name = f"{wave_type.name.lower()}@{frequency:.0f}Hz"
+            results[f"aliasing/{name}"] = {"naive_db": naive, "direct_db": direct, "wavetable_db": table}
+            print(f"{name:<20} {naive:>6.1f}dB {direct:>6.1f}dB {table:>8.1f}dB")
+
+
+def benchmark_sound_generator(results: dict):
+    """
+    Measures rendering a single block of a voice, including its envelope
+    :param results: The dict the results of the run are collected in
+    :return: None
+    """
+    voice = SoundGenerator(load_envelope_preset(os.path.join(EXAMPLES_PATH, "lead_envelope.envelope.pysynth")),
+                           WaveGenerator(WAVETABLE_PRESETS["lead"], 440.0))
+    block_time = time_per_call(voice.generate_block, number=1000)
+    result = record(results, "sound_generator/block", block_time, BUFFER_SIZE)
+    print(f"SoundGenerator block: {block_time * 1e6:.1f}us ({result['realtime_factor']:.1f}x realtime)")
+
+
+def benchmark_allocations(results: dict, blocks: int = 1000) -> bool:
+    """
+    Measures the memory allocated while a voice, and a batch of voices, render blocks in their steady state,
+    which should be none, both the memory retained over all of the blocks, and the most memory allocated at once
+    while rendering any single block, which catches temporaries that are freed again
+    :param results: The dict the results of the run are collected in
+    :param blocks: The number of blocks to render while measuring
+    :return: Whether neither retained more than ALLOCATION_THRESHOLD bytes per block, nor allocated more than
+        ALLOCATION_PEAK_THRESHOLD bytes at once within a block
+    """
+    envelope = load_envelope_preset(os.path.join(EXAMPLES_PATH, "lead_envelope.envelope.pysynth"))
+    voice = SoundGenerator(envelope, WaveGenerator(WAVETABLE_PRESETS["lead"], 440.0))
+    voices = [SoundGenerator(envelope, WaveGenerator(WAVETABLE_PRESETS["lead"], 233.0 * 2 ** (i / 1200)))
+              for i in range(8)]
+    renderer = BatchRenderer()
+    out = np.zeros(BUFFER_SIZE, dtype=np.float32)
+    passed = True
+    results["allocations"] = {}
+    for name, render in [("voice", lambda: voice.generate_block()),
+                         ("batch", lambda: renderer.render(voices, BUFFER_SIZE, out))]:
+        # Render a few blocks first, so that the lazily computed tables and buffers are not counted
+        for _ in range(10):
+            render()
+        tracemalloc.start()
+        start, _ = tracemalloc.get_traced_memory()
+        peak = 0
+        for _ in range(blocks):
+            # The peak is measured from the start of every block, so that it is the memory allocated within the block
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            render()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        end, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        retained = (end - start) / blocks
+        results["allocations"][name] = {"retained_bytes": end - start, "block_peak_bytes": peak}
+        ok = retained <= ALLOCATION_THRESHOLD and peak <= ALLOCATION_PEAK_THRESHOLD
+        print(f"Allocations while rendering {blocks} blocks ({name}): {end - start} bytes retained, "
+              f"at most {peak} bytes at once within a block (a single block of samples is {BUFFER_SIZE * 4} bytes) - "
+              f"{'ok' if ok else 'FAILED'}")
+        passed = passed and ok
+    return passed
+
+
+def benchmark_batch(results: dict, voice_counts=(1, 4, 16, 32)):
+    """
+    Compares rendering voices one by one against rendering them as a single batch
+    :param results: The dict the results of the run are collected in
+    :param voice_counts: The numbers of simultaneous voices to compare
+    :return: None
+    """
+    envelope = load_envelope_preset(os.path.join(EXAMPLES_PATH, "lead_envelope.envelope.pysynth"))
+    renderer = BatchRenderer()
+    out = np.zeros(BUFFER_SIZE, dtype=np.float32)
+    print(f"{'voices':<10} {'one by one':>12} {'batched':>12} {'speedup':>8}")
+    for count in voice_counts:
+        # Voices detuned by a cent each, so that all of them share the band, and thus the wavetable, of the lead preset
+        voices = [SoundGenerator(envelope, WaveGenerator(WAVETABLE_PRESETS["lead"], 233.0 * 2 ** (i / 1200)))
+                  for i in range(count)]
+
+        def one_by_one():
+            for voice in voices:
+                out[:] += voice.generate_block()
+
+        separate_time = time_per_call(one_by_one, number=50)
+        batch_time = time_per_call(lambda: renderer.render(voices, BUFFER_SIZE, out), number=50)
+        # Every voice renders a block, so the throughput counts the samples of all of them
+        record(results, f"batch/{count}/separate", separate_time, BUFFER_SIZE * count)
+        record(results, f"batch/{count}/batched", batch_time, BUFFER_SIZE * count)
+        print(f"{count:<10} {separate_time * 1e6:>10.1f}us {batch_time * 1e6:>10.1f}us "
+              f"{separate_time / batch_time:>7.1f}x")
+
+
+def benchmark_filter(results: dict, voice_count: int = 16):
+    """
+    Measures the cost of filtering voices, one by one and batched, with a fixed cutoff and one following the envelope
+    :param results: The dict the results of the run are collected in
+    :param voice_count: The number of simultaneous voices
+    :return: None
+    """
+    envelope = load_envelope_preset(os.path.join(EXAMPLES_PATH, "lead_envelope.envelope.pysynth"))
+    following = load_filter_preset(os.path.join(EXAMPLES_PATH, "lead_filter.filter.pysynth"))
+    fixed = Filter(following.filter_type, following.cutoff, following.resonance)
+    renderer = BatchRenderer()
+    out = np.zeros(BUFFER_SIZE, dtype=np.float32)
+    print(f"{'filter':<10} {'one by one':>12} {'batched':>12}")
+    for name, sound_filter in [("none", None), ("fixed", fixed), ("envelope", following)]:
+        voices = [SoundGenerator(envelope, WaveGenerator(WAVETABLE_PRESETS["lead"], 233.0 * 2 ** (i / 1200)),
+                                 sound_filter=sound_filter) for i in range(voice_count)]
+
+        def one_by_one():
+            for voice in voices:
+                out[:] += voice.generate_block()
+
+        separate_time = time_per_call(one_by_one, number=50)
+        batch_time = time_per_call(lambda: renderer.render(voices, BUFFER_SIZE, out), number=50)
+        record(results, f"filter/{name}/separate", separate_time, BUFFER_SIZE * voice_count)
+        record(results, f"filter/{name}/batched", batch_time, BUFFER_SIZE * voice_count)
+        print(f"{name:<10} {separate_time * 1e6:>10.1f}us {batch_time * 1e6:>10.1f}us")
+
+
+def benchmark_noise(results: dict):
+    """
+    Compares rendering noise waves in every noise mode against rendering a sine wave from its wavetable
+    :param results: The dict the results of the run are collected in
+    :return: None
+    """
+    out = np.empty(BUFFER_SIZE)
+    sine = WaveGenerator([Wave(WaveTypes.SINE, 1, 1, 0)], 440.0)
+    sine_time = time_per_call(lambda: sine.generate_block(BUFFER_SIZE, out))
+    record(results, "noise/sine", sine_time, BUFFER_SIZE)
+    print(f"{'sine':<24} {sine_time * 1e6:>8.1f}us")
+    for wave_type in [WaveTypes.WHITE_NOISE, WaveTypes.PINK_NOISE]:
+        for mode in NOISE_MODES:
+            generator = NoiseGenerator(wave_type, mode)
+            noise_time = time_per_call(lambda: generator.generate_block(BUFFER_SIZE))
+            record(results, f"noise/{wave_type.value}/{mode}", noise_time, BUFFER_SIZE)
+            print(f"{wave_type.value + ' (' + mode + ')':<24} {noise_time * 1e6:>8.1f}us "
+                  f"{noise_time / sine_time:>6.2f}x sine")
+
+
+def benchmark_frequency_from_note(results: dict):
+    """
+    Measures converting a note into its frequency
+    :param results: The dict the results of the run are collected in
+    :return: None
+    """
+    call_time = time_per_call(lambda: frequency_from_note("C#4"), number=10000)
+    record(results, "frequency_from_note", call_time)
+    print(f"frequency_from_note: {call_time * 1e9:.0f}ns")
+
+
+def benchmark_load_song(results: dict, directory: str, sizes=SONG_SIZES):
+    """
+    Measures loading synthetic songs of increasing length
+    :param results: The dict the results of the run are collected in
+    :param directory: The directory the synthetic files are written to
+    :param sizes: The numbers of beats of the synthetic songs
+    :return: None
+    """
+    wave_path = os.path.join(directory, "synthetic.wave.pysynth")
+    write_synthetic_preset(wave_path, 4)
+    envelope_path = os.path.join(EXAMPLES_PATH, "basic_envelope.envelope.pysynth")
+    print(f"{'beats':<10} {'load_song':>12} {'per beat':>12}")
+    for beats in sizes:
+        song_path = os.path.join(directory, f"synthetic_{beats}.song.pysynth")
+        write_synthetic_song(song_path, beats, wave_path, envelope_path)
+        # Large songs take seconds to load, so they are only loaded once
+        load_time = time_per_call(lambda: load_song(song_path), repeat=3 if beats <= 10000 else 1, number=1)
+        record(results, f"load_song/{beats}", load_time)["beats_per_second"] = beats / load_time
+        print(f"{beats:<10} {load_time * 1e3:>10.1f}ms {load_time / beats * 1e6:>10.2f}us")
+
+
+def benchmark_compile(results: dict, directory: str, beats: int = RENDER_BEATS) -> bool:
+    """
+    Measures compiling a synthetic song twice in a row, the second time after loading it from its own compiled file,
+    which is then being memory mapped while it is rewritten, and checks that the song survives both unchanged
+    :param results: The dict the results of the run are collected in
+    :param directory: The directory the synthetic files are written to
+    :param beats: The number of beats of the synthetic song
+    :return: Whether the recompiled song holds the same events as the parsed one
+    """
+    wave_path = os.path.join(directory, "synthetic.wave.pysynth")
+    write_synthetic_preset(wave_path, 4)
+    envelope_path = os.path.join(EXAMPLES_PATH, "basic_envelope.envelope.pysynth")
+    song_path = os.path.join(directory, f"compiled_{beats}.song.pysynth")
+    write_synthetic_song(song_path, beats, wave_path, envelope_path)
+    compiled_path = song_path + COMPILED_SONG_SUFFIX
+    events = load_song(song_path).get_events().copy()
+    times = []
+    for _ in range(2):
+        # The first run compiles the parsed song, the second one the song loaded from the compiled file
+        song = load_song(song_path)
+        start = time.perf_counter()
+        write_compiled_song(song, compiled_path, song_path)
+        times.append(time.perf_counter() - start)
+    passed = np.array_equal(load_song(song_path).get_events(), events)
+    record(results, "compile", min(times))
+    print(f"Compiling a song of {beats} beats: {min(times) * 1e3:.1f}ms, "
+          f"recompiled from its compiled file - {'ok' if passed else 'FAILED'}")
+    return passed
+
+
+def benchmark_render(results: dict, directory: str, beats: int = RENDER_BEATS):
+    """
+    Measures rendering entire songs offline, the example song and a synthetic song
+    :param results: The dict the results of the run are collected in
+    :param directory: The directory the synthetic files are written to
+    :param beats: The number of beats of the synthetic song
+    :return: None
+    """
+    wave_path = os.path.join(directory, "synthetic.wave.pysynth")
+    write_synthetic_preset(wave_path, 4)
+    song_path = os.path.join(directory, "synthetic_render.song.pysynth")
+    write_synthetic_song(song_path, beats, wave_path, os.path.join(EXAMPLES_PATH, "basic_envelope.envelope.pysynth"))
+    songs = {"example_song": os.path.join(EXAMPLES_PATH, "example_song.song.pysynth"),
+             f"synthetic_{beats}": song_path}
+    print(f"{'song':<20} {'duration':>10} {'render':>10} {'realtime':>10}")
+    for name, path in songs.items():
+        renderer = OfflineRenderer(load_song(path))
+        start = time.perf_counter()
+        samples = renderer.render()
+        render_time = time.perf_counter() - start
+        result = record(results, f"render/{name}", render_time, len(samples))
+        print(f"{name:<20} {len(samples) / BITRATE:>9.1f}s {render_time:>9.2f}s {result['realtime_factor']:>9.1f}x")
+
+
+def benchmark_engine(results: dict):
+    """
+    Measures the throughput of the audio engine thread playing the example song to a null sink,
+    which renders as fast as it can instead of in real time
+    :param results: The dict the results of the run are collected in
+    :return: None
+    """
+    song = load_song(os.path.join(EXAMPLES_PATH, "example_song.song.pysynth"))
+    sink = NullSink()
+    engine = AudioEngine(sink)
+    sequencer = Sequencer(song)
+    sequencer.prepare()
+    engine.add_sequencer(sequencer)
+    start_time = time.perf_counter()
+    engine.start()
+    while not engine.is_idle():
+        time.sleep(0.001)
+    play_time = time.perf_counter() - start_time
+    engine.kill()
+    engine.join()
+    result = record(results, "engine/example_song", play_time, sink.samples)
+    print(f"Engine playing example_song to a null sink: {sink.samples / BITRATE:.2f}s of audio in {play_time:.2f}s "
+          f"({result['realtime_factor']:.1f}x realtime)")
+
+
+def benchmark_startup(results: dict, directory: str, repeat: int = 5):
+    """
+    Measures how long main.py takes to start, by running it in a new interpreter to print the help message
+    and to render a short song, and compares the times to STARTUP_TARGETS
+    :param results: The dict the results of the run are collected in
+    :param directory: The directory the synthetic files are written to
+    :param repeat: How many times each mode is run, the fastest run is kept
+    :return: None
+    """
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    wave_path = os.path.join(directory, "synthetic.wave.pysynth")
+    write_synthetic_preset(wave_path, 4)
+    song_path = os.path.join(directory, "synthetic_startup.song.pysynth")
+    write_synthetic_song(song_path, STARTUP_BEATS, wave_path,
+                         os.path.join(EXAMPLES_PATH, "basic_envelope.envelope.pysynth"))
+    modes = {"help": ["--help"],
+             "render": ["-s", song_path, "-r", os.path.join(directory, "synthetic_startup.wav")]}
+    print(f"{'mode':<10} {'startup':>10} {'target':>10}")
+    for mode, arguments in modes.items():
+        def run():
+            subprocess.run([sys.executable, main_path] + arguments, check=True, stdout=subprocess.DEVNULL)
+
+        startup_time = time_per_call(run, repeat=repeat, number=1)
+        result = record(results, f"startup/{mode}", startup_time)
+        result["target"] = STARTUP_TARGETS[mode]
+        flag = "" if startup_time <= STARTUP_TARGETS[mode] else " missed"
+        print(f"{mode:<10} {startup_time * 1e3:>8.0f}ms {STARTUP_TARGETS[mode] * 1e3:>8.0f}ms{flag}")
+
+
+def compare(results: dict, baseline: dict):
+    """
+    Compares the results of this run against the results of a previous run
+    :param results: The results of this run
+    :param baseline: The results of the previous run, as written by --json
+    :return: None
+    """
+    print(f"{'benchmark':<40} {'before':>12} {'after':>12} {'change':>8}")
+    for name, result in results.items():
+        if "seconds" not in result or name not in baseline or "seconds" not in baseline[name]:
+            # Only benchmarks which were timed in both runs can be compared
+            continue
+        change = result["seconds"] / baseline[name]["seconds"]
+        flag = " regression" if change > REGRESSION_FACTOR else ""
+        print(f"{name:<40} {baseline[name]['seconds'] * 1e6:>10.1f}us {result['seconds'] * 1e6:>10.1f}us "
+              f"{change:>7.2f}x{flag}")
+
+
+def print_help():
+    """
+    Prints the help message
+    :return: None
+    """
+    print(f"Usage: {sys.argv[0]} [arguments]")
+    print()
+    print("  -q, --quick: Skips the largest synthetic songs")
+    print("  -o, --json: Path to a JSON file to write the results to")
+    print("  -c, --compare: Path to a JSON file of a previous run to compare the results against")
+    print("  -h, --help: Prints this help message")
+
+
+if __name__ == "__main__":
+    arguments = sys.argv
+    song_sizes = SONG_SIZES
+    json_path = None
+    compare_path = None
+    for i in range(len(arguments)):
+        # Iterate through the arguments
+        if arguments[i] in ["-q", "--quick"]:
+            song_sizes = tuple(size for size in SONG_SIZES if size <= 10000)
+        elif arguments[i] in ["-o", "--json"]:
+            json_path = arguments[i + 1]
+        elif arguments[i] in ["-c", "--compare"]:
+            compare_path = arguments[i + 1]
+        elif arguments[i] in ["-h", "--help"]:
+            print_help()
+            sys.exit(0)
+    results = {}
+    # The synthetic presets and songs are written to a temporary directory, which is removed afterwards
+    with tempfile.TemporaryDirectory() as synthetic_directory:
+        benchmark_generate_wave(results)
+        benchmark_wavetable(results)
+        benchmark_band_limited(results)
+        benchmark_sound_generator(results)
+        allocations_passed = benchmark_allocations(results)
+        benchmark_batch(results)
+        benchmark_filter(results)
+        benchmark_noise(results)
+        benchmark_frequency_from_note(results)
+        benchmark_load_song(results, synthetic_directory, song_sizes)
+        compile_passed = benchmark_compile(results, synthetic_directory)
+        benchmark_render(results, synthetic_directory)
+        benchmark_engine(results)
+        benchmark_startup(results, synthetic_directory)
+    if json_path is not None:
+        with open(json_path, "w") as file:
+            json.dump(results, file, indent=4)
+    if compare_path is not None:
+        with open(compare_path, "r") as file:
+            compare(results, json.load(file))
+    if not allocations_passed:
+        # Rendering allocates memory on every block again, fail the run so that the regression is noticed
+        print(f"Allocation check failed: more than {ALLOCATION_THRESHOLD} bytes retained per block, or more than "
+              f"{ALLOCATION_PEAK_THRESHOLD} bytes allocated at once within a block")
+        sys.exit(1)
+    if not compile_passed:
+        # Recompiling a song from its own compiled file lost its events
+        print("Compile check failed: the recompiled song does not match its source")
+        sys.exit(1)
@@ -0,0 +1,394 @@
+import threading
+import time
+import numpy as np
+from classes.audio_sink import AudioSink, create_audio_sink
+from classes.batch_renderer import BatchRenderer
+from classes.block_size_controller import BlockSizeController
+from classes.performance_monitor import PerformanceMonitor
+from classes.ring_buffer import RingBuffer
+from classes.sound_generator import SoundGenerator
+from classes.voice_pool import VoicePool
+from config import BITRATE, BUFFER_SIZE, BATCH_VOICES, RING_BUFFER_BLOCKS, RING_BUFFER_PREFILL, ADAPTIVE_BUFFER_SIZE, \
+    MAX_BUFFER_SIZE
+
+
+class AudioEngine(threading.Thread):
+    """
+    A class representing the audio engine (a single thread owning the one output stream of the program)
+
+    Every block is written to the audio sink of the engine, which is the speaker unless configured otherwise.
+    Sinks which do not play in real time only receive blocks while the engine has something to play,
+    so that they do not fill up with silence
+
+    Rendering and playing are decoupled: the engine thread renders blocks into a ring buffer, up to
+    RING_BUFFER_BLOCKS ahead, while an output thread writes them to the sink, so that a hiccup of the render thread
+    is absorbed by the blocks rendered ahead instead of becoming a gap. A real time sink starts playing once
+    RING_BUFFER_PREFILL blocks were rendered ahead, and waits for them again whenever it ran dry. A thread waiting for
+    the other one is woken up as soon as it can go on. A sink which is not real time has no deadlines, so there is
+    nothing to decouple, and the engine thread writes every block to it as soon as it was rendered
+
+    If ADAPTIVE_BUFFER_SIZE is set in config.py, the block size of an engine playing to a real time sink is tuned
+    by a BlockSizeController while it plays
+
+    Notes are played on voices (SoundGenerator objects) taken from the voice pool of the engine, which sums all of
+    the active voices into a single block and writes it to the speaker. Voices which have finished are returned
+    to the pool. Voices created elsewhere may also be submitted, these are discarded once they have finished.
+    Sequencers are advanced once per block, and the voices they trigger start at their exact sample within the block.
+
+    Attributes
+    ----------
+    fs : int
+        The sampling rate of the engine, read from config.py
+    block_size : int
+        The block size of the engine, read from config.py, changed while playing in the adaptive mode
+    voices : [SoundGenerator]
+        The list of currently active submitted voices
+    pool : VoicePool
+        The preallocated voices every note is played on
+    sequencers : [Sequencer]
+        The list of currently running sequencers
+    batch_renderer : BatchRenderer
+        The renderer of voices sharing a wave preset, an envelope and a filter, if BATCH_VOICES is set in config.py
+    lock : threading.Lock
+        The lock guarding the voices and sequencers, as notes are played from other threads
+    active : bool
+        Whether the engine thread is active
+    performance : PerformanceMonitor
+        The monitor recording how long every block takes to render
+    sink : AudioSink
+        The sink every block is written to
+    ring : RingBuffer
+        The blocks rendered ahead of the sink
+    prefill : int
+        The number of blocks rendered ahead before a real time sink starts playing
+    output : threading.Thread
+        The thread writing the blocks of the ring buffer to the sink, None until the engine is started,
+        and for a sink which is not real time
+    controller : BlockSizeController
+        The controller tuning the block size, None unless the engine plays in the adaptive mode
+    position : int
+        The number of samples rendered so far, the noise of a note played live is seeded with the sample it starts at
+    pending : threading.Event
+        Set whenever the engine is given something to play, an idle engine of a sink which is not real time waits on it
+
+    Methods
+    -------
+    run()
+        The main loop of the engine
+    play(envelope, wave_types, frequency, length, delay, sound_filter)
+        Plays a note on a voice of the pool
+    release(note)
+        Releases a note played on a voice of the pool
+    is_playing(note)
+        Returns whether a note played on a voice of the pool is still playing
+    submit(voice, delay)
+        Adds a voice to the set of active voices
+    add_sequencer(sequencer)
+        Adds a sequencer to be advanced along with the engine
+    render_block(out)
+        Mixes all of the active voices into a single block
+    set_block_size(block_size)
+        Changes the block size of the engine
+    is_idle()
+        Returns whether there are no active voices
+    get_performance()
+        Returns the render time statistics of the engine
+    kill()
+        Kills the engine thread
+    """
+
+    def __init__(self, sink: AudioSink | None = None):
+        """
+        Constructs the object
+        :param sink: The sink to write every block to, the sink selected in config.py if unspecified
+        """
+        # Both of these will be read from config.py
+        self.fs = BITRATE
+        self.block_size = BUFFER_SIZE
+        # The engine starts out with no voices
+        self.voices = []
+        self.sequencers = []
+        self.pool = VoicePool()
+        self.batch_renderer = BatchRenderer()
+        self.lock = threading.Lock()
+        # The engine starts out active
+        self.active = True
+        self.performance = PerformanceMonitor(self.block_size)
+        self.sink = create_audio_sink() if sink is None else sink
+        # In the adaptive mode, the ring buffer can hold blocks of the largest block size
+        self.ring = RingBuffer(RING_BUFFER_BLOCKS,
+                               max(MAX_BUFFER_SIZE, self.block_size) if ADAPTIVE_BUFFER_SIZE else self.block_size)
+        self.prefill = min(max(RING_BUFFER_PREFILL, 1), RING_BUFFER_BLOCKS)
+        self.output = None
+        self.controller = None
+        self.pending = threading.Event()
+        self.position = 0
+        # The engine is a daemon thread, so it does not keep the program alive on its own
+        super().__init__(daemon=True)
+
+    def run(self):
+        """
+        The main loop of the engine, renders blocks into the ring buffer while the output thread plays them
+        :return: None
+        """
+        if not self.sink.realtime:
+            self.__write()
+            return
+        if ADAPTIVE_BUFFER_SIZE:
+            # Only a real time sink has deadlines to tune the block size to
+            self.controller = BlockSizeController(self.block_size)
+        self.output = threading.Thread(target=self.__play, daemon=True)
+        self.output.start()
+        while self.active:
+            # The threads wake each other up as soon as a block is committed or released, the timeouts only
+            # make sure that a thread notices that the engine was killed
+            if self.ring.space() == 0:
+                # The renderer is as far ahead as it may be, wait for the output thread to play a block
+                self.ring.wait_for_space(self.block_size / self.fs)
+            else:
+                # Mix the block straight into the ring buffer, silence is rendered if there are no voices
+                # The controller is given the CPU time of the block, as the time the thread was kept waiting
+                # (by the scheduler, or for the GIL) is not spent rendering, and a larger block does not help against it
+                start_time = time.thread_time()
+                self.render_block(self.ring.write_block(self.block_size))
+                self.ring.commit()
+                if self.controller is not None:
+                    # Let the controller decide on the size of the next block
+                    block_size = self.controller.record(time.thread_time() - start_time, self.ring.underruns)
+                    if block_size != self.block_size:
+                        self.set_block_size(block_size)
+        # Let the output thread play the blocks rendered so far, it closes the sink afterwards
+        self.output.join()
+
+    def __write(self):
+        """
+        The main loop of an engine whose sink is not real time, renders every block and writes it to the sink right away
+        :return: None
+        """
+        with self.sink:
+            while self.active:
+                if self.is_idle():
+                    # Nothing paces the engine, so wait for something to play instead of rendering silence
+                    # (clearing the event before checking again, so that a note played in between is not missed)
+                    self.pending.clear()
+                    if self.is_idle():
+                        self.pending.wait(self.block_size / self.fs)
+                    continue
+                # The block is never committed, so the same block of the ring buffer is rendered into every time
+                self.sink.write(self.render_block(self.ring.write_block(self.block_size)))
+
+    def __play(self):
+        """
+        The main loop of the output thread, writes the blocks of the ring buffer to the sink
+        :return: None
+        """
+        # Whether the sink is playing, as opposed to waiting for the renderer to work ahead
+        primed = False
+        # Open the sink once, every voice is played through this single stream
+        with self.sink:
+            # Once the engine was killed, only the blocks rendered so far are played
+            while self.active or self.ring.available() > 0:
+                available = self.ring.available()
+                if self.sink.realtime and not primed and available < self.prefill and self.active:
+                    # Let the renderer work ahead before playing
+                    self.ring.wait_for_blocks(self.prefill, self.block_size / self.fs)
+                    continue
+                if available == 0:
+                    if self.sink.realtime and primed:
+                        # The renderer fell behind the sink, which ran dry
+                        self.ring.underruns += 1
+                        primed = False
+                    self.ring.wait_for_blocks(1, self.block_size / self.fs)
+                    continue
+                primed = True
+                self.sink.write(self.ring.read_block())
+                self.ring.release()
+
+    def play(self, envelope, wave_types, frequency: float, length=-1, delay: int = 0,
+             sound_filter=None) -> (SoundGenerator, int):
+        """
+        Plays a note on a voice of the pool, if every voice is in use, a playing voice is stolen for the note
+        :param envelope: The envelope of the note
+        :param wave_types: The wave preset of the note
+        :param frequency: The frequency of the note
+        :param length: The length of the note in seconds, -1 if it plays until it is released
+        :param delay: The number of samples after the start of the next block at which the note should start
+        :param sound_filter: The filter of the note, None if the note is not filtered
+        :return: The note, a tuple of the voice playing it and the generation of the voice,
+            as the voice is reused for other notes once the note has finished or was stolen
+        """
+        with self.lock:
+            voice = self.pool.acquire(envelope, wave_types, frequency, length, sound_filter=sound_filter,
+                                      onset=self.position + delay)
+            voice.delay = delay
+        self.pending.set()
+        return voice, voice.generation
+
+    def release(self, note: (SoundGenerator, int)):
+        """
+        Releases a note played on a voice of the pool, so that it starts fading out
+        Nothing happens if the voice was already reused for another note
+        :param note: The note as returned by play()
+        :return: None
+        """
+        voice, generation = note
+        with self.lock:
+            if voice.generation == generation and not voice.dead:
+                voice.stop()
+
+    def is_playing(self, note: (SoundGenerator, int)) -> bool:
+        """
+        Returns whether a note played on a voice of the pool is still playing
+        :param note: The note as returned by play()
+        :return: A boolean whether the note is still playing, False if its voice was stolen
+        """
+        voice, generation = note
+        return voice.generation == generation and not voice.is_finished()
+
+    def submit(self, voice, delay: int = 0):
+        """
+        Adds a voice to the set of active voices
+        :param voice: The SoundGenerator to be played by the engine
+        :param delay: The number of samples after the start of the next block at which the voice should start
+        :return: None
+        """
+        voice.delay = delay
+        with self.lock:
+            self.voices.append(voice)
+        self.pending.set()
+
+    def add_sequencer(self, sequencer):
+        """
+        Adds a sequencer to be advanced along with the engine
+        :param sequencer: The Sequencer whose voices should be played by the engine
+        :return: None
+        """
+        with self.lock:
+            self.sequencers.append(sequencer)
+        self.pending.set()
+
+    def render_block(self, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Mixes all of the active voices into a single block
+        :param out: The float32 array of block_size samples to mix the voices into, allocated if unspecified
+        :return: A ndarray of block_size samples
+        """
+        start_time = time.perf_counter()
+        # The voices are rendered under the lock, as notes played from other threads may steal a voice of the pool
+        with self.lock:
+            # Trigger the voices the sequencers schedule within this block
+            for sequencer in self.sequencers:
+                for delay, voice in sequencer.advance(self.block_size, self.pool):
+                    voice.delay = delay
+            # Discard the sequencers which have reached the end of their song
+            self.sequencers = [sequencer for sequencer in self.sequencers if not sequencer.is_finished()]
+            # Sum every voice into the block
+            block = np.zeros(self.block_size, dtype=np.float32) if out is None else out
+            block.fill(0.0)
+            # Voices playing the whole block which share a wavetable, an envelope and a filter are rendered together
+            batches = {}
+            for voices in [self.pool.active, self.voices]:
+                for voice in voices:
+                    if voice.delay >= self.block_size:
+                        # The voice does not start within this block
+                        voice.delay -= self.block_size
+                    elif voice.delay == 0 and BATCH_VOICES and voice.rendered is None \
+                            and voice.waveGenerator.wavetable is not None:
+                        batches.setdefault((id(voice.waveGenerator.wavetable), id(voice.envelope),
+                                            id(voice.sound_filter)), []).append(voice)
+                    else:
+                        # The voice starts (or continues) at its delay within the block
+                        block[voice.delay:] += voice.generate_block(self.block_size - voice.delay)
+                        voice.delay = 0
+            for batch in batches.values():
+                if len(batch) == 1:
+                    # There is nothing to gain from batching a single voice
+                    block += batch[0].generate_block(self.block_size)
+                else:
+                    self.batch_renderer.render(batch, self.block_size, block)
+            voice_count = len(self.pool.active) + len(self.voices)
+            self.position += self.block_size
+            # Return the voices which have finished playing to the pool, and discard the finished submitted voices
+            self.pool.collect()
+            if any(voice.is_finished() for voice in self.voices):
+                self.voices = [voice for voice in self.voices if not voice.is_finished()]
+        self.performance.record(time.perf_counter() - start_time, voice_count)
+        # Return the mixed block
+        return block
+
+    def set_block_size(self, block_size: int):
+        """
+        Changes the block size of the engine, from the next block on
+        :param block_size: The new block size, at most the block size of the ring buffer if the engine was started
+        :return: None
+        """
+        with self.lock:
+            self.block_size = block_size
+            self.performance.set_block_size(block_size)
+
+    def is_idle(self):
+        """
+        Returns whether there are no active voices or sequencers
+        :return: A boolean whether the engine has nothing left to play
+        """
+        with self.lock:
+            return len(self.pool.active) == 0 and len(self.voices) == 0 and len(self.sequencers) == 0
+
+    def get_performance(self) -> dict:
+        """
+        Returns the render time statistics of the engine, along with the state of the ring buffer
+        :return: A dict of the statistics, as returned by PerformanceMonitor.get_statistics(), with the current
+            block size (block_size), the number of blocks rendered ahead (buffered_blocks), the capacity of the ring
+            buffer (buffer_capacity) and the number of times the sink ran dry (buffer_underruns)
+        """
+        statistics = self.performance.get_statistics()
+        statistics["block_size"] = self.block_size
+        statistics["buffered_blocks"] = self.ring.available()
+        statistics["buffer_capacity"] = self.ring.capacity
+        statistics["buffer_underruns"] = self.ring.underruns
+        return statistics
+
+    def kill(self):
+        """
+        Kills the engine thread, the sink is closed once the blocks rendered ahead were played
+        :return: None
+        """
+        self.active = False
+        # Wake both threads up, so that they notice right away
+        self.pending.set()
+        self.ring.wake()
+
+
+# The audio engine shared by the entire program, created on first use
+_audio_engine: AudioEngine | None = None
+_audio_engine_lock = threading.Lock()
+# The sink of the shared audio engine, None for the sink selected in config.py
+_audio_sink: AudioSink | None = None
+
+
+def set_audio_sink(sink: AudioSink):
+    """
+    Sets the sink the shared audio engine writes to, which is only possible before the engine is first used
+    :param sink: The AudioSink of the engine
+    :return: None
+    """
+    global _audio_sink
+    with _audio_engine_lock:
+        if _audio_engine is not None:
+            # The engine already opened its sink, raise an exception
+            raise Exception("Audio Engine Already Started")
+        _audio_sink = sink
+
+
+def get_audio_engine() -> AudioEngine:
+    """
+    Returns the shared audio engine, starting it if it is not running yet
+    :return: The AudioEngine object of the program
+    """
+    global _audio_engine
+    with _audio_engine_lock:
+        if _audio_engine is None:
+            # Create and start the engine on first use
+            _audio_engine = AudioEngine(_audio_sink)
+            _audio_engine.start()
+        return _audio_engine
@@ -0,0 +1,436 @@
+import queue
+import struct
+import sys
+import threading
+import time
+import numpy as np
+from config import BITRATE, BUFFER_SIZE, AUDIO_SINK, AUDIO_SINK_PATH, SIMULATED_CLOCK_SPEED, PCM_FORMAT, \
+    PCM_BUFFER_BLOCKS, PCM_REALTIME
+
+# The sinks the audio engine can play to, selectable in config.py and from the command line
+AUDIO_SINKS = ["soundcard", "wav", "null", "simulated", "pcm"]
+# The sample formats of the raw PCM sink, and the little endian dtypes they are written as
+PCM_FORMATS = {"float32": "<f4", "int16": "<i2"}
+
+
+class AudioSink:
+    """
+    A class representing an audio sink (the destination every block rendered by the audio engine is written to)
+
+    A sink is opened once before the first block and closed after the last one, it can be used as a context manager.
+    Real time sinks block in write() until the block is due, so they pace the engine. Other sinks consume blocks
+    as fast as they are rendered, so the engine only writes to them while it has something to play
+
+    Attributes
+    ----------
+    fs : int
+        The sampling rate of the blocks, read from config.py
+    block_size : int
+        The number of samples of every block, read from config.py
+    realtime : bool
+        Whether the sink plays blocks in real time
+    samples : int
+        The number of samples written to the sink since it was opened
+
+    Methods
+    -------
+    open()
+        Acquires whatever the sink writes to
+    write(block)
+        Writes a block of samples to the sink
+    close()
+        Releases whatever the sink writes to
+    """
+    realtime = False
+
+    def __init__(self):
+        """
+        Constructs the object
+        """
+        self.fs = BITRATE
+        self.block_size = BUFFER_SIZE
+        self.samples = 0
+
+    def open(self):
+        """
+        Acquires whatever the sink writes to
+        :return: None
+        """
+        self.samples = 0
+
+    def write(self, block: np.ndarray):
+        """
+        Writes a block of samples to the sink
+        :param block: A float32 ndarray of samples
+        :return: None
+        """
+        self.samples += len(block)
+
+    def close(self):
+        """
+        Releases whatever the sink writes to
+        :return: None
+        """
+        pass
+
+    def __enter__(self):
+        """
+        Opens the sink when entering a with statement
+        :return: The sink itself
+        """
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Closes the sink when leaving a with statement
+        :return: None
+        """
+        self.close()
+
+
+class SoundcardSink(AudioSink):
+    """
+    A class representing a sink playing blocks on the default speaker through the soundcard library
+
+    Attributes
+    ----------
+    player : soundcard player
+        The player of the default speaker, None while the sink is closed
+    speaker : soundcard stream
+        The open stream of the player, None while the sink is closed
+    """
+    realtime = True
+
+    def __init__(self):
+        """
+        Constructs the object
+        """
+        super().__init__()
+        self.player = None
+        self.speaker = None
+
+    def open(self):
+        """
+        Opens a stream to the default speaker
+        :return: None
+        """
+        super().open()
+        # Import soundcard only once a stream is opened, so nothing else needs a speaker
+        import soundcard as sc
+        self.player = sc.default_speaker().player(samplerate=self.fs, channels=1, blocksize=self.block_size)
+        self.speaker = self.player.__enter__()
+
+    def write(self, block: np.ndarray):
+        """
+        Plays a block of samples, blocking until the speaker has room for it
+        :param block: A float32 ndarray of samples
+        :return: None
+        """
+        super().write(block)
+        self.speaker.play(block)
+
+    def close(self):
+        """
+        Closes the stream to the default speaker
+        :return: None
+        """
+        if self.player is not None:
+            self.player.__exit__(None, None, None)
+        self.player = None
+        self.speaker = None
+
+
+class WavSink(AudioSink):
+    """
+    A class representing a sink writing blocks to a 32-bit float WAV file as they are rendered
+
+    The sizes in the header of the file are only known once the sink is closed, until then they are left at 0
+
+    Attributes
+    ----------
+    path : str
+        The path of the WAV file
+    file : file
+        The open WAV file, None while the sink is closed
+    """
+
+    def __init__(self, path: str = AUDIO_SINK_PATH):
+        """
+        Constructs the object
+        :param path: The path of the WAV file to write
+        """
+        super().__init__()
+        self.path = path
+        self.file = None
+
+    def open(self):
+        """
+        Creates the WAV file and writes its header
+        :return: None
+        """
+        super().open()
+        self.file = open(self.path, "wb")
+        self.file.write(self.__header(0))
+
+    def write(self, block: np.ndarray):
+        """
+        Appends a block of samples to the WAV file
+        :param block: A float32 ndarray of samples
+        :return: None
+        """
+        super().write(block)
+        # WAV files are little endian
+        self.file.write(block.astype("<f4", copy=False).tobytes())
+
+    def close(self):
+        """
+        Writes the final sizes into the header and closes the WAV file
+        :return: None
+        """
+        if self.file is not None:
+            self.file.seek(0)
+            self.file.write(self.__header(self.samples * 4))
+            self.file.close()
+        self.file = None
+
+    def __header(self, data_size: int) -> bytes:
+        """
+        Returns the header of a mono 32-bit float WAV file
+        :param data_size: The number of bytes of samples following the header
+        :return: The 44 bytes of the header
+        """
+        # The RIFF chunk, the format chunk (format 3 is IEEE float) and the start of the data chunk
+        return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 3, 1,
+                           self.fs, self.fs * 4, 4, 32, b"data", data_size)
+
+
+class NullSink(AudioSink):
+    """
+    A class representing a sink discarding every block, so the engine renders as fast as it can
+
+    Only the number of samples written is kept, which makes it suited to measuring the throughput of the engine
+    """
+    pass
+
+
+class SimulatedClockSink(AudioSink):
+    """
+    A class representing a sink playing blocks against a simulated clock instead of a device
+
+    Every block advances the clock by its duration, and write() blocks until the clock has reached the block,
+    like a speaker would. The clock either runs by itself at speed times real time, or, if speed is None,
+    only advances when advance() is called, which lets tests step the engine a block at a time
+
+    Attributes
+    ----------
+    speed : float | None
+        How many times faster than real time the clock runs, None if it is advanced manually
+    start : float
+        The wall time at which the sink was opened
+    allowed : int
+        The number of samples the clock has been advanced to, if it is advanced manually
+    condition : threading.Condition
+        The condition write() waits on for the clock to be advanced manually
+
+    Methods
+    -------
+    advance(blocks)
+        Advances a manual clock by the given number of blocks
+    get_time()
+        Returns the time of the clock
+    """
+    realtime = True
+
+    def __init__(self, speed: float | None = SIMULATED_CLOCK_SPEED):
+        """
+        Constructs the object
+        :param speed: How many times faster than real time the clock runs, None to advance it manually
+        """
+        super().__init__()
+        self.speed = speed
+        self.start = 0.0
+        self.allowed = 0
+        self.condition = threading.Condition()
+
+    def open(self):
+        """
+        Starts the clock
+        :return: None
+        """
+        super().open()
+        # The manual clock is left as it is, as it may be advanced before the engine got to open the sink
+        self.start = time.perf_counter()
+
+    def write(self, block: np.ndarray):
+        """
+        Plays a block of samples, blocking until the clock has reached its end
+        :param block: A float32 ndarray of samples
+        :return: None
+        """
+        end = self.samples + len(block)
+        if self.speed is None:
+            # Wait for the clock to be advanced past the block
+            with self.condition:
+                self.condition.wait_for(lambda: self.allowed >= end)
+        else:
+            # Wait for the wall time at which the clock reaches the end of the block
+            delay = self.start + end / self.fs / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        with self.condition:
+            super().write(block)
+            self.condition.notify_all()
+
+    def advance(self, blocks: int = 1):
+        """
+        Advances a manual clock by the given number of blocks, and waits until they were written
+        :param blocks: The number of blocks to advance by
+        :return: None
+        """
+        with self.condition:
+            self.allowed += blocks * self.block_size
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: self.samples >= self.allowed)
+
+    def get_time(self) -> float:
+        """
+        Returns the time of the clock, the duration of every block written so far
+        :return: The time of the clock in seconds
+        """
+        return self.samples / self.fs
+
+
+class PcmSink(AudioSink):
+    """
+    A class representing a sink streaming raw mono PCM samples to stdout or to a file, such as a named pipe
+
+    Blocks are converted to the sample format and handed to a writer thread through a queue holding at most
+    PCM_BUFFER_BLOCKS blocks. If the consumer reads slower than the engine renders, the queue fills up and write()
+    blocks until the consumer catches up, so a slow consumer throttles rendering instead of growing memory.
+    If the sink is real time, blocks are additionally paced to the sampling rate, so that a live session streams
+    continuously. Should the consumer go away, the remaining blocks are discarded
+
+    Attributes
+    ----------
+    path : str
+        The path to stream to, "-" for stdout
+    sample_format : str
+        The sample format, one of PCM_FORMATS
+    realtime : bool
+        Whether blocks are paced to the sampling rate, otherwise the consumer alone paces the engine
+    buffer : queue.Queue
+        The blocks waiting to be written, None marks the end of the stream
+    writer : threading.Thread
+        The thread writing the blocks of the queue, None while the sink is closed
+    file : file
+        The open stream, None while the sink is closed
+    start : float
+        The wall time at which the sink was opened
+    broken : bool
+        Whether the consumer has gone away
+    """
+
+    def __init__(self, path: str = "-", sample_format: str = PCM_FORMAT, realtime: bool = PCM_REALTIME):
+        """
+        Constructs the object
+        :param path: The path to stream to, "-" for stdout
+        :param sample_format: The sample format, one of PCM_FORMATS
+        :param realtime: Whether blocks are paced to the sampling rate
+        """
+        if sample_format not in PCM_FORMATS:
+            # If the format is not recognized, raise an exception
+            raise Exception("Invalid PCM Format")
+        super().__init__()
+        self.path = path
+        self.sample_format = sample_format
+        self.realtime = realtime
+        self.buffer = queue.Queue(maxsize=PCM_BUFFER_BLOCKS)
+        self.writer = None
+        self.file = None
+        self.start = 0.0
+        self.broken = False
+
+    def open(self):
+        """
+        Opens the stream and starts the writer thread
+        Opening a named pipe blocks until a consumer opens it for reading
+        :return: None
+        """
+        super().open()
+        self.file = sys.stdout.buffer if self.path == "-" else open(self.path, "wb")
+        self.broken = False
+        self.writer = threading.Thread(target=self.__write_blocks, daemon=True)
+        self.writer.start()
+        self.start = time.perf_counter()
+
+    def write(self, block: np.ndarray):
+        """
+        Queues a block of samples to be streamed, blocking while the queue is full
+        :param block: A float32 ndarray of samples
+        :return: None
+        """
+        super().write(block)
+        if self.realtime:
+            # Wait for the wall time at which the block is due
+            delay = self.start + self.samples / self.fs - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if self.sample_format == "int16":
+            samples = (np.clip(block, -1.0, 1.0) * 32767).astype(PCM_FORMATS["int16"])
+        else:
+            samples = block.astype(PCM_FORMATS["float32"])
+        self.buffer.put(samples.tobytes())
+
+    def close(self):
+        """
+        Waits for every queued block to be written, then closes the stream (stdout is only flushed)
+        :return: None
+        """
+        if self.writer is not None:
+            self.buffer.put(None)
+            self.writer.join()
+            if self.file is not sys.stdout.buffer:
+                self.file.close()
+        self.writer = None
+        self.file = None
+
+    def __write_blocks(self):
+        """
+        The main loop of the writer thread, writes the queued blocks until the end of the stream
+        :return: None
+        """
+        while True:
+            data = self.buffer.get()
+            if data is None:
+                break
+            if self.broken:
+                # The consumer has gone away, keep draining the queue so the engine is never blocked
+                continue
+            try:
+                self.file.write(data)
+                self.file.flush()
+            except (BrokenPipeError, OSError):
+                self.broken = True
+
+
+def create_audio_sink(name: str = AUDIO_SINK, path: str = AUDIO_SINK_PATH) -> AudioSink:
+    """
+    Creates an audio sink by its name
+    :param name: The name of the sink, one of AUDIO_SINKS
+    :param path: The path of the WAV file if the sink is a WAV sink, the path to stream to if it is a PCM sink
+    :return: The AudioSink object
+    """
+    if name == "soundcard":
+        return SoundcardSink()
+    elif name == "wav":
+        return WavSink(path)
+    elif name == "null":
+        return NullSink()
+    elif name == "simulated":
+        return SimulatedClockSink()
+    elif name == "pcm":
+        return PcmSink(path)
+    else:
+        # If the sink is not recognized, raise an exception
+        raise Exception("Invalid Audio Sink")
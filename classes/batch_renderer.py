@@ -0,0 +1,142 @@
+import numpy as np
+from classes.sound_generator import SoundGenerator
+from config import BITRATE, BUFFER_SIZE, MAX_VOL
+
+# The release sample of voices which are still held, later than any sample which will ever be rendered
+NOT_RELEASED = np.iinfo(np.int64).max // 2
+
+
+class BatchRenderer:
+    """
+    A class representing a batch renderer (renders every voice sharing a wave preset, an envelope and a filter at once)
+
+    The phases and the envelope positions of all of the voices are stacked into (voices x samples) arrays,
+    so the whole block of every voice is computed by a single set of NumPy calls, regardless of the voice count.
+    Only voices whose wave generator renders from a wavetable can be batched. The filters of the voices are run over
+    the whole batch at once if their cutoff is fixed, otherwise voice by voice, as every voice has its own cutoff
+
+    Attributes
+    ----------
+    fs : int
+        The sampling rate of the renderer, read from config.py
+    capacity : int
+        The number of voices the buffers can hold, they are grown when a larger batch is rendered
+    size : int
+        The number of samples the buffers can hold, they are grown when a larger block is rendered
+    start, release_sample, release_level, phase, increment : ndarray
+        Per-voice state gathered from the voices before every block
+    filter_state : ndarray
+        The (1 x voices x 2) states of the filters of the voices, gathered before and scattered after every block
+    ramp, ramp_int : ndarray
+        Ramps counting the samples of a block, as float and as int
+    phases, samples, gains, position, scratch, index, mask : ndarray
+        (voices x samples) work buffers
+    mix : ndarray
+        The sum of all of the voices of the batch
+    mix_float32 : ndarray
+        The sum of all of the voices of the batch, converted to float32
+
+    Methods
+    -------
+    render(voices, n, out)
+        Renders the next n samples of every voice and adds them to the output
+    """
+
+    def __init__(self):
+        """
+        Constructs the object
+        """
+        self.fs = BITRATE
+        self.capacity = 0
+        self.size = 0
+        self.__allocate(8, BUFFER_SIZE)
+
+    def render(self, voices: [SoundGenerator], n: int, out: np.ndarray):
+        """
+        Renders the next n samples of every voice and adds their sum to the output
+        Every voice must share the same wavetable, the same envelope and the same filter
+        :param voices: The list of voices to render
+        :param n: The number of samples to render
+        :param out: The float32 array to add the first n samples of the sum of the voices to
+        :return: None
+        """
+        count = len(voices)
+        if count > self.capacity or n > self.size:
+            # The batch is larger than the buffers, grow them
+            self.__allocate(max(count, self.capacity), max(n, self.size))
+        wavetable = voices[0].waveGenerator.wavetable
+        envelope = voices[0].envelope
+        sound_filter = voices[0].sound_filter
+        # Gather the state of every voice, advancing their phase accumulators past this block
+        for i, voice in enumerate(voices):
+            voice.begin_block(n)
+            self.start[i] = voice.sample
+            self.release_sample[i] = voice.dead_sample if voice.dead else NOT_RELEASED
+            self.release_level[i] = voice.dead_volume / MAX_VOL
+            self.increment[i] = voice.waveGenerator.increment
+            self.phase[i] = voice.waveGenerator.advance(n)
+            # The phase of every sample of the voice, row by row, as NumPy allocates a temporary the size of the whole
+            # batch when a column is broadcast over the block
+            phases = self.phases[i, :n]
+            np.multiply(self.ramp[:n], self.increment[i], out=phases)
+            phases += self.phase[i]
+            if sound_filter is not None:
+                self.filter_state[:, i] = voice.filter_state
+        # Views of the buffers matching the size of this batch
+        phases = self.phases[:count, :n]
+        samples = self.samples[:count, :n]
+        gains = self.gains[:count, :n]
+        position = self.position[:count, :n]
+        scratch = self.scratch[:count, :n]
+        index = self.index[:count, :n]
+        # Look the waveform of every voice up in the wavetable at once
+        wavetable.generate(phases, samples, position, index, scratch)
+        # Calculate the gain of every sample of every voice from the envelope at once
+        envelope.gain_batch(self.start[:count], self.fs, self.release_sample[:count], self.release_level[:count],
+                            self.ramp_int[:n], gains, index, scratch, self.mask[:count, :n])
+        if sound_filter is not None:
+            # Filter the waveform of every voice, the cutoff follows the gain at the start of the block
+            filter_state = self.filter_state[:, :count]
+            sound_filter.process_batch(samples, filter_state, self.fs, gains[:, 0])
+            for i, voice in enumerate(voices):
+                voice.filter_state[...] = filter_state[:, i]
+        # Let every voice know where its envelope ended up
+        for i, voice in enumerate(voices):
+            voice.end_block(n, gains[i, n - 1] * MAX_VOL)
+        # Scale the waveforms by the envelopes, and sum the voices
+        gains *= samples
+        mix = self.mix[:n]
+        np.sum(gains, axis=0, out=mix)
+        mix *= MAX_VOL
+        # Convert the sum into the float32 scratch buffer before adding it, so that no array is allocated
+        mix_float32 = self.mix_float32[:n]
+        np.copyto(mix_float32, mix, casting="same_kind")
+        out = out[:n]
+        out += mix_float32
+
+    def __allocate(self, capacity: int, size: int):
+        """
+        Allocates the buffers every batch is rendered into
+        :param capacity: The largest number of voices a batch may have
+        :param size: The largest number of samples a block may have
+        :return: None
+        """
+        self.capacity = capacity
+        self.size = size
+        self.start = np.empty(capacity, dtype=np.int64)
+        self.release_sample = np.empty(capacity, dtype=np.int64)
+        self.release_level = np.empty(capacity)
+        self.phase = np.empty(capacity)
+        self.increment = np.empty(capacity)
+        self.filter_state = np.empty((1, capacity, 2))
+        self.ramp = np.arange(size, dtype=np.float64)
+        self.ramp_int = np.arange(size, dtype=np.intp)
+        self.phases = np.empty((capacity, size))
+        self.samples = np.empty((capacity, size))
+        self.gains = np.empty((capacity, size))
+        self.position = np.empty((capacity, size))
+        self.scratch = np.empty((capacity, size))
+        self.index = np.empty((capacity, size), dtype=np.intp)
+        self.mask = np.empty((capacity, size), dtype=bool)
+        self.mix = np.empty(size)
+        self.mix_float32 = np.empty(size, dtype=np.float32)
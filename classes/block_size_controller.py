@@ -0,0 +1,145 @@
+import logging
+from config import BITRATE, BUFFER_SIZE, MIN_BUFFER_SIZE, MAX_BUFFER_SIZE, ADAPTIVE_BUFFER_WINDOW, \
+    ADAPTIVE_SHRINK_THRESHOLD, ADAPTIVE_BUFFER_LOG, ADAPTIVE_UNDERRUN_LIMIT, LATE_BLOCK_THRESHOLD
+
+# Every decision of the controllers is logged here, to ADAPTIVE_BUFFER_LOG if it is set, unless the program
+# configures otherwise
+logger = logging.getLogger("pysynth.block_size")
+
+
+class BlockSizeController:
+    """
+    A class representing a block size controller (tunes the block size of the audio engine while it plays)
+
+    Smaller blocks are heard sooner, so notes played live have less latency, but every block has a fixed cost,
+    so the more voices play, the larger the blocks need to be to render in time. The controller measures the CPU time
+    every block takes to render relative to its duration (its load), and after every window of
+    ADAPTIVE_BUFFER_WINDOW blocks decides on the block size:
+        if a block was late (beyond LATE_BLOCK_THRESHOLD), or the sink ran dry ADAPTIVE_UNDERRUN_LIMIT times within
+        the window, the block size is doubled (immediately, without waiting for the window to end),
+        and the block size is never halved to it again,
+        if every block of the window stayed below ADAPTIVE_SHRINK_THRESHOLD and the sink never ran dry,
+        the block size is halved,
+        otherwise the block size is kept
+    so it settles on the smallest block size which renders in time without running dry. The block size stays a power
+    of two times BUFFER_SIZE within MIN_BUFFER_SIZE and MAX_BUFFER_SIZE
+
+    The sink running dry once in a while may be caused by anything delaying the threads (such as the scheduler),
+    which a larger block does not help against, so every time is logged, but only repeated underruns grow the block
+
+    Attributes
+    ----------
+    fs : int
+        The sampling rate of the engine, read from config.py
+    block_size : int
+        The current block size
+    minimum : int
+        The smallest block size the controller may choose
+    maximum : int
+        The largest block size the controller may choose
+    unsafe : set[int]
+        The block sizes which were too small, the controller does not shrink to them again
+    blocks : int
+        The number of blocks measured in the current window
+    max_load : float
+        The largest load of the current window
+    window_underruns : int
+        The number of times the sink ran dry within the current window
+    underruns : int
+        The number of times the sink ran dry when the last block was measured
+    decisions : [(int, int, str)]
+        Every change of the block size, as (old block size, new block size, reason)
+
+    Methods
+    -------
+    record(render_time, underruns)
+        Measures a block, and returns the block size of the next block
+    """
+
+    def __init__(self, block_size: int = BUFFER_SIZE, minimum: int = MIN_BUFFER_SIZE, maximum: int = MAX_BUFFER_SIZE):
+        """
+        Constructs the object
+        :param block_size: The block size to start with
+        :param minimum: The smallest block size the controller may choose
+        :param maximum: The largest block size the controller may choose
+        """
+        if not 0 < minimum <= block_size <= maximum:
+            # The bounds have to contain the starting block size, raise an exception
+            raise Exception("Invalid Block Size Bounds")
+        self.fs = BITRATE
+        self.block_size = block_size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.unsafe = set()
+        self.blocks = 0
+        self.max_load = 0.0
+        self.window_underruns = 0
+        self.underruns = 0
+        self.decisions = []
+        if ADAPTIVE_BUFFER_LOG is not None and not logger.handlers:
+            # Log to the file from config.py, unless the program set up logging itself
+            logger.addHandler(logging.FileHandler(ADAPTIVE_BUFFER_LOG))
+            logger.setLevel(logging.INFO)
+        logger.info(f"Starting at {self.__describe(block_size)}, bounds {minimum}-{maximum} samples")
+
+    def record(self, render_time: float, underruns: int) -> int:
+        """
+        Measures a block, and returns the block size of the next block
+        :param render_time: The CPU time it took to render the block in seconds
+        :param underruns: The number of times the sink ran dry so far
+        :return: The block size of the next block
+        """
+        load = render_time / (self.block_size / self.fs)
+        self.blocks += 1
+        self.max_load = max(self.max_load, load)
+        if underruns > self.underruns:
+            self.window_underruns += underruns - self.underruns
+            logger.info(f"The sink ran dry at {self.__describe(self.block_size)}, while the block took {load:.0%} "
+                        f"of its duration ({self.window_underruns} times within {self.blocks} blocks)")
+        self.underruns = underruns
+        if load > LATE_BLOCK_THRESHOLD:
+            # The block size is too small, grow it right away
+            self.unsafe.add(self.block_size)
+            self.__change(self.block_size * 2, f"a block took {load:.0%} of its duration")
+        elif self.window_underruns >= ADAPTIVE_UNDERRUN_LIMIT:
+            # The sink keeps running dry, so the blocks are too small to absorb the delays of the threads
+            self.unsafe.add(self.block_size)
+            self.__change(self.block_size * 2, f"the sink ran dry {self.window_underruns} times within "
+                                               f"{self.blocks} blocks")
+            # Count the underruns anew, also if the block size is at its bound already
+            self.window_underruns = 0
+        elif self.blocks >= ADAPTIVE_BUFFER_WINDOW:
+            if self.max_load < ADAPTIVE_SHRINK_THRESHOLD and self.window_underruns == 0 \
+                    and self.block_size // 2 not in self.unsafe:
+                self.__change(self.block_size // 2, f"every block took less than {self.max_load:.0%} of its duration")
+            # Start the next window
+            self.blocks = 0
+            self.max_load = 0.0
+            self.window_underruns = 0
+        return self.block_size
+
+    def __change(self, block_size: int, reason: str):
+        """
+        Changes the block size, if it is within the bounds, and logs the decision
+        :param block_size: The new block size
+        :param reason: Why the block size is changed
+        :return: None
+        """
+        if block_size < self.minimum or block_size > self.maximum:
+            # The block size is at its bound already
+            return
+        logger.info(f"{self.__describe(self.block_size)} -> {self.__describe(block_size)}, as {reason}")
+        self.decisions.append((self.block_size, block_size, reason))
+        self.block_size = block_size
+        # The measurements of the old block size do not apply to the new one
+        self.blocks = 0
+        self.max_load = 0.0
+        self.window_underruns = 0
+
+    def __describe(self, block_size: int) -> str:
+        """
+        Returns a description of a block size, for the log
+        :param block_size: The block size to describe
+        :return: The block size in samples and in milliseconds
+        """
+        return f"{block_size} samples ({block_size / self.fs * 1000:.1f}ms)"
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Envelope:
     """
     A class representing a linear(*) envelope
@@ -12,6 +15,23 @@ class Envelope:
         The sustain level as a percentage of the peak amplitude
     r : float
         The release time in seconds
+    tables : {int: ndarray}
+        Precomputed attack/decay/sustain curves, keyed by the sampling rate they were computed for
+    release_tables : {int: ndarray}
+        Precomputed release curves falling from 1 to 0, keyed by the sampling rate they were computed for
+
+    Methods
+    -------
+    gain(time, release_time, release_level, fs)
+        Returns the gain of the envelope for every value of a time array
+    gain_block(start, n, fs, release_sample, release_level, out)
+        Writes the gain of the envelope for a block of samples into a preallocated array
+    gain_batch(start, fs, release_sample, release_level, ramp, out, index, scratch, mask)
+        Writes the gain of the envelope for a block of samples of a batch of notes into a preallocated array
+    get_table(fs)
+        Returns the precomputed attack/decay/sustain curve for the given sampling rate
+    get_release_table(fs)
+        Returns the precomputed release curve for the given sampling rate
 
     (*) It is not guaranteed that this will remain as such in subsequent versions
     """
@@ -29,6 +49,148 @@ class Envelope:
         self.d = d
         self.s = s
         self.r = r
+        # Curve tables are computed on demand
+        self.tables = {}
+        self.release_tables = {}
 
         # TODO: Add exponential envelope type
-        # TODO: Refactor to contain a function for amplitude at time t
+
+    def gain(self, time: np.ndarray, release_time=np.inf, release_level=None, fs: int | None = None) -> np.ndarray:
+        """
+        Returns the gain of the envelope for every value of a time array
+        :param time: A ndarray of time values in seconds, measured from the start of the note
+        :param release_time: The time at which the note was released, infinite if the note is still held.
+            May be a ndarray broadcastable against time
+        :param release_level: The gain from which the release starts. If unspecified, it is the gain of the envelope
+            at release_time. May be a ndarray broadcastable against time
+        :param fs: If specified, the attack/decay/sustain curve is looked up in the precomputed table
+            for this sampling rate instead of being interpolated
+        :return: A ndarray of gains in the range [0.0, 1.0], of the same shape as time
+        """
+        release_time = np.asarray(release_time, dtype=np.float64)
+        # Attack, decay and sustain, as if the note was held forever
+        held = self.__held_gain(time, fs)
+        if not np.any(np.isfinite(release_time)):
+            # The note is still held, no need to compute the release
+            return held
+        if release_level is None:
+            # Release from wherever the envelope was at the time of release
+            release_level = self.__held_gain(np.where(np.isfinite(release_time), release_time, 0.0), fs)
+        # Fall linearly from the release level to 0 over r seconds
+        if self.r > 0:
+            released = release_level * np.clip(1 - (time - release_time) / self.r, 0.0, 1.0)
+        else:
+            released = np.zeros_like(held)
+        return np.where(time >= release_time, released, held)
+
+    def gain_block(self, start: int, n: int, fs: int, release_sample: int | None, release_level: float,
+                   out: np.ndarray) -> np.ndarray:
+        """
+        Writes the gain of the envelope for a block of samples into a preallocated array, without allocating
+        :param start: The index of the first sample of the block, counted from the start of the note
+        :param n: The number of samples in the block
+        :param fs: The sampling rate, used to look up the precomputed tables
+        :param release_sample: The sample at which the note was released, None if the note is still held
+        :param release_level: The gain from which the release starts
+        :param out: The array to write the gains into, at least n samples long
+        :return: The first n samples of out
+        """
+        out = out[:n]
+        # Attack, decay and sustain are sliced straight out of the table, past the table it is the sustain level
+        table = self.get_table(fs)
+        held = min(max(len(table) - start, 0), n)
+        out[:held] = table[start:start + held]
+        out[held:] = self.s
+        if release_sample is None or release_sample >= start + n:
+            # The note is held throughout the block
+            return out
+        # The release starts within (or before) this block, and falls from the release level along the release table
+        release_table = self.get_release_table(fs)
+        first = max(release_sample - start, 0)
+        offset = start + first - release_sample
+        falling = min(max(len(release_table) - offset, 0), n - first)
+        np.multiply(release_table[offset:offset + falling], release_level, out=out[first:first + falling])
+        # Past the release table the note is silent
+        out[first + falling:] = 0.0
+        return out
+
+    def gain_batch(self, start: np.ndarray, fs: int, release_sample: np.ndarray, release_level: np.ndarray,
+                   ramp: np.ndarray, out: np.ndarray, index: np.ndarray, scratch: np.ndarray,
+                   mask: np.ndarray) -> np.ndarray:
+        """
+        Writes the gain of the envelope for a block of samples of a batch of notes into a preallocated array
+        Every note is a row of the output, and the whole batch is computed without looping over the notes
+        :param start: A (notes,) int ndarray of the index of the first sample of the block of each note
+        :param fs: The sampling rate, used to look up the precomputed tables
+        :param release_sample: A (notes,) int ndarray of the sample at which each note was released,
+            larger than any sample of the block if the note is still held
+        :param release_level: A (notes,) ndarray of the gain from which the release of each note starts
+        :param ramp: A (samples,) intp ndarray counting from 0 to the number of samples in the block
+        :param out: A (notes, samples) float64 array to write the gains into
+        :param index: A (notes, samples) intp work buffer
+        :param scratch: A (notes, samples) float64 work buffer
+        :param mask: A (notes, samples) bool work buffer
+        :return: out
+        """
+        # Attack, decay and sustain are looked up in the table, past the table it is the sustain level
+        table = self.get_table(fs)
+        # The positions are filled note by note, as NumPy allocates a temporary the size of the whole batch
+        # when a column is broadcast over the block
+        for note in range(len(start)):
+            np.add(ramp, start[note], out=index[note])
+        np.minimum(index, len(table) - 1, out=index)
+        np.take(table, index, out=out, mode="clip")
+        # Samples after the release of their note fall from the release level along the release table
+        for note in range(len(start)):
+            np.add(ramp, start[note] - release_sample[note], out=index[note])
+        np.greater_equal(index, 0, out=mask)
+        if not mask.any():
+            # None of the notes are released within this block
+            return out
+        release_table = self.get_release_table(fs)
+        # The release table ends with a 0, which holds for every sample past the end of the release
+        np.minimum(index, len(release_table) - 1, out=index)
+        np.take(release_table, index, out=scratch, mode="clip")
+        for note in range(len(start)):
+            scratch[note] *= release_level[note]
+        np.copyto(out, scratch, where=mask)
+        return out
+
+    def get_table(self, fs: int) -> np.ndarray:
+        """
+        Returns the precomputed attack/decay/sustain curve for the given sampling rate
+        :param fs: The sampling rate of the table
+        :return: A ndarray of the gain at every sample of the attack and decay, followed by the sustain level
+        """
+        if fs not in self.tables:
+            # The last entry is past the end of the decay, and thus holds the sustain level
+            self.tables[fs] = self.__held_gain(np.arange(int(np.ceil((self.a + self.d) * fs)) + 1) / fs)
+        return self.tables[fs]
+
+    def get_release_table(self, fs: int) -> np.ndarray:
+        """
+        Returns the precomputed release curve for the given sampling rate
+        :param fs: The sampling rate of the table
+        :return: A ndarray of the gain at every sample of the release, falling linearly from 1 to 0,
+            the last sample being 0
+        """
+        if fs not in self.release_tables:
+            length = int(np.ceil(self.r * fs))
+            self.release_tables[fs] = 1 - np.arange(length + 1) / length if length > 0 else np.zeros(1)
+        return self.release_tables[fs]
+
+    def __held_gain(self, time: np.ndarray, fs: int | None = None) -> np.ndarray:
+        """
+        Returns the attack/decay/sustain gain of the envelope for every value of a time array
+        :param time: A ndarray of time values in seconds
+        :param fs: If specified, the gain is looked up in the precomputed table for this sampling rate
+        :return: A ndarray of gains, of the same shape as time
+        """
+        if fs is not None:
+            table = self.get_table(fs)
+            # Round to the nearest sample, times past the table are held at the sustain level
+            return table[np.clip(np.rint(np.asarray(time) * fs).astype(np.int64), 0, len(table) - 1)]
+        # Linear segments from 0 to the peak over the attack, then from the peak to the sustain level over the decay
+        # np.interp holds the last value past the end of the decay, which is exactly the sustain level,
+        # and segments of zero length jump straight to their end value
+        return np.interp(time, [0.0, self.a, self.a + self.d], [0.0, 1.0, self.s])
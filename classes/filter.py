@@ -0,0 +1,162 @@
+import math
+import numpy as np
+
+# The filter types, a filter preset is one of these
+FILTER_TYPES = ["lowpass", "highpass", "bandpass"]
+# The lowest cutoff frequency of a filter in Hz
+MIN_CUTOFF = 20.0
+# The highest cutoff frequency of a filter as a fraction of the sampling rate, just below the Nyquist frequency
+MAX_CUTOFF = 0.45
+
+
+class Filter:
+    """
+    A class representing a filter preset (a resonant biquad filter every voice is run through before its envelope)
+
+    The filter is a single second order section, with the coefficients of the RBJ audio EQ cookbook, which is run
+    block by block by scipy.signal.sosfilt. Every voice keeps the state of its filter and carries it from one block
+    to the next, so the output is the same as if the whole note was filtered at once, without any discontinuities
+    at the boundaries of the blocks
+
+    The cutoff may follow the envelope of the voice: at an envelope gain of g, the cutoff is
+    cutoff * 2 ** (envelope_amount * g), so a positive amount opens the filter over the attack, and closes it again
+    over the release. The cutoff follows the envelope once per block, at the gain of the first sample of the block
+
+    Attributes
+    ----------
+    filter_type : str
+        The type of the filter, one of FILTER_TYPES
+    cutoff : float
+        The cutoff frequency of the filter in Hz (the center frequency of a band-pass filter)
+    resonance : float
+        The quality factor (Q) of the filter, 0.707 is flat, larger values resonate around the cutoff
+    envelope_amount : float
+        The number of octaves the cutoff is raised by at the peak of the envelope, 0 if the cutoff is fixed
+    sections : {int: ndarray}
+        The precomputed sections of a fixed cutoff, keyed by the sampling rate they were computed for
+
+    Methods
+    -------
+    is_static()
+        Returns whether the cutoff is fixed
+    get_cutoff(level, fs)
+        Returns the cutoff at a gain of the envelope
+    get_sections(fs, level)
+        Returns the second order section of the filter
+    process(samples, state, fs, level)
+        Filters a block of samples of a single voice in place
+    process_batch(samples, state, fs, levels)
+        Filters a block of samples of a batch of voices in place
+    """
+
+    def __init__(self, filter_type: str, cutoff: float, resonance: float = 0.707, envelope_amount: float = 0.0):
+        """
+        Constructs the object
+        :param filter_type: The type of the filter, one of FILTER_TYPES
+        :param cutoff: The cutoff frequency of the filter in Hz
+        :param resonance: The quality factor (Q) of the filter
+        :param envelope_amount: The number of octaves the cutoff is raised by at the peak of the envelope
+        """
+        if filter_type not in FILTER_TYPES:
+            # If the filter type is not recognized, raise an exception
+            raise Exception("Invalid Filter Type")
+        if cutoff <= 0 or resonance <= 0:
+            # Neither a cutoff nor a quality factor of 0 can be designed, raise an exception
+            raise Exception("Invalid Filter Parameters")
+        self.filter_type = filter_type
+        self.cutoff = cutoff
+        self.resonance = resonance
+        self.envelope_amount = envelope_amount
+        # Sections are computed on demand
+        self.sections = {}
+        # Import scipy along with the preset, so that the audio engine does not stall on it when the first note
+        # is filtered (importing it takes longer than many blocks)
+        import scipy.signal
+
+    def is_static(self) -> bool:
+        """
+        Returns whether the cutoff is fixed, in which case every voice shares the same section
+        :return: A boolean whether the cutoff does not follow the envelope
+        """
+        return self.envelope_amount == 0
+
+    def get_cutoff(self, level: float, fs: int) -> float:
+        """
+        Returns the cutoff at a gain of the envelope, within the range a section can be designed for
+        :param level: The gain of the envelope, range [0.0, 1.0]
+        :param fs: The sampling rate
+        :return: The cutoff frequency in Hz
+        """
+        cutoff = self.cutoff * 2 ** (self.envelope_amount * level)
+        return min(max(cutoff, MIN_CUTOFF), fs * MAX_CUTOFF)
+
+    def get_sections(self, fs: int, level: float = 0.0) -> np.ndarray:
+        """
+        Returns the second order section of the filter, in the format of scipy.signal.sosfilt
+        :param fs: The sampling rate
+        :param level: The gain of the envelope, ignored if the cutoff is fixed
+        :return: A (1 x 6) ndarray of the coefficients b0, b1, b2, a0, a1, a2, normalized so that a0 is 1
+        """
+        if not self.is_static():
+            return self.__design(self.get_cutoff(level, fs), fs)
+        if fs not in self.sections:
+            self.sections[fs] = self.__design(self.get_cutoff(0.0, fs), fs)
+        return self.sections[fs]
+
+    def process(self, samples: np.ndarray, state: np.ndarray, fs: int, level: float = 0.0):
+        """
+        Filters a block of samples of a single voice in place, carrying the state of the filter over to the next block
+        :param samples: A (samples,) float64 ndarray of the block, overwritten with the filtered block
+        :param state: A (1 x 2) float64 ndarray of the state of the filter of the voice, updated in place
+        :param fs: The sampling rate
+        :param level: The gain of the envelope at the start of the block
+        :return: None
+        """
+        # scipy was imported by the constructor already, so this merely looks it up
+        from scipy.signal import sosfilt
+        filtered, state[...] = sosfilt(self.get_sections(fs, level), samples, zi=state)
+        samples[...] = filtered
+
+    def process_batch(self, samples: np.ndarray, state: np.ndarray, fs: int, levels: np.ndarray):
+        """
+        Filters a block of samples of a batch of voices in place, carrying the state of every filter over to the
+        next block. If the cutoff is fixed, the whole batch is filtered by a single call
+        :param samples: A (voices x samples) float64 ndarray of the blocks, overwritten with the filtered blocks
+        :param state: A (1 x voices x 2) float64 ndarray of the states of the filters of the voices, updated in place
+        :param fs: The sampling rate
+        :param levels: A (voices,) ndarray of the gain of the envelope of every voice at the start of the block
+        :return: None
+        """
+        from scipy.signal import sosfilt
+        if self.is_static():
+            filtered, state[...] = sosfilt(self.get_sections(fs), samples, axis=1, zi=state)
+            samples[...] = filtered
+            return
+        # Voices at another point of their envelope have another section, but voices at the same gain (such as every
+        # voice held at the sustain level) share one, and are filtered together
+        values, groups = np.unique(levels, return_inverse=True)
+        for group, level in enumerate(values):
+            voices = np.flatnonzero(groups == group)
+            filtered, state[:, voices] = sosfilt(self.get_sections(fs, level), samples[voices], axis=1,
+                                                 zi=state[:, voices])
+            samples[voices] = filtered
+
+    def __design(self, cutoff: float, fs: int) -> np.ndarray:
+        """
+        Designs the second order section of the filter for a cutoff
+        :param cutoff: The cutoff frequency in Hz
+        :param fs: The sampling rate
+        :return: A (1 x 6) ndarray of the normalized coefficients of the section
+        """
+        w0 = 2 * math.pi * cutoff / fs
+        cos = math.cos(w0)
+        alpha = math.sin(w0) / (2 * self.resonance)
+        if self.filter_type == "lowpass":
+            b = ((1 - cos) / 2, 1 - cos, (1 - cos) / 2)
+        elif self.filter_type == "highpass":
+            b = ((1 + cos) / 2, -(1 + cos), (1 + cos) / 2)
+        else:
+            # A band-pass filter with a gain of 1 at its center frequency
+            b = (alpha, 0.0, -alpha)
+        a0 = 1 + alpha
+        return np.array([[b[0] / a0, b[1] / a0, b[2] / a0, 1.0, -2 * cos / a0, (1 - alpha) / a0]])
@@ -0,0 +1,208 @@
+import numpy as np
+from classes.wave import Wave
+from classes.wave_types import WaveTypes
+from config import NOISE_MODE, NOISE_SEED, NOISE_LOOP_LENGTH
+
+# The ways noise waves can be generated
+NOISE_MODES = ["generator", "loop"]
+# The wave types which are noise, these do not repeat, so they are never held by a wavetable
+NOISE_WAVES = {WaveTypes.WHITE_NOISE, WaveTypes.PINK_NOISE}
+# The coefficients of the filter turning white noise into pink noise (falling by 3dB per octave),
+# an approximation by Julius O. Smith which is accurate within 0.3dB over the audible range
+PINK_NOISE_B = np.array([0.049922035, -0.095993537, 0.050612699, -0.004408786])
+PINK_NOISE_A = np.array([1.0, -2.494956002, 2.017265875, -0.522189400])
+# The gain of pink noise, the filter leaves it far quieter than white noise, this brings it to an RMS of about 0.3,
+# so that its peaks rarely exceed those of the other waves
+PINK_NOISE_GAIN = 6.0
+
+# The noise buffers played in a loop, keyed by their wave type
+_noise_loops: dict[WaveTypes, np.ndarray] = {}
+
+
+class NoiseGenerator:
+    """
+    A class representing a noise generator (a source of white or pink noise, rendered block by block)
+
+    In the "generator" mode, every block is drawn from a numpy.random.Generator straight into a preallocated buffer.
+    Pink noise is white noise run through a filter whose state is carried from one block to the next.
+    In the "loop" mode, blocks are sliced out of a precomputed buffer of NOISE_LOOP_LENGTH samples shared by every
+    generator, which merely costs a copy (if anything), every generator starting at another point of the buffer
+
+    A voice reseeds its noise generators with the seed of every note it plays (see get_note_seed), so a note always
+    sounds the same, regardless of the voice, the process or the order it is rendered in, while notes starting at
+    different samples have uncorrelated noise
+
+    Attributes
+    ----------
+    wave_type : WaveTypes
+        The type of noise, one of NOISE_WAVES
+    mode : str
+        How the noise is generated, one of NOISE_MODES
+    rng : numpy.random.Generator
+        The random generator of the noise, seeded from NOISE_SEED
+    state : ndarray
+        The state of the pink noise filter at the end of the last block
+    loop : ndarray
+        The noise buffer played in a loop, None unless the mode is "loop"
+    position : int
+        The position of the next sample within the loop
+    buffer : ndarray
+        The buffer every block is generated into
+
+    Methods
+    -------
+    generate_block(n)
+        Generates the next n samples of noise
+    reset(seed)
+        Starts the noise over from the given seed
+    """
+    # Noise generators belong to the preallocated voices of the voice pool, so they are kept compact
+    __slots__ = ("wave_type", "mode", "rng", "state", "loop", "position", "buffer")
+
+    def __init__(self, wave_type: WaveTypes, mode: str = NOISE_MODE, seed: np.random.SeedSequence | None = None):
+        """
+        Constructs the object
+        :param wave_type: The type of noise, one of NOISE_WAVES
+        :param mode: How the noise is generated, one of NOISE_MODES
+        :param seed: The seed of the noise, NOISE_SEED if unspecified
+        """
+        if wave_type not in NOISE_WAVES:
+            # If the wave type is not noise, raise an exception
+            raise Exception("Invalid Noise Type")
+        if mode not in NOISE_MODES:
+            # If the mode is not recognized, raise an exception
+            raise Exception("Invalid Noise Mode")
+        self.wave_type = wave_type
+        self.mode = mode
+        self.state = np.zeros(len(PINK_NOISE_A) - 1)
+        self.loop = get_noise_loop(wave_type) if mode == "loop" else None
+        self.buffer = np.empty(0)
+        self.reset(np.random.SeedSequence(NOISE_SEED) if seed is None else seed)
+
+    def reset(self, seed: np.random.SeedSequence):
+        """
+        Starts the noise over from the given seed, as if the generator was constructed with it
+        :param seed: The seed of the noise
+        :return: None
+        """
+        self.rng = np.random.default_rng(seed)
+        self.state.fill(0.0)
+        # Every seed plays the loop from another point, so that voices playing at once do not cancel out
+        self.position = int(self.rng.integers(NOISE_LOOP_LENGTH)) if self.mode == "loop" else 0
+
+    def generate_block(self, n: int) -> np.ndarray:
+        """
+        Generates the next n samples of noise
+        :param n: The number of samples to generate
+        :return: A float64 ndarray of n samples, which is only valid until the next block is generated
+            and must not be modified
+        """
+        if n > len(self.buffer):
+            # The block is larger than the buffer, grow it
+            self.buffer = np.empty(n)
+        if self.mode == "loop":
+            return self.__generate_loop(n)
+        out = self.buffer[:n]
+        # Uniform white noise in the range [-1.0, 1.0)
+        self.rng.random(out=out)
+        out *= 2.0
+        out -= 1.0
+        if self.wave_type == WaveTypes.PINK_NOISE:
+            # scipy was imported along with the preset (see prepare_noise), so this merely looks it up
+            from scipy.signal import lfilter
+            filtered, self.state[...] = lfilter(PINK_NOISE_B, PINK_NOISE_A, out, zi=self.state)
+            np.multiply(filtered, PINK_NOISE_GAIN, out=out)
+        return out
+
+    def __generate_loop(self, n: int) -> np.ndarray:
+        """
+        Returns the next n samples of the noise loop
+        :param n: The number of samples to return
+        :return: A float64 ndarray of n samples, a view into the loop unless the block wraps around its end
+        """
+        start = self.position
+        self.position = (start + n) % len(self.loop)
+        if start + n <= len(self.loop):
+            return self.loop[start:start + n]
+        # The block wraps around the end of the loop, so it is copied together from its pieces
+        out = self.buffer[:n]
+        first = len(self.loop) - start
+        out[:first] = self.loop[start:]
+        remaining = n - first
+        while remaining > 0:
+            # Blocks longer than the loop wrap around more than once
+            size = min(remaining, len(self.loop))
+            out[n - remaining:n - remaining + size] = self.loop[:size]
+            remaining -= size
+        return out
+
+
+def get_note_seed(wave_type: WaveTypes, frequency: float, onset: int) -> np.random.SeedSequence:
+    """
+    Returns the seed of the noise of a note, derived from NOISE_SEED and the note itself, so that every note has
+    a stream of noise of its own, which is the same whenever the note is played
+    :param wave_type: The type of noise, one of NOISE_WAVES
+    :param frequency: The frequency of the note
+    :param onset: The sample at which the note starts, so that notes of the same pitch have uncorrelated noise
+    :return: The SeedSequence of the noise of the note
+    """
+    # The hash of a string differs between processes, so the type is identified by its position in the enum,
+    # and the frequency by its bits
+    return np.random.SeedSequence([NOISE_SEED, list(WaveTypes).index(wave_type),
+                                   int(np.float64(frequency).view(np.uint64)), onset])
+
+
+def generate_noise(wave_type: WaveTypes, shape, seed: int = NOISE_SEED) -> np.ndarray:
+    """
+    Generates noise of the given shape, without the state of a noise generator
+    This is used where waves are evaluated as a whole (such as Wave.evaluate), pink noise is filtered along the
+    last axis, each row starting from silence
+    :param wave_type: The type of noise, one of NOISE_WAVES
+    :param shape: The shape of the noise
+    :param seed: The seed of the noise, the same seed always generates the same noise
+    :return: A float64 ndarray of noise
+    """
+    noise = np.random.default_rng(seed).uniform(-1.0, 1.0, shape)
+    if wave_type == WaveTypes.PINK_NOISE:
+        from scipy.signal import lfilter
+        noise = lfilter(PINK_NOISE_B, PINK_NOISE_A, noise) * PINK_NOISE_GAIN
+    return noise
+
+
+def get_noise_loop(wave_type: WaveTypes) -> np.ndarray:
+    """
+    Returns the noise buffer of the given type played in a loop, computing it if it was not computed yet
+    :param wave_type: The type of noise, one of NOISE_WAVES
+    :return: A read-only float64 ndarray of NOISE_LOOP_LENGTH samples of noise
+    """
+    if wave_type not in _noise_loops:
+        rng = np.random.default_rng(NOISE_SEED)
+        noise = rng.uniform(-1.0, 1.0, NOISE_LOOP_LENGTH)
+        if wave_type == WaveTypes.PINK_NOISE:
+            from scipy.signal import lfilter
+            # Filter the noise twice in a row, and keep the second pass, so that the loop starts where it ends
+            # (the filter has settled by then, and its state carries over from the end of the first pass)
+            _, state = lfilter(PINK_NOISE_B, PINK_NOISE_A, noise, zi=np.zeros(len(PINK_NOISE_A) - 1))
+            noise, _ = lfilter(PINK_NOISE_B, PINK_NOISE_A, noise, zi=state)
+            noise *= PINK_NOISE_GAIN
+        # The loop is shared by every noise generator, so it must never be modified
+        noise.flags.writeable = False
+        _noise_loops[wave_type] = noise
+    return _noise_loops[wave_type]
+
+
+def prepare_noise(waves: [Wave]):
+    """
+    Prepares everything the noise waves of the given wave preset need, so that nothing is prepared when a note is played
+    These are the noise loops in the "loop" mode, and scipy for pink noise in the "generator" mode
+    :param waves: The wave preset
+    :return: None
+    """
+    for wave in waves:
+        if wave.wave_type not in NOISE_WAVES:
+            continue
+        if NOISE_MODE == "loop":
+            get_noise_loop(wave.wave_type)
+        elif wave.wave_type == WaveTypes.PINK_NOISE:
+            # Importing scipy takes longer than many blocks, so it must not happen on the audio engine thread
+            import scipy.signal
@@ -0,0 +1,194 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from classes.envelope import Envelope
+from classes.filter import Filter
+from classes.sound_generator import SoundGenerator
+from classes.wave import Wave
+from classes.wave_generator import WaveGenerator
+from config import BITRATE, NOTE_CACHE_SIZE
+
+
+class NoteCache:
+    """
+    A class representing a cache of rendered notes (an LRU cache of the complete samples of notes of a fixed length)
+
+    Songs repeat the same notes constantly, so instead of synthesizing every occurrence of a note from scratch,
+    the note is rendered once, including its release tail, and every later occurrence plays the cached samples
+
+    Attributes
+    ----------
+    max_size : int
+        The maximum number of bytes of samples held by the cache, the least recently used notes are evicted beyond it
+    size : int
+        The number of bytes of samples currently held by the cache
+    notes : OrderedDict
+        The rendered notes, ordered from the least to the most recently used
+    hits : int
+        The number of notes which were found in the cache
+    misses : int
+        The number of notes which had to be rendered
+    evictions : int
+        The number of notes which were evicted to stay within max_size
+    fs : int
+        The sampling rate of the cache, read from config.py
+    lock : threading.Lock
+        The lock guarding the cache, as notes are requested both by the audio engine and by other threads
+
+    Methods
+    -------
+    get(waves, envelope, frequency, duration, sound_filter)
+        Returns the rendered samples of a note, rendering it if it is not cached
+    lookup(waves, envelope, frequency, duration, sound_filter)
+        Returns the rendered samples of a note if it is cached, without rendering it
+    get_statistics()
+        Returns the hit/miss statistics of the cache
+    clear()
+        Empties the cache
+    """
+
+    def __init__(self, max_size: int = NOTE_CACHE_SIZE):
+        """
+        Constructs the object
+        :param max_size: The maximum number of bytes of samples held by the cache
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.notes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fs = BITRATE
+        self.lock = threading.Lock()
+
+    def get(self, waves: [Wave], envelope: Envelope, frequency: float, duration: int,
+            sound_filter: Filter | None = None) -> np.ndarray:
+        """
+        Returns the rendered samples of a note, rendering it if it is not cached
+        :param waves: The wave preset of the note
+        :param envelope: The envelope preset of the note
+        :param frequency: The frequency of the note
+        :param duration: The number of samples the note is held for, before its release
+        :param sound_filter: The filter preset of the note, None if the note is not filtered
+        :return: A read-only float32 ndarray of the samples of the note, including its release tail
+        """
+        key = self.__key(waves, envelope, frequency, duration, sound_filter)
+        with self.lock:
+            samples = self.notes.get(key)
+            if samples is not None:
+                # Mark the note as the most recently used one
+                self.notes.move_to_end(key)
+                self.hits += 1
+                return samples
+            self.misses += 1
+        # Render the note outside of the lock, the same way a voice would play it
+        samples = NoteCache.__render(waves, envelope, frequency, duration / self.fs, sound_filter)
+        with self.lock:
+            if key not in self.notes:
+                self.notes[key] = samples
+                self.size += samples.nbytes
+            # Evict the least recently used notes until the cache fits within its limit
+            while self.size > self.max_size and len(self.notes) > 1:
+                _, evicted = self.notes.popitem(last=False)
+                self.size -= evicted.nbytes
+                self.evictions += 1
+            return self.notes[key]
+
+    def lookup(self, waves: [Wave], envelope: Envelope, frequency: float, duration: int,
+               sound_filter: Filter | None = None) -> np.ndarray | None:
+        """
+        Returns the rendered samples of a note if it is cached, without rendering it
+        This is used by the audio engine thread, which must not spend the time of many blocks on rendering a note
+        :param waves: The wave preset of the note
+        :param envelope: The envelope preset of the note
+        :param frequency: The frequency of the note
+        :param duration: The number of samples the note is held for, before its release
+        :param sound_filter: The filter preset of the note, None if the note is not filtered
+        :return: A read-only float32 ndarray of the samples of the note, None if the note is not cached
+        """
+        key = self.__key(waves, envelope, frequency, duration, sound_filter)
+        with self.lock:
+            samples = self.notes.get(key)
+            if samples is None:
+                self.misses += 1
+                return None
+            self.notes.move_to_end(key)
+            self.hits += 1
+            return samples
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the hit/miss statistics of the cache
+        :return: A dict of the number of hits, misses, evictions, cached notes and cached bytes, and the hit rate
+        """
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "notes": len(self.notes),
+                "bytes": self.size,
+                "hit_rate": self.hits / requests if requests > 0 else 0.0
+            }
+
+    def clear(self):
+        """
+        Empties the cache, the statistics are kept
+        :return: None
+        """
+        with self.lock:
+            self.notes.clear()
+            self.size = 0
+
+    def __key(self, waves: [Wave], envelope: Envelope, frequency: float, duration: int,
+              sound_filter: Filter | None) -> tuple:
+        """
+        Returns the key of a note in the cache, made of every parameter the samples of the note depend on
+        :param waves: The wave preset of the note
+        :param envelope: The envelope preset of the note
+        :param frequency: The frequency of the note
+        :param duration: The number of samples the note is held for, before its release
+        :param sound_filter: The filter preset of the note, if any
+        :return: A hashable tuple identifying the note
+        """
+        return (tuple((wave.wave_type, wave.offset, wave.amplitude, wave.phase) for wave in waves),
+                (envelope.a, envelope.d, envelope.s, envelope.r),
+                None if sound_filter is None else (sound_filter.filter_type, sound_filter.cutoff,
+                                                   sound_filter.resonance, sound_filter.envelope_amount),
+                frequency, duration, self.fs)
+
+    @staticmethod
+    def __render(waves: [Wave], envelope: Envelope, frequency: float, duration: float,
+                 sound_filter: Filter | None) -> np.ndarray:
+        """
+        Renders a note from its start until its release tail has faded out
+        :param waves: The wave preset of the note
+        :param envelope: The envelope preset of the note
+        :param frequency: The frequency of the note
+        :param duration: The duration of the note in seconds
+        :param sound_filter: The filter preset of the note, if any
+        :return: A read-only float32 ndarray of the samples of the note
+        """
+        sound_generator = SoundGenerator(envelope, WaveGenerator(waves, frequency), duration,
+                                         sound_filter=sound_filter)
+        blocks = []
+        while not sound_generator.is_finished():
+            # The block is only valid until the next one is generated, so it has to be copied
+            blocks.append(sound_generator.generate_block().copy())
+        samples = np.concatenate(blocks)
+        # The samples are shared by every occurrence of the note, so they must never be modified
+        samples.flags.writeable = False
+        return samples
+
+
+# The note cache shared by the entire program
+_note_cache = NoteCache()
+
+
+def get_note_cache() -> NoteCache:
+    """
+    Returns the shared note cache
+    :return: The NoteCache object of the program
+    """
+    return _note_cache
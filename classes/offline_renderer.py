@@ -0,0 +1,165 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from classes.audio_engine import AudioEngine
+from classes.audio_sink import NullSink
+from classes.note_cache import get_note_cache
+from classes.sequencer import Sequencer
+from classes.song import Song
+from config import BITRATE, BUFFER_SIZE, RENDER_SEGMENT_LENGTH
+
+
+class OfflineRenderer:
+    """
+    A class representing an offline renderer (renders a song to samples as fast as possible, without a speaker)
+
+    The song is rendered by an AudioEngine and a Sequencer exactly like real time playback,
+    however, the engine is never started, blocks are pulled from it as fast as they can be rendered
+
+    The song is split into segments of RENDER_SEGMENT_LENGTH seconds, which are rendered independently
+    (in parallel processes if more than one job is requested). Each segment renders the notes starting within it
+    until their release tails have faded out. The part of the segment within its own time range is written straight
+    into the shared output buffer, and the tail overlapping the following segments is mixed in afterwards, in order.
+    As the same segments are mixed in the same order regardless of the number of jobs,
+    a parallel render is bit-identical to a serial one
+
+    The tracks of a song are rendered by separate engines in a pool of threads (the NumPy kernels doing most of the
+    work release the GIL), and are mixed in the order of the tracks. Every track is rendered with its own voice pool
+
+    Attributes
+    ----------
+    song : Song
+        The song to be rendered
+    fs : int
+        The sampling rate of the renderer, read from config.py
+    cache_hits : int
+        The number of notes of the last render which were found in the note caches of the processes rendering it
+    cache_misses : int
+        The number of notes of the last render which had to be rendered
+
+    Methods
+    -------
+    render(jobs)
+        Renders the song into an array of samples
+    write_wav(path, samples)
+        Writes the given samples to a WAV file
+    """
+
+    def __init__(self, song: Song):
+        """
+        Constructs the object
+        :param song: The song to be rendered
+        """
+        self.song = song
+        self.fs = BITRATE
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def render(self, jobs: int = 1) -> np.ndarray:
+        """
+        Renders the song into an array of samples
+        :param jobs: The number of processes to render the segments of the song in, 1 renders in this process
+        :return: A float32 ndarray containing the entire song, including the release tails of the last notes
+        """
+        # Segments need every event of the song, so a lazy song is compiled in its entirety
+        for track in self.song.get_tracks():
+            track.get_events()
+        sequencer = Sequencer(self.song)
+        # Segments are a whole number of blocks long, so that every block lines up with the blocks of a single render
+        segment_length = max(round(RENDER_SEGMENT_LENGTH * self.fs / BUFFER_SIZE), 1) * BUFFER_SIZE
+        length = -(-sequencer.length // BUFFER_SIZE) * BUFFER_SIZE
+        segments = [(start, min(start + segment_length, length)) for start in range(0, length, segment_length)]
+        # The parts of the segments within their own time range are written into a buffer in shared memory
+        shared_memory = SharedMemory(create=True, size=max(length, 1) * np.dtype(np.float32).itemsize)
+        try:
+            output = np.ndarray((length,), dtype=np.float32, buffer=shared_memory.buf)
+            if jobs > 1:
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    results = list(executor.map(_render_segment, [sequencer.select(start, end) for start, end in segments],
+                                              [shared_memory.name] * len(segments), [length] * len(segments),
+                                              [start for start, _ in segments]))
+            else:
+                results = [_render_segment(sequencer.select(start, end), shared_memory.name, length, start)
+                           for start, end in segments]
+            tails = [tail for tail, _, _ in results]
+            # Every process has a note cache of its own, so the statistics of the render are summed up over the segments
+            self.cache_hits = sum(hits for _, hits, _ in results)
+            self.cache_misses = sum(misses for _, _, misses in results)
+            # Mix the tails of the segments into the song in order, the song lasts until the end of the longest tail
+            samples = np.zeros(max([length] + [end + len(tail) for (_, end), tail in zip(segments, tails)]),
+                               dtype=np.float32)
+            samples[:length] = output
+            del output
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+        for (_, end), tail in zip(segments, tails):
+            samples[end:end + len(tail)] += tail
+        return samples
+
+    def write_wav(self, path: str, samples: np.ndarray):
+        """
+        Writes the given samples to a WAV file
+        :param path: The path of the WAV file to write
+        :param samples: A ndarray of samples to write
+        :return: None
+        """
+        # scipy.io is only imported once a WAV file is written, as it takes long to import
+        from scipy.io import wavfile
+        # Samples are written as 32-bit float, so the file holds exactly what was rendered
+        wavfile.write(path, self.fs, samples.astype(np.float32))
+
+
+
+def _render_segment(sequencer: Sequencer, shared_memory_name: str, length: int,
+                    start: int) -> tuple[np.ndarray, int, int]:
+    """
+    Renders a single segment of a song, this is run in the worker processes of a parallel render
+    :param sequencer: The sequencer of the notes starting within the segment
+    :param shared_memory_name: The name of the shared memory holding the output buffer of the song
+    :param length: The length of the output buffer in samples
+    :param start: The sample of the song at which the segment starts
+    :return: The tail of the segment (the samples rendered past the end of the segment), and the number of note cache
+        hits and misses while rendering the segment
+    """
+    # A process renders one segment at a time, so the change of its statistics belongs to this segment
+    statistics = get_note_cache().get_statistics()
+    tracks = sequencer.get_tracks()
+    if len(tracks) > 1:
+        # Render every track of the segment in its own thread, and mix them in the order of the tracks
+        with ThreadPoolExecutor(max_workers=len(tracks)) as executor:
+            renders = list(executor.map(_render_sequencer, [sequencer.select_track(track) for track in tracks]))
+        samples = np.zeros(max(len(render) for render in renders), dtype=np.float32)
+        for render in renders:
+            samples[:len(render)] += render
+    else:
+        samples = _render_sequencer(sequencer)
+    # Write the part of the segment within its own time range straight into the output
+    shared_memory = SharedMemory(name=shared_memory_name)
+    try:
+        output = np.ndarray((length,), dtype=np.float32, buffer=shared_memory.buf)
+        core = min(sequencer.length, len(samples))
+        output[start:start + core] = samples[:core]
+        output[start + core:start + sequencer.length] = 0.0
+        del output
+    finally:
+        shared_memory.close()
+    end_statistics = get_note_cache().get_statistics()
+    return (samples[sequencer.length:], end_statistics["hits"] - statistics["hits"],
+            end_statistics["misses"] - statistics["misses"])
+
+
+def _render_sequencer(sequencer: Sequencer) -> np.ndarray:
+    """
+    Renders every note of a sequencer, until all of the release tails are over
+    :param sequencer: The sequencer to render
+    :return: A float32 ndarray of the rendered samples
+    """
+    # Use a private engine which is never started, so nothing is played and no thread is created
+    engine = AudioEngine(NullSink())
+    engine.add_sequencer(sequencer)
+    # Pull blocks from the engine until the sequencer and all of the release tails are over
+    blocks = []
+    while not engine.is_idle():
+        blocks.append(engine.render_block())
+    return np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0, dtype=np.float32)
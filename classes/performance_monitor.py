@@ -0,0 +1,133 @@
+import bisect
+import threading
+import numpy as np
+from config import BITRATE, BUFFER_SIZE, PERFORMANCE_HISTORY, LATE_BLOCK_THRESHOLD
+
+# The upper edges of the buckets of the render time histogram, as fractions of the duration of a block
+HISTOGRAM_EDGES = [0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0]
+
+
+class PerformanceMonitor:
+    """
+    A class representing a performance monitor (records how long the audio engine takes to render every block)
+
+    A block of block_size samples has to be rendered before the previous block has finished playing,
+    so its duration is the deadline of every block. A block is late when its render time comes close to the deadline
+    (beyond LATE_BLOCK_THRESHOLD of it), and it underruns when it misses the deadline, starving the speaker
+
+    Attributes
+    ----------
+    fs : int
+        The sampling rate of the monitored engine, read from config.py
+    block_size : int
+        The block size of the monitored engine, read from config.py unless it changes it
+    deadline : float
+        The duration of a single block in seconds
+    blocks : int
+        The number of blocks rendered since the monitor was reset
+    late_blocks : int
+        The number of blocks whose render time exceeded LATE_BLOCK_THRESHOLD of the deadline
+    underruns : int
+        The number of blocks whose render time exceeded the deadline
+    voices : int
+        The number of voices rendered in the last block
+    max_voices : int
+        The largest number of voices rendered in a single block
+    render_times : ndarray
+        The render times of the last PERFORMANCE_HISTORY blocks in seconds, as a ring buffer
+    histogram : [int]
+        The number of blocks in every bucket of HISTOGRAM_EDGES, the last bucket counts the blocks beyond every edge
+    lock : threading.Lock
+        The lock guarding the statistics, as they are read by other threads than the engine
+
+    Methods
+    -------
+    record(render_time, voices)
+        Records the render time of a block
+    get_statistics()
+        Returns the statistics of the recorded blocks
+    reset()
+        Discards every recorded block
+    set_block_size(block_size)
+        Changes the block size of the monitored engine
+    """
+
+    def __init__(self, block_size: int = BUFFER_SIZE):
+        """
+        Constructs the object
+        :param block_size: The size of the blocks rendered by the monitored engine
+        """
+        self.fs = BITRATE
+        self.block_size = block_size
+        self.deadline = block_size / self.fs
+        self.render_times = np.zeros(PERFORMANCE_HISTORY)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def record(self, render_time: float, voices: int):
+        """
+        Records the render time of a block
+        :param render_time: The time it took to render the block in seconds
+        :param voices: The number of voices rendered in the block
+        :return: None
+        """
+        load = render_time / self.deadline
+        with self.lock:
+            self.render_times[self.blocks % len(self.render_times)] = render_time
+            self.blocks += 1
+            self.voices = voices
+            self.max_voices = max(self.max_voices, voices)
+            self.histogram[bisect.bisect_left(HISTOGRAM_EDGES, load)] += 1
+            if load > 1.0:
+                self.underruns += 1
+            elif load > LATE_BLOCK_THRESHOLD:
+                self.late_blocks += 1
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the statistics of the recorded blocks
+        The average and maximum render times, and the headroom, cover the last PERFORMANCE_HISTORY blocks,
+        while the counters and the histogram cover every block since the monitor was reset
+        :return: A dict of the statistics, with times in seconds and the headroom as a fraction of the deadline
+        """
+        with self.lock:
+            recent = self.render_times[:min(self.blocks, len(self.render_times))]
+            average = float(np.mean(recent)) if len(recent) > 0 else 0.0
+            maximum = float(np.max(recent)) if len(recent) > 0 else 0.0
+            return {
+                "blocks": self.blocks,
+                "deadline": self.deadline,
+                "average_render_time": average,
+                "max_render_time": maximum,
+                # The headroom is the part of the deadline left over, in the worst recent block
+                "headroom": 1.0 - maximum / self.deadline,
+                "voices": self.voices,
+                "max_voices": self.max_voices,
+                "late_blocks": self.late_blocks,
+                "underruns": self.underruns,
+                "histogram": list(zip(HISTOGRAM_EDGES + [np.inf], self.histogram))
+            }
+
+    def set_block_size(self, block_size: int):
+        """
+        Changes the block size of the monitored engine, the blocks recorded from then on have its deadline
+        :param block_size: The new block size
+        :return: None
+        """
+        with self.lock:
+            self.block_size = block_size
+            self.deadline = block_size / self.fs
+
+    def reset(self):
+        """
+        Discards every recorded block
+        :return: None
+        """
+        with self.lock:
+            self.blocks = 0
+            self.late_blocks = 0
+            self.underruns = 0
+            self.voices = 0
+            self.max_voices = 0
+            self.histogram = [0] * (len(HISTOGRAM_EDGES) + 1)
+            self.render_times.fill(0.0)
@@ -0,0 +1,166 @@
+import threading
+import numpy as np
+from config import BUFFER_SIZE, RING_BUFFER_BLOCKS
+
+
+class RingBuffer:
+    """
+    A class representing a ring buffer of blocks (a preallocated queue between a single producer and a single consumer)
+
+    Blocks may be shorter than block_size, so the block size of the producer can change while the buffer is in use
+
+    The producer renders straight into the next free block and commits it, the consumer reads the oldest block
+    and releases it, so no block is ever copied or allocated. Each index is only ever written by one side, and is
+    only advanced once the block it covers is complete, so neither side needs a lock: the producer sees a block as
+    free only after the consumer has released it, and the consumer sees a block as ready only after it was committed
+
+    A side which has to wait for the other one is woken up by an event as soon as a block is committed or released,
+    so neither side polls
+
+    Attributes
+    ----------
+    capacity : int
+        The number of blocks the buffer holds
+    block_size : int
+        The largest number of samples of a block
+    blocks : ndarray
+        The (capacity x block_size) float32 array holding the blocks
+    lengths : ndarray
+        The number of samples of every block
+    written : int
+        The number of blocks committed by the producer so far, only written by the producer
+    read : int
+        The number of blocks released by the consumer so far, only written by the consumer
+    underruns : int
+        The number of times the consumer found the buffer empty while it had to play, only written by the consumer
+    committed : threading.Event
+        Set whenever a block is committed, the consumer waits on it for blocks
+    released : threading.Event
+        Set whenever a block is released, the producer waits on it for space
+
+    Methods
+    -------
+    available()
+        Returns the number of blocks ready to be read
+    space()
+        Returns the number of blocks free to be written
+    write_block(n)
+        Returns the next free block for the producer to write into
+    commit()
+        Hands the block returned by write_block() over to the consumer
+    read_block()
+        Returns the oldest ready block for the consumer to read
+    release()
+        Hands the block returned by read_block() back to the producer
+    wait_for_blocks(count, timeout)
+        Waits until the given number of blocks is ready to be read
+    wait_for_space(timeout)
+        Waits until a block is free to be written
+    wake()
+        Wakes up both sides if they are waiting
+    """
+
+    def __init__(self, capacity: int = RING_BUFFER_BLOCKS, block_size: int = BUFFER_SIZE):
+        """
+        Constructs the object
+        :param capacity: The number of blocks the buffer holds
+        :param block_size: The largest number of samples of a block
+        """
+        if capacity < 1:
+            # A buffer without blocks could not pass anything on, raise an exception
+            raise Exception("Invalid Ring Buffer Capacity")
+        self.capacity = capacity
+        self.block_size = block_size
+        self.blocks = np.zeros((capacity, block_size), dtype=np.float32)
+        self.lengths = np.full(capacity, block_size)
+        self.written = 0
+        self.read = 0
+        self.underruns = 0
+        self.committed = threading.Event()
+        self.released = threading.Event()
+
+    def available(self) -> int:
+        """
+        Returns the number of blocks ready to be read
+        :return: The number of committed blocks which were not released yet
+        """
+        return self.written - self.read
+
+    def space(self) -> int:
+        """
+        Returns the number of blocks free to be written
+        :return: The number of blocks which can be committed before the buffer is full
+        """
+        return self.capacity - (self.written - self.read)
+
+    def write_block(self, n: int | None = None) -> np.ndarray:
+        """
+        Returns the next free block for the producer to write into, there must be space for it
+        :param n: The number of samples of the block, at most block_size, block_size if unspecified
+        :return: A float32 ndarray of n samples, a view into the buffer
+        """
+        slot = self.written % self.capacity
+        self.lengths[slot] = self.block_size if n is None else n
+        return self.blocks[slot, :self.lengths[slot]]
+
+    def commit(self):
+        """
+        Hands the block returned by write_block() over to the consumer
+        :return: None
+        """
+        self.written += 1
+        self.committed.set()
+
+    def read_block(self) -> np.ndarray:
+        """
+        Returns the oldest ready block for the consumer to read, a block must be available
+        :return: A float32 ndarray of the samples of the block, a view into the buffer
+        """
+        slot = self.read % self.capacity
+        return self.blocks[slot, :self.lengths[slot]]
+
+    def release(self):
+        """
+        Hands the block returned by read_block() back to the producer
+        :return: None
+        """
+        self.read += 1
+        self.released.set()
+
+    def wait_for_blocks(self, count: int = 1, timeout: float | None = None) -> bool:
+        """
+        Waits until the given number of blocks is ready to be read, until the timeout has passed,
+        or until wake() was called
+        :param count: The number of blocks to wait for
+        :param timeout: The longest time to wait in seconds, None to wait without a limit
+        :return: A boolean whether the blocks are ready
+        """
+        if self.available() >= count:
+            return True
+        # Clear the event before checking again, so that a block committed in between is not missed
+        self.committed.clear()
+        if self.available() < count:
+            self.committed.wait(timeout)
+        return self.available() >= count
+
+    def wait_for_space(self, timeout: float | None = None) -> bool:
+        """
+        Waits until a block is free to be written, until the timeout has passed, or until wake() was called
+        :param timeout: The longest time to wait in seconds, None to wait without a limit
+        :return: A boolean whether a block is free
+        """
+        if self.space() > 0:
+            return True
+        # Clear the event before checking again, so that a block released in between is not missed
+        self.released.clear()
+        if self.space() == 0:
+            self.released.wait(timeout)
+        return self.space() > 0
+
+    def wake(self):
+        """
+        Wakes up both sides if they are waiting, such as when the engine is killed
+        :return: None
+        """
+        self.committed.set()
+        self.released.set()
@@ -0,0 +1,252 @@
+import copy
+import threading
+import numpy as np
+from classes.noise import NOISE_WAVES
+from classes.note_cache import get_note_cache
+from classes.sound_generator import SoundGenerator
+from classes.voice_pool import VoicePool
+from config import BITRATE, USE_NOTE_CACHE
+
+
+class Sequencer:
+    """
+    A class representing a sequencer (converts the beats of a song into voices triggered at exact sample positions)
+
+    The sequencer plays the compiled note events of the song, in which every beat was already converted to
+    sample offsets. The AudioEngine advances the sequencer once per block,
+    and the sequencer returns the voices which start within that block, along with the sample they start at
+
+    If the song is lazy, its events are compiled in chunks while it plays, and only the current chunk is held
+
+    A sequencer played in real time never renders a whole note on the audio engine thread: the notes of every chunk
+    are rendered into the note cache by a background thread once the chunk is read, and a note which is not cached
+    (yet, or any more) is synthesized block by block instead, like a note played without the note cache
+
+    If the song has further tracks, the events of every track are merged into a single array sorted by onset,
+    and every voice is played with the presets of the track of its event
+
+    Attributes
+    ----------
+    events : ndarray
+        The compiled note events of the song (or the current chunk of them), a structured array of EVENT_DTYPE
+        sorted by onset
+    chunks : Iterator | None
+        The iterator over the remaining chunks of events of a lazy song, None once every chunk was read
+    song : Song | None
+        The song being sequenced, None for sequencers of a range of the song
+    length : int
+        The length of the song in samples (the end of the last beat), -1 until a lazy song was read to its end
+    presets : [([Wave], Envelope, Filter)]
+        The wave, envelope and filter presets of every track, used for the triggered voices of the track
+    cached : [bool]
+        Whether the notes of every track are played from the note cache, which the notes of a wave preset
+        containing noise never are, as the noise of every note is seeded with its onset
+    fs : int
+        The sampling rate of the sequencer, read from config.py
+    position : int
+        The current position of the sequencer in samples
+    origin : int
+        The sample of the song at which the sequencer starts, the onsets of its events are relative to it
+    index : int
+        The index of the next event to be triggered
+    stopped : bool
+        Whether the sequencer was stopped before reaching the end of the song
+    realtime : bool
+        Whether the sequencer is played by the audio engine thread in real time, rather than rendered offline
+
+    Methods
+    -------
+    prepare()
+        Renders every distinct note of the song into the note cache ahead of playback
+    advance(block_size, pool)
+        Advances the sequencer by a block and plays the notes starting within it on voices of the pool
+    select(start, end)
+        Returns a sequencer of only the events starting within the given range of samples
+    select_track(track)
+        Returns a sequencer of only the events of the given track
+    get_tracks()
+        Returns the tracks which have events in the sequencer
+    stop()
+        Stops the sequencer
+    is_finished()
+        Returns whether the sequencer has reached the end of the song or was stopped
+    """
+
+    def __init__(self, song, realtime: bool = False):
+        """
+        Constructs the object
+        :param song: The Song whose beats should be sequenced
+        :param realtime: Whether the sequencer is played by the audio engine thread in real time
+        """
+        self.fs = BITRATE
+        self.song = song
+        tracks = song.get_tracks()
+        self.presets = [(track.get_wave_preset(), track.get_envelope_preset(), track.get_filter_preset())
+                        for track in tracks]
+        self.cached = [USE_NOTE_CACHE and not any(wave.wave_type in NOISE_WAVES for wave in waves)
+                       for waves, _, _ in self.presets]
+        if len(tracks) == 1:
+            # The events are compiled once per song, and shared by every sequencer of the song,
+            # unless the song is lazy, in which case they are compiled chunk by chunk as the song plays
+            self.chunks = song.iter_events()
+            self.events = next(self.chunks)
+            self.length = song.length
+        else:
+            # Merge the events of every track, keeping the events of the same onset in the order of their tracks
+            events = np.concatenate([track.get_events() for track in tracks])
+            events["track"] = np.repeat(np.arange(len(tracks)), [len(track.get_events()) for track in tracks])
+            self.events = events[np.argsort(events["onset"], kind="stable")]
+            self.chunks = None
+            # The song lasts until the end of its longest track
+            self.length = max(track.length for track in tracks)
+        # The sequencer starts at the beginning of the song
+        self.position = 0
+        self.origin = 0
+        self.index = 0
+        self.stopped = False
+        self.realtime = realtime
+
+    def prepare(self):
+        """
+        Renders every distinct note of the song into the note cache ahead of playback,
+        so that the audio engine does not have to render them while playing
+        Only the notes of the first chunk of a lazy song are rendered, the notes of the further chunks are rendered
+        in the background as the chunks are read
+        :return: None
+        """
+        self.__prepare_events(self.events)
+
+    def advance(self, block_size: int, pool: VoicePool) -> [(int, SoundGenerator)]:
+        """
+        Advances the sequencer by a block and plays the notes starting within it on voices of the pool
+        :param block_size: The size of the block in samples
+        :param pool: The voice pool to play the notes on
+        :return: A list of tuples of (offset within the block, SoundGenerator) for every note starting in the block
+        """
+        voices = []
+        if self.stopped:
+            return voices
+        end = self.position + block_size
+        while True:
+            # Trigger every event whose onset falls within this block, the events are sorted by onset
+            last = self.index + int(np.searchsorted(self.events["onset"][self.index:], end))
+            for onset, frequency, duration, track in self.events[self.index:last].tolist():
+                voices.append((onset - self.position, self.__create_voice(frequency, duration, track, onset, pool)))
+            self.index = last
+            if last < len(self.events) or self.chunks is None:
+                break
+            # Every event of the chunk was triggered, the block may contain events of the next chunk
+            events = next(self.chunks, None)
+            if events is None:
+                # Every chunk was read, so the length of the song is known now
+                self.chunks = None
+                self.length = self.song.length
+            else:
+                self.events = events
+                self.index = 0
+                if self.realtime and USE_NOTE_CACHE:
+                    # Render the notes of the chunk outside of the audio engine thread, the notes starting before
+                    # they are rendered are synthesized
+                    threading.Thread(target=self.__prepare_events, args=(events,), daemon=True).start()
+        self.position = end
+        return voices
+
+    def select(self, start: int, end: int):
+        """
+        Returns a sequencer of only the events starting within the given range of samples
+        The selected sequencer starts at the start of the range, and its song ends at the end of the range
+        :param start: The first sample of the range
+        :param end: The sample after the last sample of the range
+        :return: A new Sequencer, whose onsets are relative to the start of the range
+        """
+        selected = copy.copy(self)
+        # The selected sequencer holds every event of the range, so it needs neither the song nor further chunks
+        selected.song = None
+        selected.chunks = None
+        # The events are sorted by onset, so the range can be found by bisection
+        first, last = np.searchsorted(self.events["onset"], [start, end])
+        selected.events = self.events[first:last].copy()
+        selected.events["onset"] -= start
+        selected.length = end - start
+        selected.origin = self.origin + start
+        selected.position = 0
+        selected.index = 0
+        selected.stopped = False
+        return selected
+
+    def select_track(self, track: int):
+        """
+        Returns a sequencer of only the events of the given track
+        :param track: The index of the track
+        :return: A new Sequencer, which starts where this sequencer is
+        """
+        selected = copy.copy(self)
+        selected.song = None
+        selected.chunks = None
+        # Only the events which were not triggered yet are kept
+        events = self.events[self.index:]
+        selected.events = events[events["track"] == track]
+        selected.index = 0
+        return selected
+
+    def get_tracks(self) -> [int]:
+        """
+        Returns the tracks which have events in the sequencer
+        :return: A sorted list of the indices of the tracks
+        """
+        return np.unique(self.events["track"]).tolist()
+
+    def stop(self):
+        """
+        Stops the sequencer, notes which are already playing are left to finish
+        :return: None
+        """
+        self.stopped = True
+
+    def is_finished(self):
+        """
+        Returns whether the sequencer has reached the end of the song or was stopped
+        :return: A boolean whether the sequencer has finished
+        """
+        return self.stopped or (self.chunks is None and self.index >= len(self.events) and self.position >= self.length)
+
+    def __prepare_events(self, events: np.ndarray):
+        """
+        Renders every distinct note of the given events into the note cache
+        :param events: A structured array of EVENT_DTYPE
+        :return: None
+        """
+        if not USE_NOTE_CACHE:
+            return
+        for track, frequency, duration in set(zip(events["track"].tolist(), events["frequency"].tolist(),
+                                                  events["duration"].tolist())):
+            if not self.cached[track]:
+                continue
+            waves, envelope, sound_filter = self.presets[track]
+            get_note_cache().get(waves, envelope, frequency, duration, sound_filter)
+
+    def __create_voice(self, frequency: float, duration: int, track: int, onset: int,
+                       pool: VoicePool) -> SoundGenerator:
+        """
+        Plays the given note on a voice of the pool
+        :param frequency: The frequency of the note to play
+        :param duration: The duration of the note in samples
+        :param track: The track of the note, whose presets the note is played with
+        :param onset: The sample at which the note starts, relative to the origin of the sequencer
+        :param pool: The voice pool to play the note on
+        :return: The SoundGenerator playing the note
+        """
+        waves, envelope, sound_filter = self.presets[track]
+        if self.cached[track]:
+            # Play the note from the note cache, in real time a note which is not cached is not rendered,
+            # as rendering it whole would take the time of many blocks
+            if self.realtime:
+                rendered = get_note_cache().lookup(waves, envelope, frequency, duration, sound_filter)
+            else:
+                rendered = get_note_cache().get(waves, envelope, frequency, duration, sound_filter)
+            if rendered is not None:
+                return pool.acquire(envelope, waves, frequency, rendered=rendered)
+        # Otherwise, synthesize the note, its noise is seeded with its onset within the whole song, so that every
+        # segment of a parallel render plays the same noise
+        return pool.acquire(envelope, waves, frequency, duration / self.fs, sound_filter=sound_filter,
+                            onset=self.origin + onset)
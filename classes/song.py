@@ -1,18 +1,35 @@
-import threading
-
-from classes.sound_generator import SoundGenerator
+import numpy as np
+from classes.audio_engine import get_audio_engine
 from classes.envelope import Envelope
+from classes.filter import Filter
+from classes.sequencer import Sequencer
 from classes.wave import Wave
-from classes.wave_generator import WaveGenerator
-from config import DEFAULT_WAVE_PRESET, DEFAULT_ENVELOPE_PRESET
+from config import BITRATE, DEFAULT_WAVE_PRESET, DEFAULT_ENVELOPE_PRESET, DEFAULT_FILTER_PRESET, SONG_CHUNK_SIZE
 from util import frequency_from_note, get_beat_length
-import time
+
+# The layout of a compiled note event, times are expressed in samples
+# The layout is fixed width and little endian, so compiled songs can be memory mapped straight from their file
+EVENT_DTYPE = np.dtype([
+    ("onset", "<i8"),  # The sample at which the note starts
+    ("frequency", "<f8"),  # The frequency of the note
+    ("duration", "<i8"),  # The number of samples the note is held for, before its release
+    ("track", "<i4")  # The track the note belongs to
+])
 
 
-class Song(threading.Thread):
+class Song:
     """
     A class representing a song (a collection of beats)
 
+    Playback is done by a Sequencer running inside the AudioEngine, which triggers every note at its exact sample,
+    so the song itself does not need a thread
+
+    A song may have further tracks, each a Song with its own presets, which are sequenced along with the song
+    against the same sample clock
+
+    A song may be lazy, in which case its beats are not held in memory, but streamed anew for every playback
+    and compiled in chunks of SONG_CHUNK_SIZE beats as the song plays
+
     Attributes
     ----------
     title : str
@@ -21,16 +38,31 @@ class Song(threading.Thread):
         A list of beats, where each beat is a list of notes, where each note is a tuple of (note, duration)
         A notable exception are pauses, which are represented as a single note with a note of "0"
         and a duration of the pause
+        Empty if the song is lazy
+    stream : Callable | None
+        A function returning a new iterator over the beats of the song if the song is lazy, None otherwise
     bpm : int
         The beats per minute measure of the song
     waves : [Wave]
         The wave preset which will be used for the song
     env : Envelope
         The envelope preset which will be used for the song
-    playing : bool
-        Whether the song is currently playing
-    active : bool
-        Whether the song thread is active
+    filter : Filter
+        The filter preset which will be used for the song, None if the notes are not filtered
+    default_wave : bool
+        Whether the song uses the default wave preset, as it specifies none of its own
+    default_envelope : bool
+        Whether the song uses the default envelope preset, as it specifies none of its own
+    tracks : [Song]
+        The further tracks played along with the song
+    sequencer : Sequencer
+        The sequencer of the current playback, None if the song was never played
+    events : ndarray
+        The compiled note events of the song, a structured array of EVENT_DTYPE sorted by onset,
+        None until the song is compiled
+    length : int
+        The length of the song in samples (the end of the last beat), -1 until the song is compiled
+        (or, if the song is lazy, until it has been streamed to its end)
 
     Methods
     -------
@@ -42,23 +74,42 @@ class Song(threading.Thread):
         Sets the wave preset to the given Wave list
     get_wave_preset()
         Returns the current wave preset
+    uses_default_wave_preset()
+        Returns whether the song uses the default wave preset
     set_envelope_preset(envelope)
         Sets the envelope preset to the given Envelope
     get_envelope_preset()
         Returns the current envelope preset
+    uses_default_envelope_preset()
+        Returns whether the song uses the default envelope preset
+    set_filter_preset(sound_filter)
+        Sets the filter preset to the given Filter
+    get_filter_preset()
+        Returns the current filter preset
     is_playing()
         Returns whether the song is currently playing
-    start_playback()
-        Begins playing the song
-    stop_playback()
-        Stops playing the song
+    add_track(track)
+        Adds a further track to be played along with the song
+    get_tracks()
+        Returns every track of the song, starting with the song itself
+    get_events()
+        Returns the compiled note events of the song, compiling the song if it was not compiled yet
+    iter_events()
+        Returns an iterator over the compiled note events of the song, in chunks
+    kill()
+        Stops playing the song for good
     """
 
     def __init__(self, title: str,
                  beats: [[(str, float)]],
                  bpm: int = 100,
                  wave: [Wave] = None,
-                 envelope: Envelope | None = None):
+                 envelope: Envelope | None = None,
+                 stream=None,
+                 events: np.ndarray | None = None,
+                 length: int = -1,
+                 tracks=None,
+                 sound_filter: Filter | None = None):
         """
         Constructs the object
 
@@ -70,40 +121,47 @@ class Song(threading.Thread):
         :param bpm: The beats per minute measure of the song
         :param wave: The wave preset which will be used for the song
         :param envelope: The envelope preset which will be used for the song
+        :param stream: A function returning a new iterator over the beats of the song, if specified the song is lazy
+            and beats is ignored
+        :param events: The compiled note events of the song, if the song was already compiled
+        :param length: The length of the song in samples, if the song was already compiled
+        :param tracks: A list of further tracks (Song objects) to be played along with the song
+        :param sound_filter: The filter preset which will be used for the song
         """
         self.title = title
         self.waves = DEFAULT_WAVE_PRESET if wave is None else wave
         self.env = DEFAULT_ENVELOPE_PRESET if envelope is None else envelope
+        self.filter = DEFAULT_FILTER_PRESET if sound_filter is None else sound_filter
+        # Remember which presets are the defaults, as the preset objects themselves do not tell
+        # (a compiled song rebuilds them from its file)
+        self.default_wave = wave is None
+        self.default_envelope = envelope is None
         self.bpm = bpm
         self.beats = beats
-        self.playing = False
-        self.active = True
-        super().__init__()
-
-    def run(self):
-        """
-        The main loop of the thread, which plays the song, if the song is playing
-        :return: None
-        """
-        while self.active:
-            if self.playing:
-                self.__play()
-            else:
-                time.sleep(0.1)
+        self.stream = stream
+        self.tracks = [] if tracks is None else tracks
+        self.sequencer = None
+        # The song is compiled once it is first needed, unless it was loaded compiled
+        self.events = events
+        self.length = length
 
     def start_playback(self):
         """
         Tells the object to begin playback of the song
         :return: None
         """
-        self.playing = True
+        # Sequence the song with the current presets and let the audio engine play it
+        self.sequencer = Sequencer(self, realtime=True)
+        self.sequencer.prepare()
+        get_audio_engine().add_sequencer(self.sequencer)
 
     def stop_playback(self):
         """
         Tells the object to stop playback of the song
         :return: None
         """
-        self.playing = False
+        if self.sequencer is not None:
+            self.sequencer.stop()
 
     def set_wave_preset(self, wave: [Wave]):
         """
@@ -112,6 +170,7 @@ class Song(threading.Thread):
         :return: None
         """
         self.waves = wave
+        self.default_wave = False
 
     def get_wave_preset(self):
         """
@@ -120,6 +179,13 @@ class Song(threading.Thread):
         """
         return self.waves
 
+    def uses_default_wave_preset(self) -> bool:
+        """
+        Returns whether the song uses the default wave preset, as it specifies none of its own
+        :return: A boolean whether the wave preset is the default one
+        """
+        return self.default_wave
+
     def set_envelope_preset(self, envelope):
         """
         Sets the envelope preset to the given Envelope
@@ -127,6 +193,7 @@ class Song(threading.Thread):
         :return: None
         """
         self.env = envelope
+        self.default_envelope = False
 
     def get_envelope_preset(self):
         """
@@ -135,53 +202,112 @@ class Song(threading.Thread):
         """
         return self.env
 
+    def uses_default_envelope_preset(self) -> bool:
+        """
+        Returns whether the song uses the default envelope preset, as it specifies none of its own
+        :return: A boolean whether the envelope preset is the default one
+        """
+        return self.default_envelope
+
+    def set_filter_preset(self, sound_filter: Filter | None):
+        """
+        Sets the filter preset to the given Filter
+        :param sound_filter: The Filter to set the filter preset to, None to not filter the notes
+        :return: None
+        """
+        self.filter = sound_filter
+
+    def get_filter_preset(self):
+        """
+        Returns the current filter preset
+        :return: A Filter object representing the current filter preset of the song, None if there is none
+        """
+        return self.filter
+
     def is_playing(self):
         """
         Returns whether the song is currently playing
         :return: A boolean whether the song is currently playing
         """
-        return self.playing
+        return self.sequencer is not None and not self.sequencer.is_finished()
 
-    def kill(self):
+    def add_track(self, track):
         """
-        Kills the song thread
+        Adds a further track to be played along with the song
+        :param track: The Song to play along with the song, with its own presets
         :return: None
         """
-        self.active = False
+        self.tracks.append(track)
 
-    def __play(self):
+    def get_tracks(self) -> list:
         """
-        The main loop of the playback, which plays the song
-        :return: None
+        Returns every track of the song, starting with the song itself, tracks of tracks are included as well
+        :return: A list of Song objects, the index of a track in it is the track of its events when sequenced
         """
-        for beat in self.beats:
-            if not self.playing:  # If self.playing is no longer True, it means we must stop
-                break
-            if beat[0][0] == "0":  # 0 indicates that this is a pause
-                time.sleep(60 / self.bpm * beat[0][1])  # Pause for the time specified
-                continue
-            self.__play_beat(beat)  # Otherwise, play the notes in the beat
-            # The shortest note in the beat should indicate the time until the next beat should be played
-            time.sleep(60 / self.bpm * get_beat_length(beat))
-        self.playing = False  # Once the song is done, change self.playing to false as we are done
-
-    def __play_beat(self, beat):
-        """
-        Plays the notes in the given beat
-        :param beat: An array of tuples containing notes and the length they should be played
-        :return: None
+        tracks = [self]
+        for track in self.tracks:
+            tracks.extend(track.get_tracks())
+        return tracks
+
+    def get_events(self) -> np.ndarray:
+        """
+        Returns the compiled note events of the song, compiling the song if it was not compiled yet
+        Only the events of the song itself are returned, the events of its further tracks are not included
+        Compiling converts every note string into a frequency, and every beat into sample positions, once,
+        so that playback only has to iterate over a dense array
+        A lazy song is streamed in its entirety to compile it, after which its events are kept
+        :return: A structured ndarray of EVENT_DTYPE, sorted by onset
         """
-        for note in beat:
-            self.__play_note(note[0], note[1] * (60 / self.bpm)) # Play the note for the specified length
+        if self.events is None:
+            self.events = np.concatenate(list(self.__compile(self.beats if self.stream is None else self.stream())))
+        return self.events
 
-    def __play_note(self, note, duration):
+    def iter_events(self):
         """
-        Plays the given note for the given duration
-        :param note: A string representing the note to play
-        :param duration: A float representing the duration to play the note for
+        Returns an iterator over the compiled note events of the song, in chunks
+        Unless the song is lazy (and was not compiled in its entirety yet), the only chunk is every event of the song,
+        otherwise the beats are streamed and compiled SONG_CHUNK_SIZE beats at a time
+        :return: An iterator of structured ndarrays of EVENT_DTYPE, sorted by onset
+        """
+        if self.stream is None or self.events is not None:
+            return iter([self.get_events()])
+        return self.__compile(self.stream())
+
+    def __compile(self, beats):
+        """
+        Compiles the given beats into note events, SONG_CHUNK_SIZE beats at a time
+        The length of the song is set once the last beat was compiled
+        :param beats: An iterable of the beats of the song
+        :return: A generator of structured ndarrays of EVENT_DTYPE, sorted by onset
+        """
+        # Length of a single beat in seconds
+        beat_duration = 60 / self.bpm
+        # Every note string is only converted into a frequency once
+        frequencies = {}
+        events = []
+        # The position is kept in beats so that no rounding error accumulates
+        position = 0.0
+        for count, beat in enumerate(beats, 1):
+            if beat[0][0] != "0":  # 0 indicates that this is a pause, which triggers nothing
+                onset = round(position * beat_duration * BITRATE)
+                for note, duration in beat:
+                    if note not in frequencies:
+                        frequencies[note] = frequency_from_note(note)
+                    events.append((onset, frequencies[note], round(duration * beat_duration * BITRATE), 0))
+                # The shortest note in the beat should indicate the time until the next beat should be played
+                position += get_beat_length(beat)
+            else:
+                position += beat[0][1]
+            if count % SONG_CHUNK_SIZE == 0:
+                yield np.array(events, dtype=EVENT_DTYPE)
+                events = []
+        self.length = round(position * beat_duration * BITRATE)
+        yield np.array(events, dtype=EVENT_DTYPE)
+
+    def kill(self):
+        """
+        Stops playing the song for good
         :return: None
         """
-        # Instantiate the SoundGenerator with the given envelope and wave preset
-        sound_generator = SoundGenerator(self.env, WaveGenerator(self.waves, frequency_from_note(note)), duration)
-        # Start the SoundGenerator thread which will begin playback
-        sound_generator.start()
+        self.stop_playback()
+
@@ -1,116 +1,258 @@
-import threading
 import numpy as np
-import soundcard as sc
 from config import BITRATE, BUFFER_SIZE, MAX_VOL
-from util import interpolate
 
 
-class SoundGenerator(threading.Thread):
+class SoundGenerator:
     """
-    A class representing a sound generator (a thread which produces a wave with a specific frequency)
+    A class representing a sound generator (a voice which produces a wave with a specific frequency)
+
+    Sound generators do not play anything on their own, they are submitted to the AudioEngine,
+    which renders them block by block and mixes them into its single output stream
 
     A SoundGenerator is "dead" when the key is released, after which it will run for r seconds (release time)
     in order to gradually fade out
 
+    Blocks are rendered into buffers preallocated by the sound generator, so rendering does not allocate memory
+
+    A sound generator may run its waveform through a filter before scaling it by the envelope, the state of the filter
+    is carried from one block to the next, and starts over with every note
+
+    A sound generator may also play a note which was already rendered in its entirety (by the NoteCache),
+    in which case it merely copies the rendered samples block by block
+
     Attributes
     ----------
-    dead_time : float
-        The time at which the sound generator died
+    dead_sample : int
+        The sample at which the sound generator died
     dead_volume : float
         The volume at which the sound generator died
     length : float
         The length of the sound generator in seconds, -1 if infinite
         This is mainly used for song playback
+    length_samples : int
+        The length of the sound generator in samples, -1 if infinite
     volume : float
-        The volume of the sound generator, range [0.0, 1.0]
+        The volume of the sound generator at the end of the last block, range [0.0, 1.0]
     fs : int
         The sampling rate of the sound generator, read from config.py
     block_size : int
         The block size of the sound generator, read from config.py
-    t : float
-        The current time of the sound generator
-    duration : float
-        The duration of each individual block
+    sample : int
+        The index of the next sample of the sound generator, counted from its start
     dead : bool
         Whether the sound generator is dead
+    finished : bool
+        Whether the sound generator has faded out completely and produces no more sound
+    delay : int
+        The number of samples the AudioEngine should wait before the sound generator starts playing
     envelope : Envelope
         The envelope of the sound generator
     waveGenerator : WaveGenerator
-        The wave generator of the sound generator
+        The wave generator of the sound generator, None if the sound generator plays rendered samples
+    rendered : ndarray
+        The rendered samples of the note played by the sound generator, None if the note is synthesized
+    sound_filter : Filter
+        The filter the waveform is run through, None if the waveform is not filtered
+    filter_state : ndarray
+        The (1 x 2) state of the filter at the end of the last block
+    generation : int
+        The number of times the sound generator was reset, a note started on a pooled sound generator
+        is identified by the sound generator along with its generation
+    gain_buffer, wave_buffer, output_buffer : ndarray
+        Buffers reused for every block
 
     Methods
     -------
-    run()
-        The main loop of the sound generator
-    stop()
+    generate_block(n)
+        Generates the next n samples
+    begin_block(n)
+        Prepares the sound generator for rendering the next n samples
+    end_block(n, volume)
+        Advances the sound generator past the n samples which were just rendered
+    stop(sample)
         Stops the sound generator
+    is_finished()
+        Returns whether the sound generator has finished playing
+    reset(envelope, wave_types, frequency, length, rendered, sound_filter, onset)
+        Starts the sound generator over with a new note, reusing its buffers
     """
+    # Sound generators are preallocated and reused by the voice pool, so they are kept compact
+    __slots__ = ("dead_sample", "dead_volume", "length", "length_samples", "volume", "fs", "block_size", "sample",
+                 "dead", "finished", "delay", "envelope", "waveGenerator", "rendered", "generation",
+                 "sound_filter", "filter_state", "gain_buffer", "wave_buffer", "output_buffer")
 
-    def __init__(self, envelope, wave_generator, length=-1):
+    def __init__(self, envelope, wave_generator, length=-1, rendered: np.ndarray | None = None, sound_filter=None):
         """
         Constructs the object
         :param envelope: The envelope to be used by the sound generator
         :param wave_generator: The wave generator to be used by the sound generator
         :param length: The length (if any) the sound generator should remain active.
             If unspecified, the generator will play forever until stop() is called.
+        :param rendered: The rendered samples of the note, if specified they are played instead of synthesizing
+            the note, and wave_generator may be None
+        :param sound_filter: The Filter the waveform should be run through, if unspecified it is not filtered
+        """
+        # Both of these will be read from config.py
+        self.fs = BITRATE
+        self.block_size = BUFFER_SIZE
+        self.generation = 0
+        # Set envelope and wave generator
+        self.waveGenerator = wave_generator
+        self.filter_state = np.zeros((1, 2))
+        self.__start(envelope, length, rendered, sound_filter)
+        # Allocate the buffers every block is rendered into
+        self.__allocate(self.block_size)
+
+    def reset(self, envelope, wave_types, frequency: float, length=-1, rendered: np.ndarray | None = None,
+              sound_filter=None, onset: int = 0):
         """
-        # Instantiate dead time and volume, these will be used later
-        self.dead_time = -1
+        Starts the sound generator over with a new note, the wave generator and the buffers are kept
+        :param envelope: The envelope to be used by the sound generator
+        :param wave_types: The wave preset of the note, which the wave generator is reset to
+        :param frequency: The frequency of the note
+        :param length: The length (if any) the sound generator should remain active
+        :param rendered: The rendered samples of the note, if specified they are played instead of synthesizing
+            the note, and the wave generator is left as it is
+        :param sound_filter: The Filter the waveform should be run through, if unspecified it is not filtered
+        :param onset: The sample at which the note starts, which the noise of the note is seeded with
+        :return: None
+        """
+        if rendered is None:
+            self.waveGenerator.reset(wave_types, frequency, onset)
+        # A new generation marks that the sound generator now plays a different note
+        self.generation += 1
+        self.__start(envelope, length, rendered, sound_filter)
+
+    def __start(self, envelope, length, rendered: np.ndarray | None, sound_filter):
+        """
+        Sets the sound generator up to play a note from its start
+        :param envelope: The envelope to be used by the sound generator
+        :param length: The length (if any) the sound generator should remain active
+        :param rendered: The rendered samples of the note, if any
+        :param sound_filter: The Filter the waveform should be run through, if any
+        :return: None
+        """
+        # Instantiate dead sample and volume, these will be used later
+        self.dead_sample = -1
         self.dead_volume = -1
         # Set length
         self.length = length
+        self.length_samples = -1 if length == -1 else round(length * self.fs)
         # Volume starts out at 0
         self.volume = 0  # range [0.0, 1.0]
-        # Both of these will be read from config.py
-        self.fs = BITRATE
-        self.block_size = BUFFER_SIZE
-        # Instantiate time and duration
-        self.t = 0.0
-        self.duration = self.block_size / self.fs  # in seconds, may be float
+        # The generator starts at its first sample
+        self.sample = 0
         # The generator starts out active
         self.dead = False
-        # Set envelope and wave generator
+        self.finished = False
+        # The generator starts playing immediately, unless it was scheduled by the sequencer
+        self.delay = 0
+        # Set envelope and the rendered samples
         self.envelope = envelope
-        self.waveGenerator = wave_generator
-        super().__init__()
+        self.rendered = rendered
+        # The filter starts out at rest, as the note starts from silence
+        self.sound_filter = sound_filter
+        self.filter_state.fill(0.0)
+
+    def generate_block(self, n: int | None = None) -> np.ndarray:
+        """
+        Generates the next block of samples of the sound generator
+        :param n: The number of samples to generate, block_size if unspecified
+        :return: A float32 ndarray of n samples, which is only valid until the next block is generated
+        """
+        if n is None:
+            n = self.block_size
+        if n > len(self.output_buffer):
+            # The block is larger than the buffers, grow them
+            self.__allocate(n)
+        if self.rendered is not None:
+            return self.__copy_rendered(n)
+        self.begin_block(n)
+        # Calculate the gain of every sample of the block from the envelope
+        gain = self.envelope.gain_block(self.sample, n, self.fs, self.dead_sample if self.dead else None,
+                                        self.dead_volume / MAX_VOL, self.gain_buffer)
+        # The volume of the generator is the volume at the end of the block
+        volume = gain[n - 1] * MAX_VOL
+        # Generate the waveform for the current block
+        samples = self.waveGenerator.generate_block(n, self.wave_buffer)
+        if self.sound_filter is not None:
+            # Filter the waveform, carrying the state of the filter over from the previous block
+            self.sound_filter.process(samples, self.filter_state, self.fs, gain[0])
+        # Scale the waveform by the envelope, then convert it into the float32 output buffer
+        # (multiplying float64 arrays straight into a float32 output would buffer the whole block)
+        gain *= samples
+        gain *= MAX_VOL
+        output = self.output_buffer[:n]
+        np.copyto(output, gain, casting="same_kind")
+        self.end_block(n, volume)
+        return output
 
-    def run(self):
+    def begin_block(self, n: int):
         """
-        The main loop of the sound generator
+        Prepares the sound generator for rendering the next n samples
+        :param n: The number of samples which are about to be rendered
         :return: None
         """
-        # Use sc to get the default speaker, this will be used to play the generated waveform
-        with sc.default_speaker().player(samplerate=self.fs, channels=1, blocksize=self.block_size) as speaker:
-            while not (self.volume <= 0 and self.t > self.envelope.a):
-                # The generator will stop generating when the volume is 0,
-                # and we are not in the attack segment of the envelope
-                if self.length != -1 and self.t > self.length and not self.dead:
-                    # If the generator has a specified length, and we have exceeded that length, stop the generator
-                    self.stop()
-                # Calculate the volume of the generator from the envelope
-                # TODO: Refactor this to the Envelope class
-                self.volume = interpolate(self.dead_time, self.dead_time + self.envelope.r, self.dead_volume, 0.0,
-                                          self.t) if self.dead \
-                    else interpolate(0.0, self.envelope.a, 0.0, MAX_VOL, self.t) if self.t < self.envelope.a \
-                    else interpolate(self.envelope.a, self.envelope.a + self.envelope.d, MAX_VOL,
-                                     self.envelope.s * MAX_VOL, self.t) if self.t < self.envelope.a + self.envelope.d \
-                    else self.envelope.s * MAX_VOL
-                # Generate the waveform for the current block
-                samples = self.waveGenerator.generate_wave(
-                    np.arange(self.t, self.t + self.duration, 1 / self.fs)).astype(np.float32)
-                # TODO: Add support for sound filtering
-                # Increment time
-                self.t += self.duration
-                # Play the waveform
-                speaker.play(samples * self.volume)
-
-    def stop(self):
+        if self.length_samples != -1 and self.sample + n > self.length_samples and not self.dead:
+            # If the generator has a specified length, and it ends within this block, release it at that exact sample
+            self.stop(self.length_samples)
+
+    def end_block(self, n: int, volume: float):
+        """
+        Advances the sound generator past the n samples which were just rendered
+        :param n: The number of samples which were rendered
+        :param volume: The volume of the last rendered sample
+        :return: None
+        """
+        # The volume of the generator is the volume at the end of the block
+        self.volume = volume
+        # Advance the sample counter
+        self.sample += n
+        # The generator has finished when the volume is 0, and we are not in the attack segment of the envelope
+        self.finished = self.volume <= 0 and self.sample > self.envelope.a * self.fs
+
+    def stop(self, sample: int | None = None):
         """
         Stops the sound generator
+        :param sample: The sample at which the generator should be released, the current sample if unspecified
         :return: None
         """
         # Set dead to True, this will cause the generator to start fading out
         self.dead = True
-        # Record the time and volume at which the generator is stopped, this is used to interpolate the fade out
-        self.dead_time = self.t
-        self.dead_volume = self.volume
+        # Record the sample and volume at which the generator is stopped, this is used to interpolate the fade out
+        self.dead_sample = self.sample if sample is None else sample
+        table = self.envelope.get_table(self.fs)
+        self.dead_volume = table[min(self.dead_sample, len(table) - 1)] * MAX_VOL
+
+    def is_finished(self):
+        """
+        Returns whether the sound generator has finished playing
+        :return: A boolean whether the sound generator has faded out completely
+        """
+        return self.finished
+
+    def __copy_rendered(self, n: int) -> np.ndarray:
+        """
+        Copies the next n samples of the rendered note into the output buffer
+        :param n: The number of samples to copy
+        :return: A float32 ndarray of n samples
+        """
+        output = self.output_buffer[:n]
+        # Past the end of the rendered note there is only silence
+        available = min(max(len(self.rendered) - self.sample, 0), n)
+        output[:available] = self.rendered[self.sample:self.sample + available]
+        output[available:] = 0.0
+        self.sample += n
+        # The rendered note contains the release tail, so the note has finished once all of it has been played
+        self.finished = self.sample >= len(self.rendered)
+        return output
+
+    def __allocate(self, size: int):
+        """
+        Allocates the buffers every block is rendered into
+        :param size: The largest number of samples a block may have
+        :return: None
+        """
+        self.gain_buffer = np.empty(size)
+        self.wave_buffer = np.empty(size)
+        self.output_buffer = np.empty(size, dtype=np.float32)
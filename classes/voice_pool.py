@@ -0,0 +1,111 @@
+import numpy as np
+from classes.envelope import Envelope
+from classes.filter import Filter
+from classes.sound_generator import SoundGenerator
+from classes.wave import Wave
+from classes.wave_generator import WaveGenerator
+from config import DEFAULT_ENVELOPE_PRESET, DEFAULT_WAVE_PRESET, POLYPHONY, VOICE_STEALING
+
+# The voice stealing policies, which voice is cut off when a note is played while every voice is in use
+STEALING_POLICIES = ["oldest", "quietest", "released"]
+
+
+class VoicePool:
+    """
+    A class representing a voice pool (a fixed number of preallocated voices which are reused for every note)
+
+    Every note is played by a voice taken from the pool, and the voice is returned to the pool once it has finished.
+    If every voice is in use when a note is played, one of the playing voices is stolen for it, so the number of
+    voices rendered per block, and thus the cost of a block, never exceeds the polyphony limit.
+    The voice which is stolen depends on the policy:
+        "oldest" steals the voice which started first,
+        "quietest" steals the voice with the lowest volume,
+        "released" steals the oldest of the released voices, or the oldest voice if none were released
+
+    Attributes
+    ----------
+    voices : [SoundGenerator]
+        Every voice of the pool
+    free : [SoundGenerator]
+        The voices which are not playing
+    active : [SoundGenerator]
+        The voices which are playing, ordered from the oldest to the newest
+    policy : str
+        The voice stealing policy, one of STEALING_POLICIES
+    steals : int
+        The number of voices which were stolen
+
+    Methods
+    -------
+    acquire(envelope, wave_types, frequency, length, rendered, sound_filter, onset)
+        Starts a note on a voice of the pool
+    collect()
+        Returns the voices which have finished playing to the pool
+    """
+
+    def __init__(self, size: int = POLYPHONY, policy: str = VOICE_STEALING):
+        """
+        Constructs the object
+        :param size: The number of voices of the pool, the most notes which can play at once
+        :param policy: The voice stealing policy, one of STEALING_POLICIES
+        """
+        if policy not in STEALING_POLICIES:
+            # If the policy is not recognized, raise an exception
+            raise Exception("Invalid Voice Stealing Policy")
+        if size < 1:
+            # A pool without voices could not play anything, raise an exception
+            raise Exception("Invalid Polyphony")
+        self.policy = policy
+        self.steals = 0
+        # Allocate every voice, along with its buffers, up front
+        self.voices = [SoundGenerator(DEFAULT_ENVELOPE_PRESET, WaveGenerator(DEFAULT_WAVE_PRESET, 440.0))
+                       for _ in range(size)]
+        self.free = list(self.voices)
+        self.active = []
+
+    def acquire(self, envelope: Envelope, wave_types: [Wave], frequency: float, length=-1,
+                rendered: np.ndarray | None = None, sound_filter: Filter | None = None,
+                onset: int = 0) -> SoundGenerator:
+        """
+        Starts a note on a voice of the pool, stealing a playing voice if every voice is in use
+        :param envelope: The envelope of the note
+        :param wave_types: The wave preset of the note
+        :param frequency: The frequency of the note
+        :param length: The length of the note in seconds, -1 if it plays until it is stopped
+        :param rendered: The rendered samples of the note, if it is played from the note cache
+        :param sound_filter: The filter of the note, None if the note is not filtered
+        :param onset: The sample at which the note starts, which the noise of the note is seeded with
+        :return: The SoundGenerator playing the note
+        """
+        if len(self.free) > 0:
+            voice = self.free.pop()
+        else:
+            voice = self.__steal()
+        voice.reset(envelope, wave_types, frequency, length, rendered, sound_filter, onset)
+        # The voice is the newest one
+        self.active.append(voice)
+        return voice
+
+    def collect(self):
+        """
+        Returns the voices which have finished playing to the pool
+        :return: None
+        """
+        if any(voice.is_finished() for voice in self.active):
+            self.free.extend(voice for voice in self.active if voice.is_finished())
+            self.active = [voice for voice in self.active if not voice.is_finished()]
+
+    def __steal(self) -> SoundGenerator:
+        """
+        Takes a playing voice away from its note, according to the voice stealing policy
+        :return: The stolen SoundGenerator
+        """
+        victim = self.active[0]  # The oldest voice
+        if self.policy == "quietest":
+            victim = min(self.active, key=lambda voice: voice.volume)
+        elif self.policy == "released":
+            # The active voices are ordered by age, so the first released voice is the oldest one
+            victim = next((voice for voice in self.active if voice.dead), victim)
+        self.active.remove(victim)
+        self.steals += 1
+        return victim
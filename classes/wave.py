@@ -1,3 +1,4 @@
+import numpy as np
 from classes.wave_types import WaveTypes
 
 
@@ -10,11 +11,18 @@ class Wave:
     wave_type : WaveTypes
         The type of wave
     offset : float
-        The offset of the wave relative to the base frequency (multiplicative)
+        The offset of the wave relative to the base frequency (multiplicative), ignored by noise
     amplitude : float
         The amplitude of the wave
     phase : float
-        The phase of the wave in radians
+        The phase of the wave in radians, ignored by noise
+
+    Methods
+    -------
+    evaluate(x, dx)
+        Evaluates the wave at the given angles of the base frequency
+    has_discontinuities()
+        Returns whether the waveform jumps or turns abruptly, and thus aliases unless band-limited
     """
     def __init__(self, wave_type: WaveTypes, offset: float, amplitude: float, phase: float = 0):
         """
@@ -29,3 +37,109 @@ class Wave:
         self.offset = offset
         self.amplitude = amplitude
         self.phase = phase
+
+    def evaluate(self, x: np.ndarray, dx: float | None = None) -> np.ndarray:
+        """
+        Evaluates the wave at the given angles of the base frequency
+        :param x: A ndarray of angles in radians of the base frequency (so, 2 * pi * frequency * time)
+        :param dx: The angle the base frequency advances by between consecutive samples (so, 2 * pi * frequency / fs).
+            If specified, the discontinuities of the wave are smoothed by PolyBLEP corrections, which removes most
+            of the aliasing of high notes
+        :return: A ndarray of samples of the wave, including its amplitude
+        """
+        # Apply the offset and the phase of the wave
+        x = self.offset * x + self.phase
+        if dx is not None and self.has_discontinuities():
+            return self.amplitude * Wave.__band_limited(self.wave_type, x, self.offset * dx)
+        # Use the specific wave generation function for each respective wave type
+        if self.wave_type == WaveTypes.SINE:
+            return self.amplitude * np.sin(x)
+        if self.wave_type in (WaveTypes.WHITE_NOISE, WaveTypes.PINK_NOISE):
+            # Noise does not depend on the angle, only on the number of samples
+            # (classes.noise reads config.py, which imports this module, so it is only imported once it is needed)
+            from classes.noise import generate_noise
+            return self.amplitude * generate_noise(self.wave_type, np.shape(x))
+        # scipy.signal takes over a second to import, so it is only imported once a naive wave is evaluated
+        import scipy.signal as signal
+        if self.wave_type == WaveTypes.SQUARE:
+            return self.amplitude * signal.square(x)
+        elif self.wave_type == WaveTypes.SAWTOOTH:
+            return self.amplitude * signal.sawtooth(x)
+        elif self.wave_type == WaveTypes.TRIANGLE:
+            return self.amplitude * signal.sawtooth(x, width=0.5)
+        else:
+            # If the wave is not found, raise an exception (this should never happen)
+            raise Exception("Invalid Wave Type")
+
+    def has_discontinuities(self) -> bool:
+        """
+        Returns whether the waveform jumps or turns abruptly, and thus aliases unless band-limited
+        :return: A boolean whether the wave is a square, sawtooth or triangle wave
+        """
+        return self.wave_type in (WaveTypes.SQUARE, WaveTypes.SAWTOOTH, WaveTypes.TRIANGLE)
+
+    @staticmethod
+    def __band_limited(wave_type: WaveTypes, x: np.ndarray, dx: float) -> np.ndarray:
+        """
+        Evaluates a band-limited square, sawtooth or triangle wave with PolyBLEP corrections
+        Every jump of the waveform (and every kink, for the triangle) is replaced by a polynomial approximation of
+        a band-limited step spanning the samples next to it, which costs a few vectorized operations per block
+        :param x: A ndarray of angles of the wave in radians
+        :param dx: The angle the wave advances by between consecutive samples
+        :return: A ndarray of samples of the wave, without its amplitude
+        """
+        # Position within the cycle of the wave, and the part of a cycle the wave advances by per sample
+        t = np.mod(x / (2 * np.pi), 1.0)
+        # The corrections only work up to half of the sampling rate
+        dt = min(abs(dx) / (2 * np.pi), 0.5)
+        # The second half of the cycle, where the square jumps down and the triangle turns down
+        shifted = np.mod(t + 0.5, 1.0)
+        if wave_type == WaveTypes.SAWTOOTH:
+            # Rises from -1 to 1 over the cycle, then jumps down by 2
+            return 2 * t - 1 - _poly_blep(t, dt)
+        elif wave_type == WaveTypes.SQUARE:
+            # 1 over the first half of the cycle, -1 over the second, with a jump at the start of each half
+            return np.where(t < 0.5, 1.0, -1.0) + _poly_blep(t, dt) - _poly_blep(shifted, dt)
+        elif wave_type == WaveTypes.TRIANGLE:
+            # Rises from -1 to 1 over the first half of the cycle and falls back over the second, the slope changes
+            # by 8 per cycle at each turn, so the corrections are integrated steps (PolyBLAMP) scaled by it
+            return np.where(t < 0.5, 4 * t - 1, 3 - 4 * t) + 8 * dt * (_poly_blamp(t, dt) - _poly_blamp(shifted, dt))
+        else:
+            # Sine waves have no discontinuities, so there is nothing to band-limit
+            raise Exception("Invalid Band-Limited Wave Type")
+
+
+def _poly_blep(t: np.ndarray, dt: float) -> np.ndarray:
+    """
+    Returns the PolyBLEP correction of a unit jump at the start of every cycle
+    :param t: A ndarray of positions within the cycle, range [0.0, 1.0)
+    :param dt: The part of a cycle the wave advances by per sample
+    :return: A ndarray of the corrections to add to a naive waveform jumping up by 2 at the start of every cycle
+    """
+    correction = np.zeros(t.shape)
+    # Only the samples within one sample of the jump are corrected
+    after = t < dt
+    u = t[after] / dt
+    correction[after] = 2 * u - u * u - 1
+    before = t > 1 - dt
+    u = (t[before] - 1) / dt
+    correction[before] = u * u + 2 * u + 1
+    return correction
+
+
+def _poly_blamp(t: np.ndarray, dt: float) -> np.ndarray:
+    """
+    Returns the PolyBLAMP correction of a unit change of slope at the start of every cycle
+    :param t: A ndarray of positions within the cycle, range [0.0, 1.0)
+    :param dt: The part of a cycle the wave advances by per sample
+    :return: A ndarray of the corrections, to be scaled by the change of slope per cycle and by dt
+    """
+    correction = np.zeros(t.shape)
+    # Only the samples within one sample of the kink are corrected
+    after = t < dt
+    u = t[after] / dt - 1
+    correction[after] = -u * u * u / 6
+    before = t > 1 - dt
+    u = (t[before] - 1) / dt + 1
+    correction[before] = u * u * u / 6
+    return correction
@@ -1,8 +1,9 @@
-from enum import Enum
 import numpy as np
-import scipy.signal as signal
 from classes.wave import Wave
 from classes.wave_types import WaveTypes
+from classes.noise import NoiseGenerator, NOISE_WAVES, get_note_seed
+from classes.wavetable import get_wavetable
+from config import BITRATE, BUFFER_SIZE, USE_WAVETABLES, BAND_LIMITED_WAVES
 
 
 class WaveGenerator:
@@ -15,21 +16,81 @@ class WaveGenerator:
         A list of waves to be generated
     frequency : float
         The frequency of the wave generator
+    wavetable : Wavetable
+        The precomputed wavetable of the wave preset, None if the waves are evaluated directly
+        Presets containing a wave type of BAND_LIMITED_WAVES have a table for every band of frequencies,
+        see get_wavetable. Presets containing noise never repeat, so they are always evaluated directly
+    use_wavetable : bool
+        Whether the waveform is rendered from the precomputed wavetable of the preset
+    fs : int
+        The sampling rate of the wave generator, read from config.py
+    phase : float
+        The phase accumulator, the phase of the next sample in cycles of the base frequency
+    period : int | None
+        The number of base cycles after which the waveform repeats, the phase is wrapped to it to retain precision.
+        None if the waveform is not known to repeat
+    increment : float
+        The phase advance per sample in cycles of the base frequency
+    noise : {WaveTypes: NoiseGenerator}
+        The noise generators of the noise waves, created the first time the wave generator plays each type of noise
+    onset : int
+        The sample at which the note started, which the noise of the note is seeded with
+    ramp, phase_buffer, position_buffer, index_buffer, scratch_buffer : ndarray
+        Work buffers reused for every block
 
     Methods
     -------
     generate_wave(time)
         Generates a wave at the given time
+    generate_block(n, out)
+        Generates the next n samples of the wave from the phase accumulator
+    advance(n)
+        Advances the phase accumulator by n samples
+    reset(wave_types, frequency, onset)
+        Starts the wave generator over with a new preset and frequency, reusing its buffers
     """
-    def __init__(self, wave_types: [Wave], frequency: float):
+    # Wave generators are reused by the voice pool, so they are kept compact
+    __slots__ = ("wave_types", "frequency", "wavetable", "use_wavetable", "fs", "phase", "period", "increment",
+                 "noise", "onset", "ramp", "phase_buffer", "position_buffer", "index_buffer", "scratch_buffer")
+
+    def __init__(self, wave_types: [Wave], frequency: float, use_wavetable: bool = USE_WAVETABLES, onset: int = 0):
         """
         Constructs the object
         :param wave_types: A list of waves comprising the final waveform
         :param frequency: The base frequency to use
+        :param use_wavetable: Whether to render the waveform from the precomputed wavetable of the preset
+        :param onset: The sample at which the note starts, which its noise is seeded with
         """
+        self.fs = BITRATE
+        self.use_wavetable = use_wavetable
+        self.noise = {}
         # Set all of the attributes
+        self.reset(wave_types, frequency, onset)
+        # Work buffers reused for every block, so that rendering a block does not allocate
+        self.__allocate(BUFFER_SIZE)
+
+    def reset(self, wave_types: [Wave], frequency: float, onset: int = 0):
+        """
+        Starts the wave generator over with a new preset and frequency, the buffers are kept
+        :param wave_types: A list of waves comprising the final waveform
+        :param frequency: The base frequency to use
+        :param onset: The sample at which the note starts, which its noise is seeded with
+        :return: None
+        """
         self.wave_types = wave_types
         self.frequency = frequency
+        self.onset = onset
+        # Noise never repeats, so a preset containing it cannot be held by a wavetable
+        noisy = any(wave.wave_type in NOISE_WAVES for wave in wave_types)
+        self.wavetable = get_wavetable(wave_types, frequency) if self.use_wavetable and not noisy else None
+        for wave in wave_types:
+            if wave.wave_type in self.noise:
+                # The noise of the note starts from the seed of the note, not where the previous note left off
+                self.noise[wave.wave_type].reset(get_note_seed(wave.wave_type, frequency, onset))
+        # The phase accumulator starts at the beginning of the wave
+        self.phase = 0.0
+        self.period = self.wavetable.cycles if self.wavetable is not None and self.wavetable.combined else None
+        self.increment = self.frequency / self.fs
 
     def generate_wave(self, time: np.ndarray) -> np.ndarray:
         """
@@ -37,22 +98,85 @@ class WaveGenerator:
         :param time: a ndarray of time values
         :return: A ndarray of samples of the waveform
         """
+        if self.wavetable is not None:
+            # Look the waveform up in the wavetable, the phase is expressed in cycles of the base frequency
+            return self.wavetable.generate(self.frequency * time)
         # Generate an array of ones for the entire timespan to use for further wave transformations
         samples = np.ones(len(time))
+        # Angle of the base frequency at every point in time, and its advance per sample
+        x = 2 * np.pi * self.frequency * time
+        dx = 2 * np.pi * self.increment
         # Multiply the samples by each wave (thus creating the target wave)
         for wave in self.wave_types:
-            # Use the specific wave generation function for each respective wave type
-            if wave.wave_type == WaveTypes.SINE:
-                samples *= wave.amplitude * np.sin(2 * np.pi * (self.frequency * wave.offset) * time + wave.phase)
-            elif wave.wave_type == WaveTypes.SQUARE:
-                samples *= wave.amplitude * signal.square(2 * np.pi * (self.frequency * wave.offset) * time + wave.phase)
-            elif wave.wave_type == WaveTypes.SAWTOOTH:
-                samples *= wave.amplitude * signal.sawtooth(2 * np.pi * (self.frequency * wave.offset) * time + wave.phase)
-            elif wave.wave_type == WaveTypes.TRIANGLE:
-                samples *= wave.amplitude * signal.sawtooth(2 * np.pi * (self.frequency * wave.offset) * time + wave.phase, width=0.5)
-            # TODO: Add a noise wave type
-            else:
-                # If the wave is not found, raise an exception (this should never happen)
-                raise Exception("Invalid Wave Type")
+            samples *= wave.evaluate(x, dx if wave.wave_type in BAND_LIMITED_WAVES else None)
         # Return the generated waveform
         return samples
+
+    def generate_block(self, n: int, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Generates the next n samples of the wave from the phase accumulator, and advances the accumulator
+        When rendering from the wavetable into a given out array, no memory is allocated
+        :param n: The number of samples to generate
+        :param out: The float64 array to write the samples into, allocated if unspecified
+        :return: A ndarray of n samples of the waveform
+        """
+        if n > len(self.ramp):
+            # The block is larger than the buffers, grow them
+            self.__allocate(n)
+        out = np.empty(n) if out is None else out[:n]
+        # The phase of every sample of the block, counted on from the accumulator
+        phase = self.phase_buffer[:n]
+        np.multiply(self.ramp[:n], self.increment, out=phase)
+        phase += self.advance(n)
+        if self.wavetable is not None:
+            # Look the waveform up in the wavetable
+            return self.wavetable.generate(phase, out, self.position_buffer[:n], self.index_buffer[:n],
+                                           self.scratch_buffer[:n])
+        # Otherwise, evaluate every wave at the angle of the base frequency
+        out.fill(1.0)
+        phase *= 2 * np.pi
+        dx = 2 * np.pi * self.increment
+        for wave in self.wave_types:
+            if wave.wave_type in NOISE_WAVES:
+                # Noise is generated by the noise generator of the voice, which carries on from the previous block
+                out *= self.__get_noise(wave.wave_type).generate_block(n)
+                out *= wave.amplitude
+            else:
+                out *= wave.evaluate(phase, dx if wave.wave_type in BAND_LIMITED_WAVES else None)
+        return out
+
+    def advance(self, n: int) -> float:
+        """
+        Advances the phase accumulator by n samples
+        :param n: The number of samples to advance by
+        :return: The phase before advancing, so the phase of the first of the n samples
+        """
+        phase = self.phase
+        # Wrap the accumulator to the period of the wave so that it never loses precision
+        self.phase += n * self.increment
+        if self.period is not None:
+            self.phase %= self.period
+        return phase
+
+    def __get_noise(self, wave_type: WaveTypes) -> NoiseGenerator:
+        """
+        Returns the noise generator of the given type of noise, creating it if the wave generator has none yet
+        :param wave_type: The type of noise, one of NOISE_WAVES
+        :return: The NoiseGenerator of the type
+        """
+        if wave_type not in self.noise:
+            self.noise[wave_type] = NoiseGenerator(wave_type, seed=get_note_seed(wave_type, self.frequency,
+                                                                                  self.onset))
+        return self.noise[wave_type]
+
+    def __allocate(self, size: int):
+        """
+        Allocates the work buffers used for rendering blocks
+        :param size: The largest number of samples a block may have
+        :return: None
+        """
+        self.ramp = np.arange(size, dtype=np.float64)
+        self.phase_buffer = np.empty(size)
+        self.position_buffer = np.empty(size)
+        self.index_buffer = np.empty(size, dtype=np.intp)
+        self.scratch_buffer = np.empty(size)
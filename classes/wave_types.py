@@ -9,3 +9,5 @@ class WaveTypes(Enum):
     SQUARE = "square"
     SAWTOOTH = "sawtooth"
     TRIANGLE = "triangle"
+    WHITE_NOISE = "white_noise"
+    PINK_NOISE = "pink_noise"
@@ -0,0 +1,189 @@
+from fractions import Fraction
+from math import ceil, lcm, log2
+import numpy as np
+from classes.noise import NOISE_WAVES
+from classes.wave import Wave
+from config import BITRATE, WAVETABLE_SIZE, WAVETABLE_MAX_CYCLES, WAVETABLE_BANDS_PER_OCTAVE, BAND_LIMITED_WAVES
+
+
+class Wavetable:
+    """
+    A class representing a wavetable (precomputed cycles of a wave preset, rendered by table lookup)
+
+    If the offsets of the waves are rational, the product of all of the waves repeats after a whole number of
+    base cycles, in which case a single combined table holds the entire preset. Otherwise, each wave gets a table
+    holding a single cycle of its own, and the tables are multiplied together when rendering
+
+    Noise never repeats, so presets containing a wave of NOISE_WAVES cannot be held by a wavetable
+
+    The waves of BAND_LIMITED_WAVES are band-limited for the highest frequency the table is played at, so a preset
+    containing any of them has a table for every band of frequencies (see get_wavetable)
+
+    Attributes
+    ----------
+    waves : [Wave]
+        The wave preset the table was computed from
+    dx : float | None
+        The angle the base frequency advances by per sample at the highest frequency of the table,
+        None if the waves are not band-limited
+    combined : bool
+        Whether the whole preset is held in a single table
+    cycles : int
+        The number of base cycles the combined table spans (1 if the table is not combined)
+    tables : [ndarray]
+        The tables, each holding a single pass of its waveform
+    slopes : [ndarray]
+        The difference between each sample of a table and the next one (wrapping around to the start),
+        for interpolation
+    offsets : [float]
+        The frequency offset each table is played at relative to the base frequency
+
+    Methods
+    -------
+    generate(phase, out, position, index, scratch)
+        Generates samples of the preset at the given phases
+    """
+
+    def __init__(self, waves: [Wave], dx: float | None = None):
+        """
+        Constructs the object, precomputing the tables
+        :param waves: The wave preset to compute the tables for
+        :param dx: The angle the base frequency advances by per sample at the highest frequency the table is played at,
+            the waves of BAND_LIMITED_WAVES are band-limited for it if specified
+        """
+        self.waves = waves
+        self.dx = dx
+        self.cycles = Wavetable.__common_cycles(waves)
+        self.combined = self.cycles is not None
+        if self.combined:
+            # A single table spanning enough base cycles for every wave to complete a whole number of cycles
+            x = 2 * np.pi * np.arange(WAVETABLE_SIZE * self.cycles + 1) / WAVETABLE_SIZE
+            table = np.ones(len(x))
+            for wave in waves:
+                table *= wave.evaluate(x, self.__increment(wave, dx))
+            self.tables = [table]
+            self.offsets = [1.0]
+        else:
+            # One table per wave, each spanning a single cycle of the wave
+            self.cycles = 1
+            self.tables = []
+            self.offsets = []
+            for wave in waves:
+                x = 2 * np.pi * np.arange(WAVETABLE_SIZE + 1) / WAVETABLE_SIZE
+                # The table is indexed by cycles of the wave itself, so the offset is applied at lookup
+                # and so is the angle increment, which the wave would otherwise scale by its offset itself
+                increment = self.__increment(wave, dx)
+                increment = None if increment is None else increment * wave.offset
+                self.tables.append(Wave(wave.wave_type, 1, wave.amplitude, wave.phase).evaluate(x, increment))
+                self.offsets.append(wave.offset)
+        # The difference between the last sample and the extra one is the slope wrapping around to the start,
+        # after which the extra sample is no longer needed
+        self.slopes = [np.diff(table) for table in self.tables]
+        self.tables = [table[:-1] for table in self.tables]
+
+    def generate(self, phase: np.ndarray, out: np.ndarray | None = None, position: np.ndarray | None = None,
+                 index: np.ndarray | None = None, scratch: np.ndarray | None = None) -> np.ndarray:
+        """
+        Generates samples of the preset at the given phases
+        The phases may be of any shape, so a whole batch of voices can be generated at once
+        If all of the buffers are given, no memory is allocated
+        :param phase: A ndarray of phases expressed in cycles of the base frequency (so, frequency * time)
+        :param out: The float64 array to write the samples into, of the same shape as phase, allocated if unspecified
+        :param position: A float64 work buffer of the same shape as phase, allocated if unspecified
+        :param index: An intp work buffer of the same shape as phase, allocated if unspecified
+        :param scratch: A float64 work buffer of the same shape as phase, allocated if unspecified
+        :return: A ndarray of samples of the preset, of the same shape as phase
+        """
+        out = np.empty(phase.shape) if out is None else out
+        position = np.empty(phase.shape) if position is None else position
+        index = np.empty(phase.shape, dtype=np.intp) if index is None else index
+        scratch = np.empty(phase.shape) if scratch is None else scratch
+        out.fill(1.0)
+        for table, slope, offset in zip(self.tables, self.slopes, self.offsets):
+            # Position within the table
+            np.multiply(phase, offset * WAVETABLE_SIZE, out=position)
+            # Split the position into the index of the sample below it and the fraction towards the next sample
+            np.floor(position, out=scratch)
+            np.copyto(index, scratch, casting="unsafe")
+            position -= scratch
+            # Wrap the index to a single pass of the table, which is far cheaper on integers than on the position
+            np.remainder(index, len(table), out=index)
+            # Linearly interpolate between the two neighbouring samples
+            # Wrapping never actually happens, but unlike the default mode it does not buffer the output
+            np.take(slope, index, out=scratch, mode="wrap")
+            position *= scratch
+            np.take(table, index, out=scratch, mode="wrap")
+            position += scratch
+            out *= position
+        return out
+
+    @staticmethod
+    def __increment(wave: Wave, dx: float | None) -> float | None:
+        """
+        Returns the angle increment the given wave is evaluated with
+        :param wave: The wave to evaluate
+        :param dx: The angle increment of the table, None if the table is not band-limited
+        :return: The angle increment, or None if the wave is evaluated naively
+        """
+        return dx if wave.wave_type in BAND_LIMITED_WAVES else None
+
+    @staticmethod
+    def __common_cycles(waves: [Wave]) -> int | None:
+        """
+        Returns the number of base cycles after which the product of the waves repeats
+        :param waves: The wave preset
+        :return: The number of base cycles, or None if the preset does not repeat within WAVETABLE_MAX_CYCLES
+        """
+        cycles = 1
+        for wave in waves:
+            offset = Fraction(wave.offset).limit_denominator(WAVETABLE_MAX_CYCLES)
+            if abs(float(offset) - wave.offset) > 1e-9:
+                # The offset is not a simple fraction, so the product never repeats within a reasonable table
+                return None
+            # The wave completes a whole number of cycles after a multiple of the denominator of its offset
+            cycles = lcm(cycles, offset.denominator)
+        return cycles if cycles <= WAVETABLE_MAX_CYCLES else None
+
+
+# Wavetables computed so far, keyed by the parameters of the waves in the preset
+_wavetables: dict[tuple, Wavetable] = {}
+
+
+def get_wavetable(waves: [Wave], frequency: float | None = None) -> Wavetable:
+    """
+    Returns the wavetable of the given wave preset, computing it if it was not computed yet
+    If the preset contains a wave of BAND_LIMITED_WAVES, the frequencies are split into WAVETABLE_BANDS_PER_OCTAVE
+    bands per octave, and the table returned is band-limited for the highest frequency of the band of the given one
+    :param waves: The wave preset
+    :param frequency: The base frequency the table is played at, the table is not band-limited if unspecified
+    :return: The Wavetable of the preset
+    """
+    band = None
+    if frequency is not None and any(wave.wave_type in BAND_LIMITED_WAVES for wave in waves):
+        # The bands are counted from the sampling rate, every band ending at BITRATE * 2 ** (band / bands per octave)
+        band = ceil(log2(abs(frequency) / BITRATE) * WAVETABLE_BANDS_PER_OCTAVE) if frequency != 0 else None
+    key = (tuple((wave.wave_type, wave.offset, wave.amplitude, wave.phase) for wave in waves), band)
+    if key not in _wavetables:
+        dx = None if band is None else 2 * np.pi * 2 ** (band / WAVETABLE_BANDS_PER_OCTAVE)
+        _wavetables[key] = Wavetable(waves, dx)
+    return _wavetables[key]
+
+
+def precompute_wavetables(waves: [Wave]):
+    """
+    Computes every wavetable of the given wave preset, so that none are computed when a note is played
+    For a band-limited preset, these are the tables of every band between 20Hz and half of the sampling rate,
+    the table which is not band-limited is only computed once it is needed
+    :param waves: The wave preset
+    :return: None
+    """
+    if any(wave.wave_type in NOISE_WAVES for wave in waves):
+        # Noise never repeats, so presets containing it are evaluated directly instead
+        return
+    if not any(wave.wave_type in BAND_LIMITED_WAVES for wave in waves):
+        get_wavetable(waves)
+    else:
+        frequency = 20.0
+        while frequency < BITRATE / 2:
+            get_wavetable(waves, frequency)
+            frequency *= 2 ** (1 / WAVETABLE_BANDS_PER_OCTAVE)
@@ -1,5 +1,5 @@
 from classes.wave import Wave
-from classes.wave_generator import WaveTypes
+from classes.wave_types import WaveTypes
 from classes.envelope import Envelope
 
 MAX_VOL = 0.6  # Maximum volume for the program
@@ -7,6 +7,78 @@ MAX_VOL = 0.6  # Maximum volume for the program
 # From my empirical testing, these values seem to work the best (as in, generate the least amount of noise)
 BITRATE = 48000  # Bitrate of the program
 BUFFER_SIZE = 1024  # Buffer size of the program
+# Whether the audio engine tunes its block size while it plays, starting from BUFFER_SIZE, it settles on the smallest
+# block size which renders in time (see classes/block_size_controller.py)
+ADAPTIVE_BUFFER_SIZE = False
+MIN_BUFFER_SIZE = 128  # Smallest block size of the adaptive mode
+MAX_BUFFER_SIZE = 8192  # Largest block size of the adaptive mode
+# Number of blocks measured before the adaptive mode considers a smaller block size
+ADAPTIVE_BUFFER_WINDOW = 128
+# Fraction of the duration of a block every block of a window has to render within for the block size to be halved
+ADAPTIVE_SHRINK_THRESHOLD = 0.25
+# Number of times the sink may run dry within a window of ADAPTIVE_BUFFER_WINDOW blocks before the adaptive mode
+# doubles the block size, a single underrun is more likely caused by the scheduler than by the block size
+ADAPTIVE_UNDERRUN_LIMIT = 3
+# File every change of the adaptive block size is logged to (such as "adaptive_buffer.log"), None to not log them
+ADAPTIVE_BUFFER_LOG = None
+
+# Whether wave presets are rendered from precomputed wavetables instead of evaluating every wave function per sample
+USE_WAVETABLES = True
+WAVETABLE_SIZE = 2048  # Number of samples in a single cycle of a wavetable
+# Maximum number of base cycles a combined wavetable may span, presets needing more use a table per wave instead
+WAVETABLE_MAX_CYCLES = 16
+# The wave types whose discontinuities are smoothed by PolyBLEP corrections to reduce aliasing (leave empty to render
+# every wave naively), these are evaluated in their own wavetable for every band of frequencies
+BAND_LIMITED_WAVES = {WaveTypes.SQUARE, WaveTypes.SAWTOOTH, WaveTypes.TRIANGLE}
+# The number of bands per octave of the band-limited wavetables, more bands band-limit every note more precisely
+WAVETABLE_BANDS_PER_OCTAVE = 4
+# How noise waves are generated: "generator" draws new samples for every block from a seeded random generator,
+# "loop" plays a precomputed buffer of noise in a loop, which is cheaper (see classes/noise.py)
+NOISE_MODE = "generator"
+# The seed every noise wave is derived from, so that renders are reproducible, None for different noise on every run
+NOISE_SEED = 0
+NOISE_LOOP_LENGTH = 262144  # Number of samples of the noise buffers played in a loop (about 5 seconds)
+# The sink the audio engine plays to: "soundcard", "wav", "null" or "simulated" (see classes/audio_sink.py)
+AUDIO_SINK = "soundcard"
+# The WAV file the "wav" sink writes to
+AUDIO_SINK_PATH = "pysynth.wav"
+# How many times faster than real time the clock of the "simulated" sink runs
+SIMULATED_CLOCK_SPEED = 1.0
+# The sample format of the "pcm" sink, "float32" or "int16"
+PCM_FORMAT = "float32"
+# The most blocks the "pcm" sink buffers for a slow consumer before it holds up the audio engine
+PCM_BUFFER_BLOCKS = 16
+# Whether the "pcm" sink streams in real time (as needed by interactive sessions),
+# otherwise it streams as fast as the consumer reads, and only while something is playing
+PCM_REALTIME = True
+# The most blocks the audio engine renders ahead of its sink, rendering ahead absorbs hiccups of the render thread
+# (such as the interface holding the GIL), but every block rendered ahead delays notes played live by another block
+RING_BUFFER_BLOCKS = 4
+# The number of blocks rendered ahead before a real time sink starts playing, and again whenever the sink ran dry,
+# at most RING_BUFFER_BLOCKS (so, the least latency notes played live have, in blocks)
+RING_BUFFER_PREFILL = 2
+# Whether voices sharing a wavetable and an envelope are rendered together as a single (voices x samples) array
+BATCH_VOICES = True
+# Whether song notes are rendered once and played from a cache of rendered notes
+USE_NOTE_CACHE = True
+NOTE_CACHE_SIZE = 64 * 1024 * 1024  # Maximum size of the rendered note cache in bytes
+# Whether preset files are only parsed again when they change, every load of an unchanged file returns the same preset
+USE_PRESET_CACHE = True
+# Number of beats of a lazily loaded song which are parsed and compiled at once while it plays,
+# this happens on the audio engine thread, so it is kept small enough to fit well within a block
+SONG_CHUNK_SIZE = 256
+# Whether songs given on the command line are streamed from their file while they play, instead of loaded up front
+LAZY_SONG_LOADING = False
+# Maximum number of voices playing at once, every voice is preallocated in the voice pool of the audio engine
+POLYPHONY = 64
+# Which voice is stolen when a note is played while every voice is in use: "oldest", "quietest" or "released"
+VOICE_STEALING = "released"
+# Length in seconds of the segments a song is split into when rendering offline, each can be rendered in parallel
+RENDER_SEGMENT_LENGTH = 10
+# Number of most recent blocks the average and maximum render times of the audio engine are computed over
+PERFORMANCE_HISTORY = 256
+# Fraction of the duration of a block beyond which rendering the block counts as late
+LATE_BLOCK_THRESHOLD = 0.75
 
 # The wave preset to use by default
 DEFAULT_WAVE_PRESET = [
@@ -15,3 +87,6 @@ DEFAULT_WAVE_PRESET = [
 
 # The envelope preset to use by default
 DEFAULT_ENVELOPE_PRESET = Envelope(0.1, 0.1, 0.4, 0.25)
+
+# The filter preset to use by default, None to not filter notes
+DEFAULT_FILTER_PRESET = None
@@ -1,7 +1,14 @@
+import os
+import threading
+import numpy as np
 from classes.wave import Wave
 from classes.wave_generator import WaveTypes, WaveGenerator
 from classes.envelope import Envelope
-from classes.song import Song
+from classes.filter import Filter
+from classes.song import Song, EVENT_DTYPE
+from classes.noise import prepare_noise
+from classes.wavetable import precompute_wavetables
+from config import BITRATE, USE_PRESET_CACHE, USE_WAVETABLES
 from util import delocalize_path
 
 # A map of wave types in the .wave.pysynth format spec to their respective WaveTypes
@@ -9,14 +16,117 @@ WAVE_TYPE_MAP = {
     "1": WaveTypes.SINE,
     "2": WaveTypes.SQUARE,
     "3": WaveTypes.SAWTOOTH,
-    "4": WaveTypes.TRIANGLE
+    "4": WaveTypes.TRIANGLE,
+    "5": WaveTypes.WHITE_NOISE,
+    "6": WaveTypes.PINK_NOISE
 }
 
-def load_wave_preset(path: str) -> [Wave]:
+# A map of filter types in the .filter.pysynth format spec to their respective filter types
+FILTER_TYPE_MAP = {
+    "1": "lowpass",
+    "2": "highpass",
+    "3": "bandpass"
+}
+
+# The suffix appended to the path of a .song.pysynth file to get the path of its compiled sidecar
+COMPILED_SONG_SUFFIX = "c"
+# The first bytes of every compiled song file, and the version of the format
+COMPILED_SONG_MAGIC = b"PYSYNTHC"
+COMPILED_SONG_VERSION = 5
+# The flags of a track of a compiled song file marking which of its presets are the defaults,
+# in which case the embedded preset is ignored when loading it
+COMPILED_DEFAULT_WAVE = 1
+COMPILED_DEFAULT_ENVELOPE = 2
+# The header of a track of a compiled song file, followed by the title, the waves, the dependencies,
+# and finally the event table. A compiled song file consists of such a record for every track of the song
+COMPILED_HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("fs", "<u4"),  # The sampling rate the events were compiled at
+    ("bpm", "<u4"),
+    ("title_size", "<u4"),  # The number of bytes of the UTF-8 encoded title
+    ("wave_count", "<u4"),
+    ("track_count", "<u4"),  # The number of tracks of the song, only set in the first record
+    ("dependency_count", "<u4"),  # The number of files the song was compiled from, only set in the first record
+    ("defaults", "<u4"),  # The COMPILED_DEFAULT_* flags of the presets the song uses
+    ("event_count", "<u8"),
+    ("length", "<i8"),  # The length of the song in samples
+    ("envelope", "<f8", (4,)),  # The attack, decay, sustain and release of the envelope preset
+    # The type (its code in FILTER_TYPE_MAP, 0 if there is no filter), cutoff, resonance and envelope amount
+    # of the filter preset
+    ("filter", "<f8", (4,))
+])
+# A single wave of the embedded wave preset, the type is its code in WAVE_TYPE_MAP
+COMPILED_WAVE_DTYPE = np.dtype([("type", "<u4"), ("offset", "<f8"), ("amplitude", "<f8"), ("phase", "<f8")])
+# The modification time (in nanoseconds) and size of a file the song was compiled from, in the order of
+# _get_song_dependencies, the compiled song is only loaded while every one of them is unchanged
+COMPILED_DEPENDENCY_DTYPE = np.dtype([("mtime", "<i8"), ("size", "<i8")])
+
+
+# The presets loaded by the program, keyed by their real path, along with the modification time and size of their file
+_preset_cache = {}
+_preset_cache_lock = threading.Lock()
+
+
+def load_wave_preset(path: str) -> tuple[Wave, ...]:
     """
     Loads a wave preset from the given path
+    As long as the file does not change, every load of it returns the same preset, which must not be modified
     :param path: a file path leading to a valid .wave.pysynth format file
-    :return: A wave preset expressed as a list of Wave objects
+    :return: A wave preset expressed as a tuple of Wave objects
+    """
+    return _load_cached_preset(path, _parse_wave_preset)
+
+
+def load_envelope_preset(path: str) -> Envelope:
+    """
+    Loads an envelope preset from the given path
+    As long as the file does not change, every load of it returns the same Envelope (along with the gain tables
+    it has computed so far), which must not be modified
+    :param path: a file path leading to a valid .envelope.pysynth format file
+    :return: An envelope preset expressed as an Envelope object
+    """
+    return _load_cached_preset(path, _parse_envelope_preset)
+
+
+def load_filter_preset(path: str) -> Filter:
+    """
+    Loads a filter preset from the given path
+    As long as the file does not change, every load of it returns the same Filter (along with the sections
+    it has computed so far), which must not be modified
+    :param path: a file path leading to a valid .filter.pysynth format file
+    :return: A filter preset expressed as a Filter object
+    """
+    return _load_cached_preset(path, _parse_filter_preset)
+
+
+def _load_cached_preset(path: str, parse):
+    """
+    Returns the preset of the given file from the preset cache, parsing it if it is not cached or the file has changed
+    :param path: a file path leading to a preset file
+    :param parse: The function parsing the file into a preset
+    :return: The preset of the file
+    """
+    if not USE_PRESET_CACHE:
+        return parse(path)
+    # A file is considered unchanged as long as its modification time and size are the same
+    status = os.stat(path)
+    key = os.path.realpath(path)
+    with _preset_cache_lock:
+        cached = _preset_cache.get(key)
+    if cached is not None and cached[0] == status.st_mtime_ns and cached[1] == status.st_size:
+        return cached[2]
+    preset = parse(path)
+    with _preset_cache_lock:
+        _preset_cache[key] = (status.st_mtime_ns, status.st_size, preset)
+    return preset
+
+
+def _parse_wave_preset(path: str) -> tuple[Wave, ...]:
+    """
+    Parses a wave preset from the given path
+    :param path: a file path leading to a valid .wave.pysynth format file
+    :return: A wave preset expressed as a tuple of Wave objects
     """
     preset = [] # Instantiate the list
     # Open the file
@@ -43,12 +153,18 @@ def load_wave_preset(path: str) -> [Wave]:
                 phase = float(tokens[3])
                 # Append the wave to the list
                 preset.append(Wave(WAVE_TYPE_MAP[wave_type], offset, amplitude, phase))
-    return preset  # Return the list
+    if USE_WAVETABLES:
+        # Precompute the wavetables now, so that they are not computed when the first note is played
+        precompute_wavetables(preset)
+    # Likewise, prepare the noise waves now
+    prepare_noise(preset)
+    # The preset is shared by everything loading the file, so it is returned as an immutable tuple
+    return tuple(preset)
 
 
-def load_envelope_preset(path: str) -> Envelope:
+def _parse_envelope_preset(path: str) -> Envelope:
     """
-    Loads an envelope preset from the given path
+    Parses an envelope preset from the given path
     :param path: a file path leading to a valid .envelope.pysynth format file
     :return: An envelope preset expressed as an Envelope object
     """
@@ -75,66 +191,351 @@ def load_envelope_preset(path: str) -> Envelope:
                 return Envelope(a, d, s, r)
 
 
+def _parse_filter_preset(path: str) -> Filter:
+    """
+    Parses a filter preset from the given path
+    :param path: a file path leading to a valid .filter.pysynth format file
+    :return: A filter preset expressed as a Filter object
+    """
+    # Open the file
+    with open(path, "r") as file:
+        # Read each line
+        for line in file.readlines():
+            # If the line starts with $, it's a comment - ignore it
+            if line.startswith("$"):
+                continue
+            else:
+                tokens = line.split(" ")
+                if tokens[0] not in FILTER_TYPE_MAP:
+                    # If the filter type cannot be mapped - the file is invalid, raise an exception
+                    raise Exception("Invalid Filter Type")
+                if len(tokens) != 4:
+                    # If the line is not of the correct length, raise an exception
+                    raise Exception("Invalid Filter Format")
+                # Parse the rest into variables
+                cutoff = float(tokens[1])
+                resonance = float(tokens[2])
+                envelope_amount = float(tokens[3])
+                # The file should contain only one filter, thus we can return
+                # immediately after parsing
+                return Filter(FILTER_TYPE_MAP[tokens[0]], cutoff, resonance, envelope_amount)
+    # If the file contains no filter, raise an exception
+    raise Exception("Invalid Filter Format")
+
 
-def load_song(path: str) -> Song:
+
+def load_song(path: str, lazy: bool = False) -> Song:
     """
     Loads a song from the given path
     :param path: a file path leading to a valid .song.pysynth format file
+    :param lazy: Whether to only read the metadata now, the beats are then streamed from the file while the song plays,
+        so playback starts right away and memory stays bounded regardless of the length of the song
     :return: A Song object containing the parsed song
     """
+    compiled_path = path + COMPILED_SONG_SUFFIX
+    if os.path.exists(compiled_path):
+        # If the song was compiled from the current versions of the song file and every file it references,
+        # load the compiled song instead of parsing it (a compiled song is memory mapped, so it is as lazy as a
+        # streamed one)
+        try:
+            song = load_compiled_song(compiled_path, _get_dependency_status(path))
+        except Exception:
+            # If the compiled song is damaged (such as one truncated while it was written), or a file the song
+            # references is missing, parse the song instead, which reports the missing file
+            song = None
+        if song is not None:
+            return song
     # Open the file
     with open(path, "r") as file:
-        # Until we reach the end of the meta section, we are reading metadata
-        reading_meta = True
         # The first line is always the title of the song
         title = file.readline().strip('\n')
         # Assume some default values
         bpm = 100
         waves = None
         envelope = None
-        # Instantiate the list of beats
-        beats = []
-        for line in file.readlines():
+        sound_filter = None
+        tracks = []
+        # Until we reach the end of the meta section, we are reading metadata
+        for line in file:
             # If the line starts with $, it's a comment - ignore it
             if line.startswith("$"):
                 continue
+            # If while reading metadata we find a line consisting of ---, end the metadata section
+            if line[:3] == "---":
+                break
+            # Otherwise, interpret which metadata we are reading
+            tokens = line.split(" ")
+            # Get the directory
+            directory_path = "/".join(path.split("/")[:-1])
+            # Type 1 indicates that the line defines BPM
+            if tokens[0] == "1":
+                bpm = int(tokens[1])
+            # Type 2 indicates that the line defines the wave preset which should be used
+            elif tokens[0] == "2":
+                waves = load_wave_preset(delocalize_path(directory_path, tokens[1].strip('\n')))
+            # Type 3 indicates that the line defines the envelope preset which should be used
+            elif tokens[0] == "3":
+                envelope = load_envelope_preset(delocalize_path(directory_path, tokens[1].strip('\n')))
+            # Type 4 indicates that the line adds another song, with its own presets, as a track of this song
+            elif tokens[0] == "4":
+                tracks.append(load_song(delocalize_path(directory_path, tokens[1].strip('\n'))))
+            # Type 5 indicates that the line defines the filter preset which should be used
+            elif tokens[0] == "5":
+                sound_filter = load_filter_preset(delocalize_path(directory_path, tokens[1].strip('\n')))
             else:
-                if reading_meta:
-                    # If while reading metadata we find a line consisting of ---, end the metadata section
-                    if line[:3] == "---":
-                        reading_meta = False
-                        continue
-                    else:
-                        # Otherwise, interpret which metadata we are reading
-                        tokens = line.split(" ")
-                        # Get the directory
-                        directory_path = "/".join(path.split("/")[:-1])
-                        # Type 1 indicates that the line defines BPM
-                        if tokens[0] == "1":
-                            bpm = int(tokens[1])
-                        # Type 2 indicates that the line defines the wave preset which should be used
-                        elif tokens[0] == "2":
-                            waves = load_wave_preset(delocalize_path(directory_path, tokens[1].strip('\n')))
-                        # Type 3 indicates that the line defines the envelope preset which should be used
-                        elif tokens[0] == "3":
-                            envelope = load_envelope_preset(delocalize_path(directory_path, tokens[1].strip('\n')))
-                        else:
-                            # If the type is not recognized, raise an exception
-                            raise Exception("Invalid Meta Type")
+                # If the type is not recognized, raise an exception
+                raise Exception("Invalid Meta Type")
+        if lazy:
+            # Every playback of the song streams its beats from the file anew
+            return Song(title, [], bpm, waves, envelope, stream=lambda: stream_beats(path), tracks=tracks,
+                        sound_filter=sound_filter)
+        # Otherwise, parse every beat now
+        beats = list(read_beats(file))
+        # Instantiate a song object with the parsed data and return it
+        return Song(title, beats, bpm, waves, envelope, tracks=tracks, sound_filter=sound_filter)
+
+
+def _get_song_dependencies(path: str) -> [str]:
+    """
+    Returns the paths of every file a song is loaded from, without loading any of them
+    :param path: a file path leading to a valid .song.pysynth format file
+    :return: A list of the path of the song, followed by the paths of the presets and tracks it references in the order
+        of its metadata, every track followed by its own dependencies
+    """
+    dependencies = [path]
+    directory_path = "/".join(path.split("/")[:-1])
+    with open(path, "r") as file:
+        # Skip the title, the dependencies are all listed in the metadata
+        file.readline()
+        for line in file:
+            if line.startswith("$"):
+                continue
+            if line[:3] == "---":
+                break
+            tokens = line.split(" ")
+            if tokens[0] in ["2", "3", "5"]:
+                # Wave, envelope and filter presets
+                dependencies.append(delocalize_path(directory_path, tokens[1].strip('\n')))
+            elif tokens[0] == "4":
+                # A track depends on its own presets and tracks as well
+                dependencies.extend(_get_song_dependencies(delocalize_path(directory_path, tokens[1].strip('\n'))))
+    return dependencies
+
+
+def _get_dependency_status(path: str) -> np.ndarray:
+    """
+    Returns the modification time and size of every file a song is loaded from
+    :param path: a file path leading to a valid .song.pysynth format file
+    :return: A ndarray of COMPILED_DEPENDENCY_DTYPE, in the order of _get_song_dependencies
+    """
+    statuses = [os.stat(dependency) for dependency in _get_song_dependencies(path)]
+    return np.array([(status.st_mtime_ns, status.st_size) for status in statuses], dtype=COMPILED_DEPENDENCY_DTYPE)
+
+
+def stream_beats(path: str):
+    """
+    Streams the beats of a song from the given path, without reading the entire file
+    :param path: a file path leading to a valid .song.pysynth format file
+    :return: A generator yielding the beats of the song one by one
+    """
+    with open(path, "r") as file:
+        # Skip the title and the metadata, everything up to the line consisting of ---
+        file.readline()
+        for line in file:
+            if line[:3] == "---" and not line.startswith("$"):
+                break
+        yield from read_beats(file)
+
+
+def read_beats(file):
+    """
+    Parses the beats of a song from an open file, starting after the metadata section
+    :param file: A file object positioned after the --- line of a .song.pysynth format file
+    :return: A generator yielding each beat as a list of [note, duration] lists,
+        with pauses as a single ["0", duration] list
+    """
+    count = 0  # The number of beats read so far, for error messages
+    # Read the file line by line, so that only a single line is held in memory at once
+    for line in file:
+        # If the line starts with $, it's a comment - ignore it
+        if line.startswith("$"):
+            continue
+        # Every line after the metadata is guaranteed to be a beat
+        beat = []
+        tokens = line.split(" ")
+        # If the beat consists of more than one note, parse each note
+        if tokens[0] != "0":
+            if len(tokens) - 1 != int(tokens[0]):
+                # If the number of notes does not match the number of notes specified, raise an exception
+                raise Exception("Invalid Beat Format at beat " + str(count + 1))
+            for note in tokens[1:]:
+                # Parse each note into a tuple of (note, duration)
+                beat.append([note.split(":")[0], float(note.split(":")[1])])
+        else:
+            # If the beat is a pause, parse it into a tuple of ("0", duration)
+            beat.append(["0", float(tokens[1])])
+        count += 1
+        yield beat
+
+
+def write_compiled_song(song: Song, path: str, source_path: str):
+    """
+    Writes a song to the given path in the compiled binary format
+    The file holds a record for every track of the song, each with its own presets and event table,
+    and every track is compiled into its event table if it was not yet
+    :param song: The song to write
+    :param path: The path of the compiled song file to write, usually the path of the song followed by
+        COMPILED_SONG_SUFFIX, so that it is picked up by load_song
+    :param source_path: The path of the .song.pysynth file the song was loaded from, the modification times of it
+        and of every file it references are written, so that the compiled song is not loaded once any of them changes
+    :return: None
+    """
+    tracks = song.get_tracks()
+    dependencies = _get_dependency_status(source_path)
+    # The song may have been loaded from the very file being written, with its events memory mapped from it,
+    # so the file is written next to it and only replaces it once complete (truncating it in place would pull
+    # the events out from under the song while they are written)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as file:
+            for track in tracks:
+                # Only the first record holds the number of tracks and the dependencies
+                if track is song:
+                    _write_compiled_track(file, track, len(tracks), dependencies)
                 else:
-                    # If we are not in the metadata reading mode, then every line is guaranteed to be a beat
-                    beat = []
-                    tokens = line.split(" ")
-                    # If the beat consists of more than one note, parse each note
-                    if tokens[0] != "0":
-                        if len(tokens) - 1 != int(tokens[0]):
-                            # If the number of notes does not match the number of notes specified, raise an exception
-                            raise Exception("Invalid Beat Format at beat " + str(len(beats) + 1))
-                        for note in tokens[1:]:
-                            # Parse each note into a tuple of (note, duration)
-                            beat.append([note.split(":")[0], float(note.split(":")[1])])
-                    else:
-                        # If the beat is a pause, parse it into a tuple of ("0", duration)
-                        beat.append(["0", float(tokens[1])])
-                    beats.append(beat)  # Append the beat to the list of beats
-        return Song(title, beats, bpm, waves, envelope)  # Instantiate a song object with the parsed data and return it
+                    _write_compiled_track(file, track, 0, np.zeros(0, dtype=COMPILED_DEPENDENCY_DTYPE))
+        os.replace(temporary_path, path)
+    except BaseException:
+        # Leave the previous compiled song as it was
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def load_compiled_song(path: str, dependencies: np.ndarray | None = None) -> Song | None:
+    """
+    Loads a song from the given path in the compiled binary format
+    The event tables are memory mapped, so they are not copied, and only the parts which are played are read
+    :param path: A file path leading to a compiled song file
+    :param dependencies: The current modification times and sizes of the files the song is loaded from
+        (see _get_dependency_status), None to load the compiled song regardless of them
+    :return: A Song object of the compiled song, None if the file was compiled by another version of the format,
+        at another sampling rate, or from other versions of the files of the song, in which case the song has to be
+        parsed from its source again
+    """
+    header = np.fromfile(path, dtype=COMPILED_HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != COMPILED_SONG_MAGIC:
+        # If the file is not a compiled song at all, raise an exception
+        raise Exception("Invalid Compiled Song")
+    if header["version"][0] != COMPILED_SONG_VERSION or header["fs"][0] != BITRATE:
+        return None
+    if dependencies is not None:
+        # The dependencies follow the title and the waves of the first record
+        offset = (COMPILED_HEADER_DTYPE.itemsize + int(header["title_size"][0])
+                  + int(header["wave_count"][0]) * COMPILED_WAVE_DTYPE.itemsize)
+        compiled = np.fromfile(path, dtype=COMPILED_DEPENDENCY_DTYPE, count=int(header["dependency_count"][0]),
+                               offset=offset)
+        if not np.array_equal(compiled, dependencies):
+            return None
+    song, offset = _read_compiled_track(path, 0)
+    for _ in range(int(header["track_count"][0]) - 1):
+        # The further tracks follow the song, in the order of Song.get_tracks()
+        track, offset = _read_compiled_track(path, offset)
+        song.add_track(track)
+    return song
+
+
+def _write_compiled_track(file, song: Song, track_count: int, dependencies: np.ndarray):
+    """
+    Writes the record of a single track of a compiled song at the current position of the file
+    :param file: The compiled song file, opened for binary writing
+    :param song: The track to write, its further tracks are not written
+    :param track_count: The number of tracks of the song, written into the header
+    :param dependencies: A ndarray of COMPILED_DEPENDENCY_DTYPE of the files the song was compiled from
+    :return: None
+    """
+    # Every record starts at an aligned offset
+    offset = _align(file.tell())
+    file.write(bytes(offset - file.tell()))
+    events = song.get_events()
+    title = song.title.encode("utf-8")
+    # Every wave type is stored as its code in the .wave.pysynth format
+    codes = {wave_type: int(code) for code, wave_type in WAVE_TYPE_MAP.items()}
+    waves = np.array([(codes[wave.wave_type], wave.offset, wave.amplitude, wave.phase) for wave in song.waves],
+                     dtype=COMPILED_WAVE_DTYPE)
+    envelope = song.env
+    # Every filter type is stored as its code in the .filter.pysynth format, 0 stands for no filter
+    sound_filter = song.filter
+    if sound_filter is None:
+        filter_values = (0, 0.0, 0.0, 0.0)
+    else:
+        filter_codes = {filter_type: int(code) for code, filter_type in FILTER_TYPE_MAP.items()}
+        filter_values = (filter_codes[sound_filter.filter_type], sound_filter.cutoff, sound_filter.resonance,
+                         sound_filter.envelope_amount)
+    # Mark the presets the song does not specify itself, as the embedded presets do not tell
+    defaults = ((COMPILED_DEFAULT_WAVE if song.uses_default_wave_preset() else 0)
+                | (COMPILED_DEFAULT_ENVELOPE if song.uses_default_envelope_preset() else 0))
+    header = np.array([(COMPILED_SONG_MAGIC, COMPILED_SONG_VERSION, BITRATE, song.bpm, len(title), len(waves),
+                        track_count, len(dependencies), defaults, len(events), song.length,
+                        (envelope.a, envelope.d, envelope.s, envelope.r), filter_values)],
+                      dtype=COMPILED_HEADER_DTYPE)
+    file.write(header.tobytes())
+    file.write(title)
+    file.write(waves.tobytes())
+    file.write(dependencies.tobytes())
+    # Pad the file so that the event table starts at an aligned offset
+    file.write(bytes(_align(file.tell()) - file.tell()))
+    file.write(events.astype(EVENT_DTYPE, copy=False).tobytes())
+
+
+def _read_compiled_track(path: str, offset: int) -> (Song, int):
+    """
+    Reads the record of a single track of a compiled song
+    :param path: A file path leading to a compiled song file
+    :param offset: The offset of the record within the file
+    :return: A tuple of the Song of the track, and the offset at which the record ends
+    """
+    with open(path, "rb") as file:
+        file.seek(offset)
+        header = np.frombuffer(file.read(COMPILED_HEADER_DTYPE.itemsize), dtype=COMPILED_HEADER_DTYPE)[0]
+        title = file.read(int(header["title_size"])).decode("utf-8")
+        waves = np.frombuffer(file.read(int(header["wave_count"]) * COMPILED_WAVE_DTYPE.itemsize),
+                              dtype=COMPILED_WAVE_DTYPE)
+        # The dependencies were already checked by load_compiled_song
+        events_offset = _align(file.tell() + int(header["dependency_count"]) * COMPILED_DEPENDENCY_DTYPE.itemsize)
+    preset = tuple(Wave(WAVE_TYPE_MAP[str(wave["type"])], float(wave["offset"]), float(wave["amplitude"]),
+                        float(wave["phase"])) for wave in waves)
+    if USE_WAVETABLES:
+        # Precompute the wavetables now, so that they are not computed when the first note is played
+        precompute_wavetables(preset)
+    # Likewise, prepare the noise waves now
+    prepare_noise(preset)
+    envelope = Envelope(*(float(value) for value in header["envelope"]))
+    filter_code, cutoff, resonance, envelope_amount = (float(value) for value in header["filter"])
+    sound_filter = None
+    if filter_code != 0:
+        sound_filter = Filter(FILTER_TYPE_MAP[str(int(filter_code))], cutoff, resonance, envelope_amount)
+    count = int(header["event_count"])
+    if count > 0:
+        events = np.memmap(path, dtype=EVENT_DTYPE, mode="r", shape=(count,), offset=events_offset)
+    else:
+        # An empty file region cannot be memory mapped
+        events = np.zeros(0, dtype=EVENT_DTYPE)
+    # The default presets are passed as None, so that the song uses (and reports using) the defaults
+    defaults = int(header["defaults"])
+    if defaults & COMPILED_DEFAULT_WAVE:
+        preset = None
+    if defaults & COMPILED_DEFAULT_ENVELOPE:
+        envelope = None
+    song = Song(title, [], int(header["bpm"]), preset, envelope, events=events, length=int(header["length"]),
+                sound_filter=sound_filter)
+    return song, events_offset + count * EVENT_DTYPE.itemsize
+
+
+def _align(offset: int) -> int:
+    """
+    Returns the given offset within a compiled song file, rounded up to the next multiple of 8 bytes
+    :param offset: The offset in bytes
+    :return: The aligned offset in bytes
+    """
+    return -(-offset // 8) * 8
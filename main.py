@@ -3,23 +3,25 @@ import os
 import time
 from types import FrameType
 
-from pynput.keyboard import KeyCode, Listener, Key
+# pynput, rich, wx and soundcard are only imported by the modes which need them, so that printing the help message or
+# rendering a song does not wait for them (and works on machines without a display or a speaker)
+from classes.audio_engine import get_audio_engine, set_audio_sink
+from classes.audio_sink import AUDIO_SINKS, PCM_FORMATS, PcmSink, create_audio_sink
 from classes.sound_generator import SoundGenerator
 from classes.envelope import Envelope
-from classes.wave_generator import WaveGenerator, WaveTypes
+from classes.filter import Filter
+from classes.wave_generator import WaveTypes
 from classes.wave import Wave
 from classes.song import Song
-from config import DEFAULT_ENVELOPE_PRESET, DEFAULT_WAVE_PRESET
+from classes.offline_renderer import OfflineRenderer
+from config import DEFAULT_ENVELOPE_PRESET, DEFAULT_WAVE_PRESET, DEFAULT_FILTER_PRESET, LAZY_SONG_LOADING, \
+    AUDIO_SINK, AUDIO_SINK_PATH, PCM_FORMAT
 from util import frequency_from_note, string_to_hex_color_hash
-from rich.console import Console
-from rich.live import Live
-from rich.layout import Layout
-from rich.panel import Panel
-from rich.table import Table
 from datetime import datetime
 import signal
 import sys
-from file_processing import load_wave_preset, load_envelope_preset, load_song
+from file_processing import load_wave_preset, load_envelope_preset, load_filter_preset, load_song, \
+    write_compiled_song, COMPILED_SONG_SUFFIX
 
 
 def get_path(wildcard):
@@ -46,51 +48,83 @@ def get_path(wildcard):
 
 
 # A map of keys to notes which will be played when the key is pressed in interactive mode
+# Keys are identified by their names (see get_key_name), so that pynput is only imported in interactive mode
 note_keys = {
-    KeyCode(char='a'): "C4",
-    KeyCode(char='w'): "C#4",
-    KeyCode(char='s'): "D4",
-    KeyCode(char='e'): "D#4",
-    KeyCode(char='d'): "E4",
-    KeyCode(char='f'): "F4",
-    KeyCode(char='t'): "F#4",
-    KeyCode(char='g'): "G4",
-    KeyCode(char='y'): "G#4",
-    KeyCode(char='h'): "A4",
-    KeyCode(char='u'): "A#4",
-    KeyCode(char='j'): "B4",
-    KeyCode(char='k'): "C5"
+    "a": "C4",
+    "w": "C#4",
+    "s": "D4",
+    "e": "D#4",
+    "d": "E4",
+    "f": "F4",
+    "t": "F#4",
+    "g": "G4",
+    "y": "G#4",
+    "h": "A4",
+    "u": "A#4",
+    "j": "B4",
+    "k": "C5"
 }
 
-# A map of keys to currently playing sound generators
-currently_playing: dict[KeyCode, SoundGenerator | None] = {}
+# A map of keys to currently playing notes, as returned by the audio engine
+currently_playing: dict[str, tuple[SoundGenerator, int] | None] = {}
 for k, v in note_keys.items():
     currently_playing[k] = None
 
 # The key to exit the program
-exit_key = Key.f12
+exit_key = "f12"
 
 # The current wave preset
 WAVE_PRESET: [Wave] = DEFAULT_WAVE_PRESET
 # Key binding to load a wave preset
-load_wave_key = Key.f1
+load_wave_key = "f1"
 # The current envelope preset
 ENVELOPE_PRESET: Envelope = DEFAULT_ENVELOPE_PRESET
 # Key binding to load an envelope preset
-load_envelope_key = Key.f2
+load_envelope_key = "f2"
+# The current filter preset, None if notes are not filtered
+FILTER_PRESET: Filter | None = DEFAULT_FILTER_PRESET
+# Key binding to load a filter preset
+load_filter_key = "f5"
 
 # The current song
 SONG: Song | None = None
 # Key binding to load a song
-load_song_key = Key.f3
+load_song_key = "f3"
 # Key binding to play a song
-play_song_key = Key.f4
+play_song_key = "f4"
 
 # The current error message
 ERROR = ""
 
-# Listener for the interactive mode
-listener: Listener | None = None
+# Listener for the interactive mode (a pynput.keyboard.Listener)
+listener = None
+# Rich console all output is printed to, created once it is first needed (see get_console)
+console = None
+# Whether the console prints to stderr, as stdout carries the audio stream
+console_stderr = False
+
+
+def get_console():
+    """
+    Returns the rich console all output is printed to, creating it if it was not created yet
+    :return: A rich.console.Console object
+    """
+    global console
+    if console is None:
+        from rich.console import Console
+        console = Console(stderr=console_stderr)
+    return console
+
+
+def get_key_name(key) -> str | None:
+    """
+    Returns the name of a pynput key, which the key bindings are expressed in
+    :param key: A pynput Key or KeyCode
+    :return: The character of the key for character keys, the name of the key otherwise (e.g. "f12"),
+        or None if the key has neither
+    """
+    char = getattr(key, "char", None)
+    return char if char is not None else getattr(key, "name", None)
 
 
 def on_load_wave():
@@ -135,19 +169,40 @@ def on_load_envelope():
         ERROR = "Failed to Read Envelope"
 
 
+def on_load_filter():
+    """
+    Loads a filter preset from a file
+    :return: None
+    """
+    # Declare global variables used in the function
+    global FILTER_PRESET, ERROR
+    ERROR = ""
+    try:
+        path = get_path("*.filter.pysynth")
+        if path is None:
+            # If path is none, no file was selected
+            ERROR = "No Filter File Selected"
+            return
+        # Otherwise load the filter preset
+        FILTER_PRESET = load_filter_preset(path)
+    except Exception as e:
+        # If an exception is raised, set the error message
+        ERROR = "Failed to Read Filter"
+
+
 def on_load_song():
     """
     Loads a song from a file
     :return: None
     """
     # Declare global variables used in the function
-    global SONG, ENVELOPE_PRESET, WAVE_PRESET, ERROR
+    global SONG, ENVELOPE_PRESET, WAVE_PRESET, FILTER_PRESET, ERROR
     ERROR = ""
     try:
         if SONG is not None:
             # If a song is already loaded, stop it
             SONG.stop_playback()
-            # Similarly, kill the thread
+            # Similarly, kill the song
             SONG.kill()
             # Discard the song object as it is no longer valid
             SONG = None
@@ -165,23 +220,28 @@ def on_load_song():
         # If an exception is raised, set the error message
         ERROR = "Failed to Read Song"
         return
-    # Otherwise, start the song thread
-    SONG.start()
 
     # If the envelope preset is the default, set it to the currently loaded envelope preset
-    if SONG.get_envelope_preset() == DEFAULT_ENVELOPE_PRESET:
+    if SONG.uses_default_envelope_preset():
         SONG.set_envelope_preset(ENVELOPE_PRESET)
     else:
         # Otherwise, set the current envelope preset to the preset of the song
         ENVELOPE_PRESET = SONG.get_envelope_preset()
 
     # If the wave preset is the default, set it to the currently loaded wave preset
-    if SONG.get_wave_preset() == DEFAULT_WAVE_PRESET:
+    if SONG.uses_default_wave_preset():
         SONG.set_wave_preset(WAVE_PRESET)
     else:
         # Otherwise, set the current wave preset to the preset of the song
         WAVE_PRESET = SONG.get_wave_preset()
 
+    # If the song has no filter preset, set it to the currently loaded filter preset
+    if SONG.get_filter_preset() is None:
+        SONG.set_filter_preset(FILTER_PRESET)
+    else:
+        # Otherwise, set the current filter preset to the preset of the song
+        FILTER_PRESET = SONG.get_filter_preset()
+
 
 def on_play_song():
     """
@@ -213,34 +273,35 @@ def on_stop_song():
     SONG.stop_playback()
 
 
-def on_press(key: KeyCode):
+def on_press(key):
     """
     The function called when a key is pressed
-    :param key: the KeyCode of the pressed key
+    :param key: the pynput Key or KeyCode of the pressed key
     :return: None
     """
     # Declare global variables used in the function
     global currently_playing, SONG, ERROR
+    key = get_key_name(key)
     if key in note_keys:
         # If the key is a note key, play the note
         ERROR = ""  # Clear the error message as it is likely that the user does not care about the error anymore
         if key not in currently_playing:
             # This shouldn't happen, since the map is initialized with all the note keys
             raise Exception("Impossible State")
-        if currently_playing[key] is not None and currently_playing[key].is_alive():
+        if currently_playing[key] is not None and get_audio_engine().is_playing(currently_playing[key]):
             # If the note bound to the key is already playing, do nothing
             pass
         else:
             # Otherwise, play the note
             if currently_playing[key] is not None:
-                # If the note is not playing, but the sound generator is still alive, tell it to wrap it up
-                currently_playing[key].stop()
+                # If the note is not playing, but its voice is still alive, tell it to wrap it up
+                get_audio_engine().release(currently_playing[key])
                 currently_playing[key] = None
-            # Create a new sound generator, with indefinite length (as it will be killed when the key is released)
-            currently_playing[key] = SoundGenerator(ENVELOPE_PRESET,
-                                                    WaveGenerator(WAVE_PRESET, frequency_from_note(note_keys[key])))
-            # Start the sound generator thread
-            currently_playing[key].start()
+            # Play the note on a voice of the audio engine, with indefinite length
+            # (as it will be released when the key is released)
+            currently_playing[key] = get_audio_engine().play(ENVELOPE_PRESET, WAVE_PRESET,
+                                                             frequency_from_note(note_keys[key]),
+                                                             sound_filter=FILTER_PRESET)
     elif key == exit_key:
         # Exit key is pressed.
         # Stop the listener. This will also stop the program.
@@ -251,6 +312,9 @@ def on_press(key: KeyCode):
     elif key == load_envelope_key:
         # Load envelope key is pressed.
         on_load_envelope()
+    elif key == load_filter_key:
+        # Load filter key is pressed.
+        on_load_filter()
     elif key == load_song_key:
         # Load song key is pressed.
         on_load_song()
@@ -267,22 +331,23 @@ def on_press(key: KeyCode):
             on_stop_song()
 
 
-def on_release(key: KeyCode):
+def on_release(key):
     """
     The function called when a key is released
-    :param key: The KeyCode of the released key
+    :param key: The pynput Key or KeyCode of the released key
     :return: None
     """
     # Declare global variables used in the function
     global currently_playing
-    # Stop the sound generator bound to the key
+    key = get_key_name(key)
+    # Release the note bound to the key
     if key in note_keys:
         if key not in currently_playing:
             # This shouldn't happen, since the map is initialized with all the note keys
             raise Exception("Impossible State")
         if currently_playing[key] is not None:
-            # If the sound generator is still alive, tell it to wrap it up
-            currently_playing[key].stop()
+            # If the note is still alive, tell it to wrap it up
+            get_audio_engine().release(currently_playing[key])
             currently_playing[key] = None
 
 
@@ -298,7 +363,7 @@ def signal_handler(sig: int, frame: FrameType):
     if SONG is not None:
         # If a song is loaded, stop it
         SONG.stop_playback()
-        # Similarly, kill the thread
+        # Similarly, kill the song
         SONG.kill()
     # Exit gracefully
     sys.exit(0)
@@ -309,11 +374,13 @@ class Header:
     A class representing the header of the interface
     """
     @staticmethod
-    def __rich__() -> Panel:
+    def __rich__() -> "Panel":
         """
         Returns the header panel
         :return: A Panel object representing the header
         """
+        from rich.panel import Panel
+        from rich.table import Table
         # Create a grid
         grid = Table.grid(expand=True)
         # Establish a layout of
@@ -338,11 +405,13 @@ class NoteInfo:
     A class representing the note information panel
     """
     @staticmethod
-    def __rich__() -> Panel:
+    def __rich__() -> "Panel":
         """
         Returns the note information panel
         :return: A Panel object representing the note information panel
         """
+        from rich.panel import Panel
+        from rich.table import Table
         # Create a grid
         grid = Table.grid(expand=True)
         # Give it a title and add 2 columns
@@ -357,9 +426,8 @@ class NoteInfo:
         # Iterate through the currently_playing map and add a row for each key
         for key, value in currently_playing.items():
             grid.add_row(
-                # The key is the key code of the note key, so we need to convert it to a string
-                # and process it to display only the character
-                str(key).replace("Key.", "").replace("'", ""),
+                # The key is the name of the note key, so the character
+                key,
                 # Query the note_keys map to determine the pitch of the note
                 note_keys[key],
                 # If the sound generator is alive, the background is black on purple, otherwise it is the default
@@ -375,11 +443,13 @@ class EnvelopeInfo:
     A class representing the envelope information panel
     """
     @staticmethod
-    def __rich__() -> Panel:
+    def __rich__() -> "Panel":
         """
         Returns the envelope information panel
         :return: A Panel object representing the envelope information panel
         """
+        from rich.panel import Panel
+        from rich.table import Table
         # Create a grid
         grid = Table.grid(expand=True)
         # Give it a title and add 2 columns
@@ -408,6 +478,25 @@ class EnvelopeInfo:
             "[i]Release",
             str(ENVELOPE_PRESET.r) + "s"
         )
+        # Add a row for the filter the envelope is applied after, and for its settings if there is one
+        grid.add_row()
+        grid.add_row(
+            "[b]Filter",
+            "[b]" + ("None" if FILTER_PRESET is None else FILTER_PRESET.filter_type.capitalize())
+        )
+        if FILTER_PRESET is not None:
+            grid.add_row(
+                "[i]Cutoff",
+                str(FILTER_PRESET.cutoff) + "Hz"
+            )
+            grid.add_row(
+                "[i]Resonance",
+                str(FILTER_PRESET.resonance)
+            )
+            grid.add_row(
+                "[i]Envelope",
+                str(FILTER_PRESET.envelope_amount) + " oct"
+            )
         # Return the panel
         return Panel(grid)
 
@@ -417,11 +506,13 @@ class WaveInfo:
     A class representing the wave information panel
     """
     @staticmethod
-    def __rich__() -> Panel:
+    def __rich__() -> "Panel":
         """
         Returns the wave information panel
         :return: A Panel object representing the wave information panel
         """
+        from rich.panel import Panel
+        from rich.table import Table
         # Create a grid
         grid = Table.grid(expand=True)
         # Give it a title and add 4 columns
@@ -457,11 +548,13 @@ class ControlsInfo:
     A class representing the controls information panel
     """
     @staticmethod
-    def __rich__() -> Panel:
+    def __rich__() -> "Panel":
         """
         Returns the controls information panel
         :return: A panel object representing the controls information panel
         """
+        from rich.panel import Panel
+        from rich.table import Table
         # Create a grid
         grid = Table.grid(expand=True)
         # Give it a title and add 2 columns
@@ -490,6 +583,10 @@ class ControlsInfo:
             "[u]F4",
             "Play Song" if SONG is None or not SONG.is_playing() else "Stop Song"
         )
+        grid.add_row(
+            "[u]F5",
+            "Load Filter Preset"
+        )
         # Add a blank row to separate the exit key a bit
         grid.add_row()
         grid.add_row(
@@ -505,11 +602,13 @@ class SongInfo:
     A class representing the song information panel
     """
     @staticmethod
-    def __rich__() -> Panel:
+    def __rich__() -> "Panel":
         """
         Returns the song information panel
         :return: A Panel object representing the song information panel
         """
+        from rich.panel import Panel
+        from rich.table import Table
         # Create a grid
         grid = Table.grid(expand=True)
         # Give it a title and add 2 columns
@@ -534,15 +633,79 @@ class SongInfo:
                 # The BPM is an integer, so we can just convert it to a string
                 str(SONG.bpm)
             )
+            grid.add_row(
+                "[b]Tracks",
+                str(len(SONG.get_tracks()))
+            )
+        # Return the panel
+        return Panel(grid)
+
+
+class PerformanceInfo:
+    """
+    A class representing the audio engine performance panel
+    """
+    @staticmethod
+    def __rich__() -> "Panel":
+        """
+        Returns the audio engine performance panel
+        :return: A Panel object representing the audio engine performance panel
+        """
+        from rich.panel import Panel
+        from rich.table import Table
+        statistics = get_audio_engine().get_performance()
+        # Create a grid
+        grid = Table.grid(expand=True)
+        # Give it a title and add 2 columns
+        grid.title = "Performance"
+        grid.add_column()
+        grid.add_column()
+        # Add a row for each statistic, times are displayed in milliseconds
+        grid.add_row(
+            "[b]Block",
+            f"{statistics['average_render_time'] * 1000:.2f}ms avg, {statistics['max_render_time'] * 1000:.2f}ms max"
+        )
+        grid.add_row(
+            "[b]Deadline",
+            f"{statistics['deadline'] * 1000:.2f}ms ({statistics['block_size']} samples)"
+        )
+        # The headroom turns red once the worst recent block came close to missing its deadline
+        color = "green" if statistics["headroom"] > 0.5 else "yellow" if statistics["headroom"] > 0.25 else "red"
+        grid.add_row(
+            "[b]Headroom",
+            f"[{color}]{statistics['headroom'] * 100:.0f}%"
+        )
+        grid.add_row(
+            "[b]Voices",
+            f"{statistics['voices']} ({statistics['max_voices']} max)"
+        )
+        grid.add_row(
+            "[b]Late/Underruns",
+            f"{statistics['late_blocks']}/{statistics['underruns']}"
+        )
+        grid.add_row(
+            "[b]Buffer",
+            f"{statistics['buffered_blocks']}/{statistics['buffer_capacity']} blocks "
+            f"({statistics['buffered_blocks'] * statistics['deadline'] * 1000:.0f}ms), "
+            f"ran dry {statistics['buffer_underruns']}x"
+        )
+        # Add a bar for each bucket of the render time histogram, scaled to the fullest bucket
+        fullest = max(max(count for _, count in statistics["histogram"]), 1)
+        for edge, count in statistics["histogram"]:
+            grid.add_row(
+                f"[i]<{edge * 100:.0f}%" if edge != float("inf") else "[i]>200%",
+                "#" * round(count / fullest * 20) + f" {count}"
+            )
         # Return the panel
         return Panel(grid)
 
 
-def generate_interface() -> Layout:
+def generate_interface() -> "Layout":
     """
     Generates the interface layout
     :return: A Layout object representing the interface layout
     """
+    from rich.layout import Layout
     # Initialize the layout
     layout = Layout()
     # Split off the header at the top
@@ -565,9 +728,10 @@ def generate_interface() -> Layout:
         Layout(name="wave"),
         Layout(name="controls", size=40),
     )
-    # Split the top row into 2 columns, one for envelope info and the other for song info
+    # Split the top row into 3 columns, for envelope info, engine performance and song info
     layout["abov"].split_row(
         Layout(name="envelope"),
+        Layout(name="performance"),
         Layout(name="song"),
     )
     # Return the layout
@@ -581,6 +745,9 @@ def interactive_mode():
     """
     # Define global variables
     global listener
+    # Only the interactive mode needs keyboard input and a live interface
+    from pynput.keyboard import Listener
+    from rich.live import Live
     # Bind the signal handler to SIGINT
     signal.signal(signal.SIGINT, signal_handler)
     # Disable input echo in the terminal
@@ -595,11 +762,12 @@ def interactive_mode():
     interface["controls"].update(ControlsInfo())
     interface["wave"].update(WaveInfo())
     interface["song"].update(SongInfo())
+    interface["performance"].update(PerformanceInfo())
 
     # Listen for key presses with the listener
     with Listener(on_press=on_press, on_release=on_release) as listener_local:
         # Update the interface with the Live object from rich
-        with Live(interface, screen=True, refresh_per_second=4) as live:
+        with Live(interface, console=get_console(), screen=True, refresh_per_second=4) as live:
             # Update the interface until the listener stops
             live.update(interface)
             # Set the global listener to the local listener
@@ -608,31 +776,41 @@ def interactive_mode():
 
     # Upon exit, restore input echo in the terminal
     os.system("stty echo")
+    # Stop the audio engine, which closes its sink
+    get_audio_engine().kill()
+    get_audio_engine().join()
 
 
 # Read the arguments
 arguments = sys.argv
-# Create a rich console object
-console = Console()
 
 
 def print_help():
     """
-    Prints the help message
+    Prints the help message, without rich, so that printing it does not wait for rich to be imported
     :return: None
     """
-    console.print(f"Usage: {arguments[0]} [arguments]")
-    console.print()
-    console.print("Mode Arguments:")
-    console.print("  -i, --interactive: Starts the interactive mode (requires tty)")
-    console.print("  -h, --help: Prints this help message")
-    console.print()
-    console.print("File Arguments:")
-    console.print("  -w, --wave: Path to a wave preset file")
-    console.print("  -e, --envelope: Path to an envelope preset file")
-    console.print("  -s, --song: Path to a song file")
-    console.print()
-    console.print("Note: The file arguments are ignored if ran in interactive mode")
+    print(f"Usage: {arguments[0]} [arguments]")
+    print()
+    print("Mode Arguments:")
+    print("  -i, --interactive: Starts the interactive mode (requires tty)")
+    print("  -h, --help: Prints this help message")
+    print()
+    print("File Arguments:")
+    print("  -w, --wave: Path to a wave preset file")
+    print("  -e, --envelope: Path to an envelope preset file")
+    print("  -F, --filter: Path to a filter preset file, used for the song unless it has a filter preset of its own")
+    print("  -s, --song: Path to a song file, further songs are played along with it as its tracks")
+    print("  -l, --lazy: Streams the song from its file while it plays, instead of loading it up front")
+    print("  -c, --compile: Compiles the song into a binary file next to it, which is loaded by later runs")
+    print("  -r, --render: Path to a WAV file, the song is rendered to it instead of being played")
+    print("  -j, --jobs: Number of processes to render the song with (default 1)")
+    print(f"  -o, --output: Audio sink to play to, one of {', '.join(AUDIO_SINKS)} (default {AUDIO_SINK})")
+    print(f"  -f, --file: Path of the WAV file the wav sink writes to (default {AUDIO_SINK_PATH})")
+    print("  -p, --pcm: Streams raw PCM samples to a path (such as a named pipe), or to stdout if the path is -")
+    print(f"  --pcm-format: Sample format of the PCM stream, one of {', '.join(PCM_FORMATS)} (default {PCM_FORMAT})")
+    print()
+    print("Note: The file arguments other than -o and -f are ignored if ran in interactive mode")
 
 
 if len(arguments) == 1:
@@ -640,13 +818,50 @@ if len(arguments) == 1:
     print_help()
 else:
     interactive = False
+    # Path of the WAV file to render the song to, if any
+    render_path = None
+    # Number of processes to render the song with
+    jobs = 1
+    # Path of the song file, and whether the song should be compiled into a binary file next to it
+    song_path = None
+    compile_song = False
+    # The further songs given on the command line, played as tracks of the first song, they are only added to it
+    # after compiling, as they are not part of its file
+    further_tracks = []
+    # Whether the song is streamed from its file while it plays, this has to be known before the song is loaded
+    lazy = LAZY_SONG_LOADING or any(argument in ["-l", "--lazy"] for argument in arguments)
+    # The audio sink has to be known before the audio engine is first used, which may happen in any mode
+    sink_name = AUDIO_SINK
+    sink_path = AUDIO_SINK_PATH
+    pcm_format = PCM_FORMAT
+    for i in range(len(arguments) - 1):
+        if arguments[i] in ["-o", "--output"]:
+            sink_name = arguments[i + 1]
+        elif arguments[i] in ["-f", "--file"]:
+            sink_path = arguments[i + 1]
+        elif arguments[i] in ["-p", "--pcm"]:
+            sink_name = "pcm"
+            sink_path = arguments[i + 1]
+        elif arguments[i] == "--pcm-format":
+            pcm_format = arguments[i + 1]
+    # Streaming to stdout leaves only stderr for the output of the program
+    console_stderr = sink_name == "pcm" and sink_path == "-"
+    try:
+        if sink_name == "pcm":
+            set_audio_sink(PcmSink(sink_path, pcm_format))
+        else:
+            set_audio_sink(create_audio_sink(sink_name, sink_path))
+    except Exception as e:
+        get_console().print("Failed to create audio sink")
+        get_console().print(e)
+        sys.exit(1)
     for i in range(len(arguments)):
         # Iterate through the arguments
         if arguments[i] in ["-i", "--interactive"]:
             # If the argument is -i or --interactive, start the interactive mode
             # Check if the program is running in a tty
             if not sys.stdin.isatty():
-                console.print("Interactive mode requires a tty")
+                get_console().print("Interactive mode requires a tty")
                 break
             # Check if the environment supports wxPython
             try:
@@ -654,7 +869,7 @@ else:
                 # support wxPython
                 import wx
             except ImportError:
-                console.print("Interactive mode requires wxPython")
+                get_console().print("Interactive mode requires wxPython")
                 break
             interactive = True
             interactive_mode()
@@ -668,33 +883,88 @@ else:
             try:
                 WAVE_PRESET = load_wave_preset(arguments[i + 1])
             except Exception as e:
-                console.print("Failed to load wave preset")
-                console.print(e)
+                get_console().print("Failed to load wave preset")
+                get_console().print(e)
                 break
         elif arguments[i] in ["-e", "--envelope"]:
             # If the argument is -e or --envelope, load the envelope preset
             try:
                 ENVELOPE_PRESET = load_envelope_preset(arguments[i + 1])
             except Exception as e:
-                console.print("Failed to load envelope preset")
-                console.print(e)
+                get_console().print("Failed to load envelope preset")
+                get_console().print(e)
+                break
+        elif arguments[i] in ["-F", "--filter"]:
+            # If the argument is -F or --filter, load the filter preset
+            try:
+                FILTER_PRESET = load_filter_preset(arguments[i + 1])
+            except Exception as e:
+                get_console().print("Failed to load filter preset")
+                get_console().print(e)
                 break
         elif arguments[i] in ["-s", "--song"]:
             # If the argument is -s or --song, load the song
             try:
-                SONG = load_song(arguments[i + 1])
-                SONG.start()
+                if SONG is None:
+                    SONG = load_song(arguments[i + 1], lazy)
+                    song_path = arguments[i + 1]
+                else:
+                    # Every further song is played along with the first one, as another track of it
+                    further_tracks.append(load_song(arguments[i + 1], lazy))
             except Exception as e:
-                console.print("Failed to load song")
-                console.print(e)
+                get_console().print("Failed to load song")
+                get_console().print(e)
+                break
+        elif arguments[i] in ["-c", "--compile"]:
+            # If the argument is -c or --compile, remember to compile the song
+            compile_song = True
+        elif arguments[i] in ["-r", "--render"]:
+            # If the argument is -r or --render, remember where the song should be rendered to
+            render_path = arguments[i + 1]
+        elif arguments[i] in ["-j", "--jobs"]:
+            # If the argument is -j or --jobs, read the number of processes to render with
+            try:
+                jobs = max(int(arguments[i + 1]), 1)
+            except Exception as e:
+                get_console().print("Invalid number of jobs")
+                get_console().print(e)
                 break
     if not interactive:
+        if SONG is not None and compile_song:
+            # If the song should be compiled, write it next to the song file, so that later runs load it instead
+            write_compiled_song(SONG, song_path + COMPILED_SONG_SUFFIX, song_path)
+            get_console().print(f"Compiled {song_path} to {song_path + COMPILED_SONG_SUFFIX}")
         if SONG is not None:
+            for track in further_tracks:
+                SONG.add_track(track)
+        if SONG is not None and SONG.get_filter_preset() is None:
+            # If the song has no filter preset of its own, it is played with the one given on the command line
+            # (only after compiling, so that the compiled song matches its file)
+            SONG.set_filter_preset(FILTER_PRESET)
+        if SONG is not None and render_path is not None:
+            # If a song is loaded and a render path is given, render the song offline
+            color = string_to_hex_color_hash(SONG.title)
+            get_console().print(f"[bold {color}]\[{SONG.title}][/] Rendering to {render_path}...")
+            renderer = OfflineRenderer(SONG)
+            # Measure how long the render takes, to compare it to the length of the song
+            start_time = time.perf_counter()
+            samples = renderer.render(jobs)
+            render_time = time.perf_counter() - start_time
+            renderer.write_wav(render_path, samples)
+            song_length = len(samples) / renderer.fs
+            get_console().print(f"[bold {color}]\[{SONG.title}][/] Rendered {song_length:.2f}s of audio in "
+                          f"{render_time:.2f}s ({song_length / max(render_time, 1e-9):.1f}x realtime)")
+            # The notes may have been cached by the worker processes, so the statistics are taken from the renderer
+            requests = renderer.cache_hits + renderer.cache_misses
+            hit_rate = renderer.cache_hits / requests if requests > 0 else 0.0
+            get_console().print(f"[bold {color}]\[{SONG.title}][/] Note cache: {renderer.cache_hits} hits, "
+                          f"{renderer.cache_misses} misses ({hit_rate:.0%} hit rate)")
+        elif SONG is not None:
             # If a song is loaded, play it
             # Generate a color from the song title
             color = string_to_hex_color_hash(SONG.title)
             # Print a message that playback has begun
-            console.print(f"[bold {color}]\[{SONG.title}][/] Beginning playback...")
+            get_console().print(f"[bold {color}]\[{SONG.title}][/] Beginning playback...")
             SONG.start_playback()
             while SONG.is_playing():
                 # Wait until the song is finished playing
@@ -702,13 +972,19 @@ else:
                     time.sleep(0.1)
                 except KeyboardInterrupt:
                     # If the user presses CTRL+C, stop the song
-                    console.print(f"[bold {color}]\[{SONG.title}][/] Interrupting song!")
+                    get_console().print(f"[bold {color}]\[{SONG.title}][/] Interrupting song!")
                     SONG.stop_playback()
                     break
-            # Kill the song thread
+            # Kill the song
             SONG.kill()
+            # Let the release tails of the last notes ring out before exiting
+            while not get_audio_engine().is_idle():
+                time.sleep(0.1)
+            # Stop the audio engine, which closes its sink once the last block was written
+            get_audio_engine().kill()
+            get_audio_engine().join()
             # After the playback has finished, print a message that playback has finished
-            console.print(f"[bold {color}]\[{SONG.title}][/] Finished playback!")
+            get_console().print(f"[bold {color}]\[{SONG.title}][/] Finished playback!")
         else:
             # Otherwise, print the help message
             print_help()